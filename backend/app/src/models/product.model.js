@@ -9,6 +9,9 @@ const productSchema = new mongoose.Schema({
   discount: { type: Number, default: 0 },         
   category: { type: String, required: true },
   sub_category: { type: String, required: true },
+  // Canonical taxonomy IDs stamped by the scrapers (scrapers/Taxonomy.py)
+  category_id: { type: String, index: true },
+  sub_category_id: { type: String, index: true },
   stock_status: { type: String, required: true },
   LastUpdate: { type: Date, default: Date.now }
 });
@@ -0,0 +1,183 @@
+import json
+import math
+import os
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+from CrawlMetrics import get_logger
+from HttpCache import DEFAULT_CACHE_DIR
+
+# JSON listing APIs of client-rendered shops.
+# While a listing page renders in the browser, the JSON responses it loads
+# are kept. The one whose items are the products shown on the page is the
+# listing endpoint: its URL tells which query parameter selects the page and
+# its body how many pages there are, so every page can then be requested
+# directly over HTTP, concurrently, without rendering anything.
+# An endpoint is only accepted when the products the spec builds from its
+# items have the same URLs, prices and discounts as the rendered cards:
+# the item keys of a spec are guesses until checked against the page, and a
+# wrong one would otherwise go unnoticed on every later HTTP-only run.
+# Failing that, the listing keeps being paginated in the browser.
+# Learned endpoints are stored per listing URL, with the fingerprint of the
+# spec that verified them, so later runs skip the browser entirely until an
+# endpoint stops answering as expected or the spec changes.
+# Set SCRAPER_API_CAPTURE=0 to always paginate in the browser.
+USE_API_CAPTURE = os.environ.get("SCRAPER_API_CAPTURE", "1") != "0"
+API_CACHE_DIR = DEFAULT_CACHE_DIR.parent / "api"
+
+PAGE_PARAMS = ("page", "p", "pageNumber", "page_number", "currentPage")
+LAST_PAGE_KEYS = ("last_page", "lastPage", "totalPages", "total_pages", "pageCount", "page_count")
+TOTAL_KEYS = ("total", "totalCount", "total_count", "totalItems")
+PER_PAGE_KEYS = ("per_page", "perPage", "pageSize", "page_size", "limit")
+# Share of the rendered products that must be found in a response's items
+MIN_NAME_OVERLAP = 0.5
+# Fields of the products found by name that must match the rendered cards
+VERIFIED_FIELDS = ("product_url", "product_price", "discount")
+
+logger = get_logger("api")
+
+
+# Every list of objects in a JSON payload with the path leading to it
+def iter_item_lists(payload, path=()):
+    if isinstance(payload, list):
+        if payload and all(isinstance(item, dict) for item in payload):
+            yield path, payload
+        return
+    if isinstance(payload, dict):
+        for key, value in payload.items():
+            yield from iter_item_lists(value, path + (key,))
+
+
+def get_path(payload, path):
+    for part in path:
+        payload = payload[part]
+    return payload
+
+
+# First integer found under one of the keys, at the top level or one level
+# down (pagination blocks such as "meta" or "pagination")
+def find_int(payload, keys):
+    if not isinstance(payload, dict):
+        return None
+    scopes = [payload] + [value for value in payload.values() if isinstance(value, dict)]
+    for scope in scopes:
+        for key in keys:
+            value = scope.get(key)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return int(value)
+            if isinstance(value, str) and value.isdigit():
+                return int(value)
+    return None
+
+
+class ApiEndpoint:
+    def __init__(self, url, page_param, items_path):
+        self.url = url
+        self.page_param = page_param
+        self.items_path = list(items_path)
+
+    def page_url(self, page_num):
+        parts = urlparse(self.url)
+        query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != self.page_param]
+        query.append((self.page_param, str(page_num)))
+        return urlunparse(parts._replace(query=urlencode(query)))
+
+    def items(self, payload):
+        items = get_path(payload, self.items_path)
+        if not isinstance(items, list):
+            raise ValueError(f"No item list at {'.'.join(self.items_path)}")
+        return items
+
+    # Number of pages announced by a listing response, or None if unknown
+    def last_page(self, payload):
+        last_page = find_int(payload, LAST_PAGE_KEYS)
+        if last_page is not None:
+            return last_page
+        total = find_int(payload, TOTAL_KEYS)
+        per_page = find_int(payload, PER_PAGE_KEYS) or len(self.items(payload))
+        if total is not None and per_page:
+            return max(1, math.ceil(total / per_page))
+        return None
+
+    def to_dict(self):
+        return {"url": self.url, "page_param": self.page_param, "items_path": self.items_path}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["url"], data["page_param"], data["items_path"])
+
+
+# Name and verified fields of a product, as compared by learn_endpoint
+def product_signature(product):
+    return product.product_name, {field: getattr(product, field) for field in VERIFIED_FIELDS}
+
+
+# Find the listing endpoint among captured (url, payload) responses.
+# expected holds the product_signature() of the products rendered on the
+# page; item_product(item) builds the same from an API item as the spec
+# would. A list of items qualifies when it holds enough of the page's
+# products by name and every one of them gets the same verified fields.
+# Returns (endpoint, payload) or None when no response qualifies.
+def learn_endpoint(responses, expected, item_product):
+    expected = {name: fields for name, fields in expected if name and name != "N/A"}
+    if not expected:
+        return None
+    best = None
+    for url, payload in responses:
+        for items_path, items in iter_item_lists(payload):
+            built = dict(item_product(item) for item in items)
+            matched = [name for name in expected if name in built]
+            overlap = len(matched) / len(expected)
+            if overlap < MIN_NAME_OVERLAP:
+                continue
+            mismatch = next((
+                (name, field) for name in matched for field, value in expected[name].items()
+                if built[name].get(field) != value
+            ), None)
+            if mismatch is not None:
+                name, field = mismatch
+                logger.warning(f"Items at {'.'.join(items_path) or '<root>'} of {url} do not give the page's {field} "
+                               f"for {name} ({built[name].get(field)} instead of {expected[name][field]}), not using them")
+                continue
+            if best is None or overlap > best[0]:
+                best = (overlap, url, items_path, payload)
+    if best is None:
+        return None
+    _, url, items_path, payload = best
+    query = dict(parse_qsl(urlparse(url).query))
+    # Page 1 is often requested without a page parameter: assume the usual
+    # name, the crawl checks that page 2 really differs from page 1
+    page_param = next((param for param in PAGE_PARAMS if param in query), PAGE_PARAMS[0])
+    return ApiEndpoint(url, page_param, items_path), payload
+
+
+# Learned endpoints of one competitor, keyed by listing URL. Endpoints
+# verified with another version of the spec are ignored.
+class ApiEndpointStore:
+    def __init__(self, competitor, spec_fingerprint="", cache_dir=API_CACHE_DIR):
+        self.spec_fingerprint = spec_fingerprint
+        self.path = Path(cache_dir) / f"{competitor}.json"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.endpoints = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.endpoints = {}
+
+    def get(self, listing_url):
+        data = self.endpoints.get(listing_url)
+        if not data or data.get("spec") != self.spec_fingerprint:
+            return None
+        return ApiEndpoint.from_dict(data)
+
+    def remember(self, listing_url, endpoint):
+        self.endpoints[listing_url] = {**endpoint.to_dict(), "spec": self.spec_fingerprint}
+
+    def forget(self, listing_url):
+        self.endpoints.pop(listing_url, None)
+
+    def save(self):
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.endpoints, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
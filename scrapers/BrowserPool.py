@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+from CrawlMetrics import get_logger
+from HttpCache import DEFAULT_CACHE_DIR
+from HttpClient import replay_url
+
+try:
+    from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+except ImportError:  # Playwright is only needed for pages rendered client-side
+    async_playwright = None
+    PlaywrightTimeoutError = None
+
+# Browser fallback for the fetch engine.
+# Listing pages are fetched with plain HTTP first. When the static HTML has
+# no product card, the page may be rendered client-side, so it is loaded
+# again in a shared headless browser. The browser is only launched the first
+# time a page needs it and then kept warm, with a fixed number of pages
+# reused for every render. Which way a host/path worked is remembered in
+# .cache/fetch_modes.json so later runs go straight to it. A listing that
+# has no product in the browser either is remembered as empty for
+# SCRAPER_EMPTY_LISTING_DAYS, during which it is not rendered again.
+# Set SCRAPER_BROWSER_FALLBACK=0 to never use the browser.
+USE_BROWSER_FALLBACK = os.environ.get("SCRAPER_BROWSER_FALLBACK", "1") != "0"
+DEFAULT_BROWSER_POOL_SIZE = int(os.environ.get("SCRAPER_BROWSER_POOL", "2"))
+FETCH_MODES_PATH = DEFAULT_CACHE_DIR.parent / "fetch_modes.json"
+RENDER_TIMEOUT_MS = 30000
+EMPTY_LISTING_SECONDS = float(os.environ.get("SCRAPER_EMPTY_LISTING_DAYS", "7")) * 86400
+
+HTTP = "http"
+BROWSER = "browser"
+EMPTY = "empty"
+
+# Only the DOM is read, so these are never downloaded
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+
+logger = get_logger("browser")
+
+
+async def block_assets(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+# Listing pages usually paginate with a query parameter, so a decision made
+# on page 1 applies to every page of the listing
+def mode_key(url):
+    parts = urlparse(url)
+    return f"{parts.netloc}{parts.path}"
+
+
+class FetchModeStore:
+    def __init__(self, path=FETCH_MODES_PATH):
+        self.path = Path(path)
+        self.modes = self._read()
+        self.changes = {}
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    # Modes are stored as their name; one that expires, as the name and the
+    # time it stops applying
+    def get(self, url):
+        mode = self.modes.get(mode_key(url))
+        if isinstance(mode, dict):
+            return mode["mode"] if mode["expires"] > time.time() else None
+        return mode
+
+    def set(self, url, mode, ttl=None):
+        key = mode_key(url)
+        value = {"mode": mode, "expires": time.time() + ttl} if ttl is not None else mode
+        if self.modes.get(key) != value:
+            self.modes[key] = self.changes[key] = value
+
+    # Scrapers running in parallel share the file: merge our changes into
+    # what is on disk now instead of overwriting it
+    def save(self):
+        if not self.changes:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        modes = self._read()
+        modes.update(self.changes)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(modes, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.changes = {}
+
+
+class BrowserPool:
+    def __init__(self, size=None, timeout_ms=RENDER_TIMEOUT_MS):
+        self.size = size or DEFAULT_BROWSER_POOL_SIZE
+        self.timeout_ms = timeout_ms
+        self._playwright = None
+        self._browser = None
+        self._pages = None
+        self._lock = asyncio.Lock()
+        self._start_error = None
+
+    async def _start(self):
+        logger.info(f"Starting headless browser pool ({self.size} pages)")
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        self._pages = asyncio.Queue()
+        for _ in range(self.size):
+            context = await self._browser.new_context(viewport={"width": 1280, "height": 800})
+            await context.route("**/*", block_assets)
+            page = await context.new_page()
+            page.set_default_timeout(self.timeout_ms)
+            self._pages.put_nowait(page)
+
+    # Rendered HTML of a page, once wait_selector shows up (or times out)
+    async def render(self, url, wait_selector=None):
+        async with self._lock:
+            # A browser that failed to launch is not retried for every page
+            if self._start_error is not None:
+                raise self._start_error
+            if self._browser is None:
+                try:
+                    await self._start()
+                except Exception as e:
+                    self._start_error = e
+                    await self.close()
+                    raise
+        page = await self._pages.get()
+        try:
+            await page.goto(replay_url(url), wait_until="domcontentloaded")
+            if wait_selector:
+                try:
+                    await page.wait_for_selector(wait_selector)
+                except PlaywrightTimeoutError:
+                    pass
+            return await page.content()
+        finally:
+            self._pages.put_nowait(page)
+
+    async def close(self):
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+def create_browser_pool(use_browser=None):
+    use_browser = USE_BROWSER_FALLBACK if use_browser is None else use_browser
+    if not use_browser or async_playwright is None:
+        return None
+    return BrowserPool()
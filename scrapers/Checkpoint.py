@@ -0,0 +1,110 @@
+import json
+import os
+from pathlib import Path
+
+from CrawlMetrics import get_logger
+
+# Resumable crawl checkpoints.
+# Every finished (category, subcategory, url, page) unit is appended to
+# output/checkpoints/<Competitor>.jsonl together with the output file it was
+# written to and the byte offset the output reached after it. A restarted
+# scraper reads the log back, truncates its partial output to the last
+# checkpointed offset (dropping products of a page that was being written
+# when it died), skips finished units and continues from the first page that
+# was not done. The log is removed once a run completes.
+# Set SCRAPER_RESUME=0 to ignore an existing checkpoint and start over.
+CHECKPOINT_DIR = Path(__file__).parent / "output" / "checkpoints"
+RESUME = os.environ.get("SCRAPER_RESUME", "1") != "0"
+
+logger = get_logger("checkpoint")
+
+
+def unit_key(category_name, subcategory_name, url):
+    return f"{category_name}\x1f{subcategory_name}\x1f{url}"
+
+
+class CheckpointStore:
+    def __init__(self, competitor, checkpoint_dir=CHECKPOINT_DIR, resume=None):
+        self.competitor = competitor
+        self.path = Path(checkpoint_dir) / f"{competitor}.jsonl"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        resume = RESUME if resume is None else resume
+        # unit key -> (last finished page, whether more pages follow)
+        self.units = {}
+        self.output = None
+        self.offset = 0
+        self.products = 0
+        if resume:
+            self._load()
+        else:
+            self.path.unlink(missing_ok=True)
+        self._file = None
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn last line from a crash mid-write
+                continue
+            key = unit_key(entry["category"], entry["subcategory"], entry["url"])
+            self.units[key] = (entry["page"], entry["has_next"])
+            self.output = entry["output"]
+            self.offset = entry["offset"]
+            self.products = entry["total_products"]
+
+    # Offset and product count to resume the given output file from, or None
+    # when there is nothing to resume into it
+    def resume_point(self, output_part_path):
+        if not self.units or self.output != str(output_part_path) or not Path(output_part_path).exists():
+            self.units = {}
+            self.path.unlink(missing_ok=True)
+            return None
+        logger.info(f"Resuming {self.competitor} from checkpoint: {len(self.units)} units started, "
+              f"{self.products} products already saved")
+        return self.offset, self.products
+
+    # First page still to crawl for a unit, or None when it is complete
+    def next_page(self, category_name, subcategory_name, url):
+        state = self.units.get(unit_key(category_name, subcategory_name, url))
+        if state is None:
+            return 1
+        page, has_next = state
+        return page + 1 if has_next else None
+
+    # Record a finished page. Must be called right after its products were
+    # written so the stored offset covers them.
+    def record(self, category_name, subcategory_name, url, page, has_next, products, sink):
+        self.units[unit_key(category_name, subcategory_name, url)] = (page, has_next)
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        entry = {
+            "category": category_name,
+            "subcategory": subcategory_name,
+            "url": url,
+            "page": page,
+            "has_next": has_next,
+            "products": products,
+            "output": str(sink.part_path),
+            "offset": sink.offset,
+            "total_products": sink.count,
+        }
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    # The run completed: the checkpoint is no longer needed
+    def clear(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.path.unlink(missing_ok=True)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,367 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlparse
+
+# Crawl instrumentation: leveled logging and run metrics.
+# Scrapers log through get_logger() instead of printing. Records are put on
+# a queue and written to stdout by a background thread, so a slow console
+# never stalls the event loop. SCRAPER_LOG_LEVEL picks the level (INFO by
+# default; DEBUG also logs every product and page).
+# METRICS collects, for the whole process:
+#   per host                 fetch latency histogram, bytes, responses by
+#                            status, retries, network errors, the current
+#                            adaptive concurrency limit and breaker trips
+#   per competitor/category  parse time histogram, pages, products, errors,
+#                            pages and products per subcategory
+# Hosts are attributed to a competitor through categorieLinks/*Links.json.
+# At the end of a run write_run_summary() saves output/metrics/
+# <Competitor>Metrics.json and the same numbers in the Prometheus text format
+# (<Competitor>Metrics.prom), ready for a node_exporter textfile collector.
+LOG_LEVEL = os.environ.get("SCRAPER_LOG_LEVEL", "INFO").upper()
+METRICS_DIR = Path(__file__).parent / "output" / "metrics"
+LINKS_DIR = Path(__file__).parent / "categorieLinks"
+LOGGER_NAME = "competitracker"
+PROMETHEUS_PREFIX = "competitracker"
+
+# Histogram bucket upper bounds, in seconds
+FETCH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PARSE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+_listener = None
+
+
+def setup_logging(level=None):
+    global _listener
+    root = logging.getLogger(LOGGER_NAME)
+    root.setLevel(level or LOG_LEVEL)
+    if _listener is not None:
+        return root
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%H:%M:%S"))
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.propagate = False
+    return root
+
+
+# Write out every record still queued. atexit does not run in
+# ProcessPoolExecutor workers, so the orchestrator calls this when a
+# scraper finishes; the listener keeps running for the next one.
+def flush_logging():
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+
+def get_logger(name):
+    setup_logging()
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    # Cumulative counts per upper bound, "+Inf" last, as Prometheus wants them
+    def cumulative(self):
+        total = 0
+        result = []
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "buckets": {str(bound): count for bound, count in self.cumulative()},
+        }
+
+
+def host_of(url):
+    return urlparse(url).netloc
+
+
+def _domain(host):
+    return host[len("www."):] if host.startswith("www.") else host
+
+
+# Registered domain of each competitor, read from its links file
+def load_competitor_domains(links_dir=LINKS_DIR):
+    domains = {}
+    for path in Path(links_dir).glob("*Links.json"):
+        with open(path, 'r', encoding='utf-8') as f:
+            links = json.load(f)
+        for subcategories in links.values():
+            for urls in subcategories.values():
+                for url in urls if isinstance(urls, list) else [urls]:
+                    host = host_of(url if url.startswith("http") else "https://" + url)
+                    domains[_domain(host)] = path.stem[: -len("Links")]
+    return domains
+
+
+class CrawlMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._domains = None
+        self._host_competitors = {}
+        self.started = {}
+        self.hosts = {}
+        self.categories = {}
+
+    def competitor_of_host(self, host):
+        if host not in self._host_competitors:
+            if self._domains is None:
+                self._domains = load_competitor_domains()
+            domain = _domain(host)
+            self._host_competitors[host] = next(
+                (competitor for known, competitor in self._domains.items()
+                 if domain == known or domain.endswith("." + known)),
+                None,
+            )
+        return self._host_competitors[host]
+
+    def _start(self, competitor):
+        if competitor is not None and competitor not in self.started:
+            self.started[competitor] = time.time()
+
+    def _host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = {
+                "competitor": self.competitor_of_host(host),
+                "latency": Histogram(FETCH_BUCKETS),
+                "bytes": 0,
+                "responses": Counter(),
+                "retries": 0,
+                "errors": 0,
+                "concurrency_limit": None,
+                "max_concurrency_limit": None,
+                "breaker_trips": 0,
+            }
+            self._start(self.hosts[host]["competitor"])
+        return self.hosts[host]
+
+    def _category(self, competitor, category_name):
+        key = (competitor, category_name)
+        if key not in self.categories:
+            self.categories[key] = {
+                "parse": Histogram(PARSE_BUCKETS), "pages": 0, "products": 0, "errors": 0, "subcategories": {},
+            }
+            self._start(competitor)
+        return self.categories[key]
+
+    # One HTTP request attempt that got a response
+    def observe_fetch(self, url, seconds, status, size):
+        with self._lock:
+            stats = self._host(host_of(url))
+            stats["latency"].observe(seconds)
+            stats["bytes"] += size
+            stats["responses"][str(status)] += 1
+
+    def observe_retry(self, url):
+        with self._lock:
+            self._host(host_of(url))["retries"] += 1
+
+    # A request attempt that failed without a response
+    def observe_fetch_error(self, url):
+        with self._lock:
+            self._host(host_of(url))["errors"] += 1
+
+    # Concurrency limit chosen for a host by its adaptive limiter
+    def observe_limit(self, host, limit):
+        with self._lock:
+            stats = self._host(host)
+            stats["concurrency_limit"] = limit
+            stats["max_concurrency_limit"] = max(stats["max_concurrency_limit"] or 0, limit)
+
+    def observe_breaker(self, host):
+        with self._lock:
+            self._host(host)["breaker_trips"] += 1
+
+    def observe_parse(self, competitor, category_name, seconds):
+        with self._lock:
+            self._category(competitor, category_name)["parse"].observe(seconds)
+
+    def observe_page(self, competitor, category_name, products, subcategory_name=None):
+        with self._lock:
+            stats = self._category(competitor, category_name)
+            stats["pages"] += 1
+            stats["products"] += products
+            if subcategory_name is not None:
+                unit = stats["subcategories"].setdefault(subcategory_name, {"pages": 0, "products": 0})
+                unit["pages"] += 1
+                unit["products"] += products
+
+    # A unit whose crawl was cut short because the request budget was spent
+    def observe_truncated(self, competitor, category_name, subcategory_name):
+        with self._lock:
+            stats = self._category(competitor, category_name)
+            stats["subcategories"].setdefault(subcategory_name, {"pages": 0, "products": 0})["truncated"] = True
+
+    def observe_error(self, competitor, category_name):
+        with self._lock:
+            self._category(competitor, category_name)["errors"] += 1
+
+    # Pages and products per (category, subcategory) of a competitor, and
+    # whether the budget cut the unit short
+    def unit_stats(self, competitor):
+        with self._lock:
+            return {
+                (category_name, subcategory_name): dict(unit)
+                for (owner, category_name), stats in self.categories.items() if owner == competitor
+                for subcategory_name, unit in stats["subcategories"].items()
+            }
+
+    # Machine-readable summary of one competitor's run
+    def summary(self, competitor):
+        with self._lock:
+            duration = time.time() - self.started.get(competitor, time.time())
+            categories = {
+                category_name: {
+                    "pages": stats["pages"],
+                    "products": stats["products"],
+                    "errors": stats["errors"],
+                    "subcategories": {name: dict(unit) for name, unit in sorted(stats["subcategories"].items())},
+                    "parse_seconds": stats["parse"].to_dict(),
+                }
+                for (owner, category_name), stats in sorted(self.categories.items()) if owner == competitor
+            }
+            hosts = {
+                host: {
+                    "requests": sum(stats["responses"].values()),
+                    "bytes": stats["bytes"],
+                    "responses": dict(stats["responses"]),
+                    "retries": stats["retries"],
+                    "errors": stats["errors"],
+                    "concurrency_limit": stats["concurrency_limit"],
+                    "max_concurrency_limit": stats["max_concurrency_limit"],
+                    "breaker_trips": stats["breaker_trips"],
+                    "latency_seconds": stats["latency"].to_dict(),
+                }
+                for host, stats in sorted(self.hosts.items()) if stats["competitor"] == competitor
+            }
+        products = sum(stats["products"] for stats in categories.values())
+        return {
+            "competitor": competitor,
+            "duration_seconds": round(duration, 2),
+            "pages": sum(stats["pages"] for stats in categories.values()),
+            "products": products,
+            "products_per_sec": round(products / duration, 1) if duration > 0 else None,
+            "errors": sum(stats["errors"] for stats in categories.values()),
+            "retries": sum(stats["retries"] for stats in hosts.values()),
+            "hosts": hosts,
+            "categories": categories,
+        }
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _histogram_lines(name, histogram, labels):
+    lines = []
+    for bound, count in histogram["buckets"].items():
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram['sum']}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram['count']}")
+    return lines
+
+
+# Prometheus text exposition of a summary
+def prometheus_text(summary):
+    competitor = summary["competitor"]
+    metrics = {}
+
+    def add(name, kind, help_text, lines):
+        metrics.setdefault(name, (kind, help_text, []))[2].extend(lines)
+
+    for host, stats in summary["hosts"].items():
+        labels = {"competitor": competitor, "host": host}
+        add("fetch_seconds", "histogram", "HTTP request latency",
+            _histogram_lines(f"{PROMETHEUS_PREFIX}_fetch_seconds", stats["latency_seconds"], labels))
+        add("fetch_bytes_total", "counter", "Response bytes received",
+            [f"{PROMETHEUS_PREFIX}_fetch_bytes_total{_labels(**labels)} {stats['bytes']}"])
+        add("responses_total", "counter", "HTTP responses by status",
+            [f"{PROMETHEUS_PREFIX}_responses_total{_labels(**labels, status=status)} {count}"
+             for status, count in sorted(stats["responses"].items())])
+        add("retries_total", "counter", "Retried requests",
+            [f"{PROMETHEUS_PREFIX}_retries_total{_labels(**labels)} {stats['retries']}"])
+        add("fetch_errors_total", "counter", "Requests failed without a response",
+            [f"{PROMETHEUS_PREFIX}_fetch_errors_total{_labels(**labels)} {stats['errors']}"])
+        add("breaker_trips_total", "counter", "Times the host circuit breaker opened",
+            [f"{PROMETHEUS_PREFIX}_breaker_trips_total{_labels(**labels)} {stats['breaker_trips']}"])
+        if stats["concurrency_limit"] is not None:
+            add("concurrency_limit", "gauge", "Adaptive concurrency limit of the host at the end of the run",
+                [f"{PROMETHEUS_PREFIX}_concurrency_limit{_labels(**labels)} {stats['concurrency_limit']}"])
+    for category_name, stats in summary["categories"].items():
+        labels = {"competitor": competitor, "category": category_name}
+        add("parse_seconds", "histogram", "Listing page parse time",
+            _histogram_lines(f"{PROMETHEUS_PREFIX}_parse_seconds", stats["parse_seconds"], labels))
+        for field, help_text in (("pages", "Listing pages scraped"), ("products", "Products scraped"),
+                                 ("errors", "Listing pages that failed")):
+            add(f"{field}_total", "counter", help_text,
+                [f"{PROMETHEUS_PREFIX}_{field}_total{_labels(**labels)} {stats[field]}"])
+    labels = _labels(competitor=competitor)
+    add("run_duration_seconds", "gauge", "Duration of the last run",
+        [f"{PROMETHEUS_PREFIX}_run_duration_seconds{labels} {summary['duration_seconds']}"])
+    add("products_per_second", "gauge", "Products scraped per second in the last run",
+        [f"{PROMETHEUS_PREFIX}_products_per_second{labels} {summary['products_per_sec'] or 0}"])
+
+    lines = []
+    for name, (kind, help_text, samples) in metrics.items():
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path, text):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# Save the run summary of a competitor as JSON and Prometheus text
+def write_run_summary(competitor, metrics_dir=METRICS_DIR):
+    summary = METRICS.summary(competitor)
+    metrics_dir = Path(metrics_dir)
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    _write_atomic(metrics_dir / f"{competitor}Metrics.json", json.dumps(summary, ensure_ascii=False, indent=2))
+    _write_atomic(metrics_dir / f"{competitor}Metrics.prom", prometheus_text(summary))
+    get_logger("metrics").info(
+        f"{competitor}: {summary['products']} products from {summary['pages']} pages in {summary['duration_seconds']}s "
+        f"({summary['products_per_sec']}/s), {summary['retries']} retries, {summary['errors']} errors "
+        f"-> {metrics_dir / (competitor + 'Metrics.json')}"
+    )
+    return summary
+
+
+METRICS = CrawlMetrics()
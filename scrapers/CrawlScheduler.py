@@ -0,0 +1,324 @@
+import argparse
+import json
+import math
+import os
+import time
+from pathlib import Path
+
+from CrawlMetrics import LINKS_DIR, METRICS, get_logger
+from FetchEngine import iter_link_units
+from OutputSink import find_snapshot, read_products
+from Taxonomy import TAXONOMY
+
+# Change-rate-aware crawl scheduling.
+# Every (category, subcategory) of a competitor's *Links.json is a unit with
+# a learned price change rate: how often, per product and per day, a price
+# or discount moves. After each run the delta tracker tells, per unit, how
+# many products were found in the previous snapshot too and how many of them
+# changed price; with the days since the unit was last crawled that gives
+# the rate of a Poisson process, -ln((n - x + 0.5) / (n + 0.5)) / days,
+# which is smoothed over the runs. migration/learnChangeRates.py seeds the
+# rates from the product_history collection.
+# From its rate a unit gets:
+#   interval  the time after which STALENESS of its products are expected to
+#             have changed, kept between the min and max interval; a unit
+#             whose rate is not known yet gets the min interval
+#   priority  the price changes expected since its last crawl, per request
+#             it costs (the listing pages it took last time; a unit never
+#             crawled is assumed as large as the largest known one, or
+#             UNKNOWN_UNIT_PAGES)
+# A run crawls the due units (past their interval, or never crawled) by
+# decreasing priority until the request budget of the run is spent. Units
+# left out keep their products from the previous snapshot, which are carried
+# over into the new one so a snapshot always covers the whole catalog.
+# Costs are estimates, so the budget is also handed to the fetch engine,
+# which stops requesting pages once it is spent. A unit cut short that way
+# stays due, and its products not reached are carried over as well.
+# State lives in output/schedule/<Competitor>.json; run this module to see
+# the plan. SCRAPER_REQUEST_BUDGET caps the listing requests of a run (no cap
+# by default: every due unit is crawled). Set SCRAPER_SCHEDULE=0 to crawl
+# every unit on every run (rates are still learned).
+SCHEDULE_DIR = Path(__file__).parent / "output" / "schedule"
+SCHEDULE = os.environ.get("SCRAPER_SCHEDULE", "1") != "0"
+REQUEST_BUDGET = int(os.environ["SCRAPER_REQUEST_BUDGET"]) if os.environ.get("SCRAPER_REQUEST_BUDGET") else None
+UNKNOWN_UNIT_PAGES = int(os.environ.get("SCRAPER_SCHEDULE_UNKNOWN_PAGES", "10"))
+STALENESS = float(os.environ.get("SCRAPER_SCHEDULE_STALENESS", "0.1"))
+MIN_INTERVAL_HOURS = float(os.environ.get("SCRAPER_SCHEDULE_MIN_HOURS", "6"))
+MAX_INTERVAL_HOURS = float(os.environ.get("SCRAPER_SCHEDULE_MAX_HOURS", "168"))
+# Weight of the latest run in the smoothed rate
+RATE_SMOOTHING = 0.3
+# Runs closer together than this are counted as this far apart
+MIN_OBSERVED_HOURS = 1.0
+CARRY_OVER_BATCH = 1000
+
+DAY = 86400.0
+
+
+# Rate at which STALENESS of the products change in one interval
+def rate_for_interval(hours):
+    return -math.log(1 - STALENESS) / (hours / 24)
+
+
+# Every unit is due at least once per max interval
+MIN_RATE = rate_for_interval(MAX_INTERVAL_HOURS)
+UNKNOWN_RATE = rate_for_interval(MIN_INTERVAL_HOURS)
+
+logger = get_logger("scheduler")
+
+# competitor -> request budget handed out by the orchestrator
+_budgets = {}
+
+
+def set_budget(competitor, budget):
+    _budgets[competitor] = budget
+
+
+def schedule_path(competitor, schedule_dir=SCHEDULE_DIR):
+    return Path(schedule_dir) / f"{competitor}.json"
+
+
+def load_links(competitor, links_dir=LINKS_DIR):
+    with open(Path(links_dir) / f"{competitor}Links.json", 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Changes per product and per day behind x of n products changing in days
+def poisson_rate(products, changed, days):
+    return math.log((products + 0.5) / (products - changed + 0.5)) / days
+
+
+def interval_hours(rate):
+    if rate is None:
+        return MIN_INTERVAL_HOURS
+    hours = -math.log(1 - STALENESS) / max(rate, MIN_RATE) * 24
+    return min(max(hours, MIN_INTERVAL_HOURS), MAX_INTERVAL_HOURS)
+
+
+# Due units by decreasing priority, as long as the budget lasts. The first
+# unit is taken even when it alone exceeds the budget, so a budget smaller
+# than the largest listing does not starve it forever.
+def fill_budget(rows, budget):
+    selected = []
+    spent = 0
+    for row in sorted((row for row in rows if row["due"]), key=lambda row: -row["priority"]):
+        if budget is not None and spent + row["requests"] > budget and (selected or budget <= 0):
+            continue
+        selected.append(row)
+        spent += row["requests"]
+    return selected, spent
+
+
+class CrawlScheduler:
+    def __init__(self, competitor, budget=None, schedule_dir=SCHEDULE_DIR, enabled=None):
+        self.competitor = competitor
+        self.enabled = SCHEDULE if enabled is None else enabled
+        self.budget = budget if budget is not None else _budgets.get(competitor, REQUEST_BUDGET)
+        self.path = schedule_path(competitor, schedule_dir)
+        # category -> subcategory -> state of the unit
+        self.units = {}
+        # Units of the links file, and the ones picked for this run
+        self.known = set()
+        self.planned = set()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.units = json.load(f)["units"]
+        except FileNotFoundError:
+            pass
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"competitor": self.competitor, "units": self.units}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def state(self, category_name, subcategory_name):
+        return self.units.setdefault(category_name, {}).setdefault(subcategory_name, {
+            "last_crawled": None, "rate": None, "products": None, "pages": None, "runs": 0,
+        })
+
+    def _state_or_none(self, category_name, subcategory_name):
+        return self.units.get(category_name, {}).get(subcategory_name)
+
+    # One row per unit of the links file: its rate, interval, age, cost and
+    # priority at the given time
+    def candidates(self, links, now=None):
+        now = time.time() if now is None else now
+        urls = {}
+        for category_name, subcategory_name, _url in iter_link_units(links):
+            urls[(category_name, subcategory_name)] = urls.get((category_name, subcategory_name), 0) + 1
+        known_pages = [
+            state["pages"] for subcategories in self.units.values() for state in subcategories.values() if state["pages"]
+        ]
+        default_requests = max(known_pages, default=UNKNOWN_UNIT_PAGES)
+        rows = []
+        for (category_name, subcategory_name), url_count in urls.items():
+            state = self._state_or_none(category_name, subcategory_name)
+            row = {
+                "competitor": self.competitor, "category": category_name, "subcategory": subcategory_name,
+                "rate": None, "interval_hours": MIN_INTERVAL_HOURS, "age_hours": None,
+                "requests": default_requests * url_count, "due": True, "priority": math.inf,
+            }
+            if state is not None and state["last_crawled"] is not None:
+                rate = state["rate"]
+                age_days = max(now - state["last_crawled"], 0.0) / DAY
+                assumed_rate = UNKNOWN_RATE if rate is None else max(rate, MIN_RATE)
+                expected = (state["products"] or 0) * (1 - math.exp(-assumed_rate * age_days))
+                row.update(
+                    rate=rate,
+                    interval_hours=interval_hours(rate),
+                    age_hours=age_days * 24,
+                    requests=max(state["pages"] or default_requests, 1),
+                )
+                row["due"] = row["age_hours"] >= row["interval_hours"]
+                row["priority"] = expected / row["requests"]
+            rows.append(row)
+        return rows
+
+    # The part of a *Links.json mapping to crawl in this run. Units already
+    # started in the checkpoint of an interrupted run are always kept.
+    def plan(self, links, checkpoint=None, now=None):
+        rows = self.candidates(links, now)
+        self.known = {(row["category"], row["subcategory"]) for row in rows}
+        if not self.enabled:
+            self.planned = set(self.known)
+            return links
+        resumed = set()
+        if checkpoint is not None:
+            for category_name, subcategory_name, url in iter_link_units(links):
+                if checkpoint.next_page(category_name, subcategory_name, url) != 1:
+                    resumed.add((category_name, subcategory_name))
+        selected, spent = fill_budget([row for row in rows if (row["category"], row["subcategory"]) not in resumed], self.budget)
+        self.planned = resumed | {(row["category"], row["subcategory"]) for row in selected}
+        due = sum(1 for row in rows if row["due"])
+        budget = "no budget" if self.budget is None else f"a budget of {self.budget} requests"
+        logger.info(f"{self.competitor}: {due} of {len(rows)} subcategories due, crawling {len(self.planned)} "
+                    f"(~{spent} requests, {budget}, {len(resumed)} resumed)")
+        return {
+            category_name: {
+                subcategory_name: url for subcategory_name, url in subcategories.items()
+                if (category_name, subcategory_name) in self.planned
+            }
+            for category_name, subcategories in links.items()
+            if any((category_name, subcategory_name) in self.planned for subcategory_name in subcategories)
+        }
+
+    # Copy the products of the units left out of this run from the previous
+    # snapshot into the sink, with their taxonomy IDs resolved again: the
+    # snapshot may predate the IDs or a change to categories.json. Units the
+    # budget cut short get back their products this run did not reach.
+    def carry_over(self, sink, truncated=()):
+        skipped = self.known - self.planned
+        truncated = set(truncated) & self.planned
+        previous_path = find_snapshot(self.competitor)
+        if not (skipped or truncated) or previous_path is None:
+            return 0
+        written = {record.get("product_url") for record in read_products(sink.part_path)} if truncated else set()
+        carried = 0
+        batch = []
+        taxonomy_ids = {unit: TAXONOMY.resolve(self.competitor, *unit) for unit in skipped | truncated}
+        for record in read_products(previous_path):
+            unit = (record.get("category"), record.get("sub_category"))
+            if unit not in skipped and (unit not in truncated or record.get("product_url") in written):
+                continue
+            record["category_id"], record["sub_category_id"] = taxonomy_ids[unit]
+            batch.append(record)
+            if len(batch) >= CARRY_OVER_BATCH:
+                sink.write_many(batch)
+                carried += len(batch)
+                batch = []
+        if batch:
+            sink.write_many(batch)
+            carried += len(batch)
+        logger.info(f"{self.competitor}: {carried} products of {len(skipped)} subcategories not due "
+                    f"and {len(truncated)} cut short carried over from {previous_path.name}")
+        return carried
+
+    # Update the rate, cost and crawl time of the units crawled in this run.
+    # A unit that produced no page or was cut short by the budget stays due.
+    def learn(self, delta=None, unit_stats=None, now=None):
+        now = time.time() if now is None else now
+        unit_stats = METRICS.unit_stats(self.competitor) if unit_stats is None else unit_stats
+        previous_path = delta.previous_path if delta is not None else None
+        snapshot_time = previous_path.stat().st_mtime if previous_path is not None and previous_path.exists() else None
+        learned = 0
+        for unit in self.planned:
+            stats = unit_stats.get(unit)
+            if not stats or not stats["pages"] or stats.get("truncated"):
+                continue
+            state = self.state(*unit)
+            last_crawled = state["last_crawled"] or snapshot_time
+            compared, changed = delta.unit_changes.get(unit, (0, 0)) if delta is not None else (0, 0)
+            if compared and last_crawled is not None:
+                days = max((now - last_crawled) / DAY, MIN_OBSERVED_HOURS / 24)
+                rate = poisson_rate(compared, changed, days)
+                state["rate"] = rate if state["rate"] is None else (
+                    RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * state["rate"]
+                )
+                learned += 1
+            state["last_crawled"] = now
+            state["products"] = stats["products"]
+            state["pages"] = stats["pages"]
+            state["runs"] += 1
+        logger.debug(f"{self.competitor}: change rate updated for {learned} subcategories")
+
+    # End of a run, before the sink is closed. With scheduling off every unit
+    # is planned and only the ones cut short are carried over. Rates are
+    # learned even then, ready for when it is turned on.
+    def finish(self, sink, now=None):
+        unit_stats = METRICS.unit_stats(self.competitor)
+        self.carry_over(sink, [unit for unit, stats in unit_stats.items() if stats.get("truncated")])
+        self.learn(sink.delta, unit_stats, now=now)
+        self.save()
+
+    # Replace the rates of units with the ones measured elsewhere (history)
+    def seed(self, rates):
+        for (category_name, subcategory_name), rate in rates.items():
+            self.state(category_name, subcategory_name)["rate"] = rate
+        self.save()
+
+
+# Split one request budget between competitors: the due units of all of
+# them compete on priority, each competitor gets what its units won
+def allocate_budget(competitors, budget, now=None):
+    rows = []
+    for competitor in competitors:
+        rows.extend(CrawlScheduler(competitor).candidates(load_links(competitor), now))
+    selected, _spent = fill_budget(rows, budget)
+    allocation = {competitor: 0 for competitor in competitors}
+    for row in selected:
+        allocation[row["competitor"]] += row["requests"]
+    return allocation
+
+
+def print_plan(competitor, budget):
+    scheduler = CrawlScheduler(competitor, budget)
+    rows = scheduler.candidates(load_links(competitor))
+    selected, spent = fill_budget(rows, scheduler.budget)
+    picked = {(row["category"], row["subcategory"]) for row in selected}
+    print(f"\n{competitor}: {len(picked)} of {len(rows)} subcategories, ~{spent} requests")
+    print(f"{'Category':<24}{'Subcategory':<28}{'Rate/day':>9}{'Every h':>9}{'Age h':>8}{'Req':>6}{'Priority':>10}  Run")
+    for row in sorted(rows, key=lambda row: -row["priority"]):
+        rate = "-" if row["rate"] is None else f"{row['rate']:.3f}"
+        age = "-" if row["age_hours"] is None else f"{row['age_hours']:.0f}"
+        priority = "new" if math.isinf(row["priority"]) else f"{row['priority']:.2f}"
+        run = "yes" if (row["category"], row["subcategory"]) in picked else ""
+        print(f"{row['category'][:23]:<24}{row['subcategory'][:27]:<28}{rate:>9}{row['interval_hours']:>9.0f}"
+              f"{age:>8}{row['requests']:>6}{priority:>10}  {run}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show which subcategories the next run would crawl")
+    parser.add_argument("competitors", nargs="*", help="Competitors to plan (default: every *Links.json)")
+    parser.add_argument("--budget", type=int, default=REQUEST_BUDGET, help="Listing requests per competitor and run")
+    args = parser.parse_args()
+    competitors = args.competitors or sorted(path.name[: -len("Links.json")] for path in LINKS_DIR.glob("*Links.json"))
+    for competitor in competitors:
+        print_plan(competitor, args.budget)
+
+
+if __name__ == "__main__":
+    main()
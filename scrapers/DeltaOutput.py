@@ -0,0 +1,143 @@
+import gzip
+import json
+import os
+from pathlib import Path
+
+from CrawlMetrics import get_logger
+from OutputSink import COMPRESS_OUTPUT, OUTPUT_DIR, find_snapshot, read_products
+
+# Incremental output: what changed since the previous run.
+# The previous snapshot of a competitor is indexed by product URL when a run
+# starts. Every product the sink writes is compared with it as it arrives and
+# only differences go to output/<Competitor>Delta.ndjson, one change per line:
+#   {"change": "added", "product": {...}}
+#   {"change": "updated", "fields": [...], "product": {...}, "previous": {...}}
+#   {"change": "removed", "product_url": ..., "previous": {...}}
+# Removals are decided when the run finishes and only for the subcategories
+# that produced products in this run, so a listing that failed to load does
+# not make its whole catalog disappear. Like the snapshot, the delta is
+# written to a .part file and renamed when complete.
+# Per (category, subcategory), the tracker also counts the products found in
+# both snapshots and how many of them changed price or discount; the crawl
+# scheduler learns each unit's change rate from those counts.
+# Set SCRAPER_DELTA=0 to only write the full snapshot.
+DELTA_OUTPUT = os.environ.get("SCRAPER_DELTA", "1") != "0"
+
+# A product listed in several subcategories is kept under whichever listing
+# finished first, which varies between concurrent runs, so the category is
+# indexed (for removals) but not compared
+COMPARED_FIELDS = ("product_name", "product_price", "discount", "stock_status")
+INDEXED_FIELDS = COMPARED_FIELDS + ("category", "sub_category")
+PRICE_FIELDS = ("product_price", "discount")
+
+logger = get_logger("delta")
+
+
+def delta_path(competitor, compress=None):
+    compress = COMPRESS_OUTPUT if compress is None else compress
+    return OUTPUT_DIR / f"{competitor}Delta.ndjson{'.gz' if compress else ''}"
+
+
+# Most recent delta of a competitor, or None
+def find_delta(competitor, output_dir=OUTPUT_DIR):
+    candidates = [output_dir / f"{competitor}Delta.ndjson", output_dir / f"{competitor}Delta.ndjson.gz"]
+    existing = [candidate for candidate in candidates if candidate.exists()]
+    return max(existing, key=lambda candidate: candidate.stat().st_mtime) if existing else None
+
+
+# Compared fields of a snapshot keyed by product URL; the same product listed
+# in several subcategories keeps its first occurrence, as the loader does
+def load_index(path):
+    index = {}
+    if path is None:
+        return index
+    for record in read_products(path):
+        url = record.get("product_url")
+        if url and url != "N/A" and url not in index:
+            index[url] = {field: record.get(field) for field in INDEXED_FIELDS}
+    return index
+
+
+class DeltaTracker:
+    def __init__(self, competitor, path=None, previous_path=None, compress=None):
+        self.competitor = competitor
+        self.path = Path(path or delta_path(competitor, compress))
+        self.compress = self.path.suffix == ".gz"
+        self.part_path = self.path.with_name(self.path.name + ".part")
+        previous_path = find_snapshot(competitor) if previous_path is None else previous_path
+        self.previous_path = previous_path
+        self.index = load_index(previous_path)
+        self.seen = set()
+        self.units = set()
+        # (category, subcategory) -> [products compared, price/discount changes]
+        self.unit_changes = {}
+        self.stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "price": 0, "stock": 0}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.part_path, 'wb')
+
+    def _change(self, record):
+        url = record.get("product_url")
+        if not url or url == "N/A" or url in self.seen:
+            return None
+        self.seen.add(url)
+        unit = (record.get("category"), record.get("sub_category"))
+        self.units.add(unit)
+        previous = self.index.get(url)
+        if previous is None:
+            self.stats["added"] += 1
+            return {"change": "added", "product": record}
+        changes = self.unit_changes.setdefault(unit, [0, 0])
+        changes[0] += 1
+        fields = [field for field in COMPARED_FIELDS if record.get(field) != previous[field]]
+        if not fields:
+            self.stats["unchanged"] += 1
+            return None
+        self.stats["updated"] += 1
+        if any(field in PRICE_FIELDS for field in fields):
+            self.stats["price"] += 1
+            changes[1] += 1
+        if "stock_status" in fields:
+            self.stats["stock"] += 1
+        return {
+            "change": "updated",
+            "fields": fields,
+            "product": record,
+            "previous": {field: previous[field] for field in fields},
+        }
+
+    def _write(self, changes):
+        if not changes:
+            return
+        data = ("\n".join(json.dumps(change, ensure_ascii=False) for change in changes) + "\n").encode("utf-8")
+        self._file.write(gzip.compress(data) if self.compress else data)
+        self._file.flush()
+
+    # Compare one page worth of product dicts with the previous snapshot
+    def observe_many(self, records):
+        self._write([change for change in map(self._change, records) if change is not None])
+
+    # Emit the removals and move the delta to its final name
+    def finish(self):
+        removed = []
+        for url, previous in self.index.items():
+            if url in self.seen or (previous["category"], previous["sub_category"]) not in self.units:
+                continue
+            removed.append({"change": "removed", "competitor": self.competitor, "product_url": url, "previous": previous})
+        self.stats["removed"] = len(removed)
+        self._write(removed)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.part_path, self.path)
+        stats = self.stats
+        logger.info(f"Delta for {self.competitor}: {stats['added']} added, {stats['updated']} updated "
+              f"({stats['price']} price/discount, {stats['stock']} stock), {stats['removed']} removed, "
+              f"{stats['unchanged']} unchanged -> {self.path}")
+
+    def abort(self):
+        self._file.close()
+
+
+def delta_tracker(competitor, enabled=None):
+    enabled = DELTA_OUTPUT if enabled is None else enabled
+    return DeltaTracker(competitor) if enabled else None
@@ -0,0 +1,451 @@
+import hashlib
+import json
+import logging
+import math
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from CrawlMetrics import get_logger
+from HtmlParser import CompiledSelector, parse_html
+from Profiler import stage
+from ProductShema import ProductRecord
+from Taxonomy import TAXONOMY
+
+# Declarative extraction specs.
+# Every competitor describes its listing pages in
+# extractionSpecs/<Competitor>.json: the product card selector, the next page
+# selector and, for each Product field, where to read it and how to clean it.
+# load_spec() compiles the selectors once; CompiledSpec.parse_page() then
+# walks each card a single time, resolving every distinct selector once and
+# applying the field transforms.
+#
+# Field spec keys:
+#   selector   CSS selector, or a list tried in order until one matches
+#   value      "text" (.text.strip()), "compact_text" (get_text(strip=True))
+#              or "attr:<name>"
+#   ignore_if  {"attr": name, "equals": value}: treat such a tag as missing
+#   transforms list of steps, see TRANSFORMS below
+#   default    value used when no tag matches
+#   fallback   value used when a transform fails (e.g. float("abc"))
+#   present / missing  constant values chosen by whether the tag exists
+#   const      constant value, no selector needed
+#   label      log parse errors as "Error parsing <label>: ..."
+#   json       {"keys": [...], "format": "..."}: where the field is found in
+#              an item of the site's JSON listing API (dotted paths tried in
+#              order, the value substituted for {} in format before
+#              transforms). format may also read other item fields as
+#              {dotted.path}, with alternatives as {a.name|b}; "encode": "uri"
+#              percent-encodes the substituted values like JS encodeURI
+# The discount field lists strategies tried in order:
+#   {"kind": "amount", <field spec>}          discount read as is
+#   {"kind": "price_difference", <field spec>} regular price minus price,
+#       with "positive_only" to ignore regular prices below the price
+# A strategy only applies when its tag exists; evaluation stops at the first
+# one that applies unless it sets "next_if_zero" and produced 0.
+# "page_count" lists where page 1 tells how many pages a listing has, tried
+# in order; the engine then fetches every page at once:
+#   {"kind": "max_page", "selector": ...}        highest number among the
+#       matching pagination links
+#   {"kind": "total_products", "selector": ...}  highest number in the tag
+#       text, divided by the number of cards on page 1
+SPECS_DIR = Path(__file__).parent / "extractionSpecs"
+logger = get_logger("extract")
+PRODUCT_FIELDS = ("product_name", "product_url", "product_price", "discount", "stock_status")
+
+
+PAGE_COUNT_KINDS = ("max_page", "total_products")
+# Integers, with optional thousands separators ("1 245", "1.245")
+NUMBER_RE = re.compile(r"\d+(?:[\s\u00a0\u202f.,]\d{3})*")
+
+
+# {} or {dotted.path|other.path} in a json format
+JSON_PLACEHOLDER_RE = re.compile(r"\{([^{}]*)\}")
+# Characters JS encodeURI leaves as they are, besides letters, digits and _.-~
+ENCODE_URI_SAFE = ";,/?:@&=+$!*'()#"
+
+
+def _json_value(item, path):
+    value = item
+    for part in path:
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def _numbers(text):
+    return [int(re.sub(r"\D", "", number)) for number in NUMBER_RE.findall(text)]
+
+
+# Handle both 1,234.56 and 1.234,56 / 1 234,56 price formats
+def decimal_comma(value):
+    if ',' in value:
+        if '.' in value:
+            return value.replace(',', '')
+        return value.replace('.', '').replace(',', '.')
+    return value
+
+
+TRANSFORMS = {
+    "strip": lambda value: value.strip(),
+    "remove": lambda value, *parts: _remove(value, parts),
+    "replace": lambda value, old, new: value.replace(old, new),
+    "regex_remove": lambda value, pattern: re.sub(pattern, "", value),
+    "prefix": lambda value, prefix: prefix + value,
+    "decimal_comma": decimal_comma,
+    "float": float,
+}
+
+
+def _remove(value, parts):
+    for part in parts:
+        value = value.replace(part, '')
+    return value
+
+
+def _compile_transforms(steps):
+    compiled = []
+    for step in steps:
+        name, *args = [step] if isinstance(step, str) else step
+        if name not in TRANSFORMS:
+            raise ValueError(f"Unknown transform: {name}")
+        compiled.append((TRANSFORMS[name], tuple(args)))
+    return compiled
+
+
+class FieldRule:
+    def __init__(self, spec, selectors):
+        self.const = spec.get("const")
+        self.has_const = "const" in spec
+        raw_selectors = spec.get("selector", [])
+        if isinstance(raw_selectors, str):
+            raw_selectors = [raw_selectors]
+        # Share compiled selectors between fields so each one runs once per card
+        self.selectors = [selectors.setdefault(selector, CompiledSelector(selector)) for selector in raw_selectors]
+        value = spec.get("value", "text")
+        self.attribute = value[len("attr:"):] if value.startswith("attr:") else None
+        self.compact = value == "compact_text"
+        self.ignore_if = spec.get("ignore_if")
+        self.transforms = _compile_transforms(spec.get("transforms", []))
+        self.default = spec.get("default", "N/A")
+        self.fallback = spec.get("fallback", self.default)
+        self.presence = ("present" in spec, spec.get("present"), spec.get("missing"))
+        self.label = spec.get("label")
+        json_spec = spec.get("json", {})
+        self.json_keys = [key.split(".") for key in json_spec.get("keys", [])]
+        self.json_format = json_spec.get("format", "{}")
+        self.json_encode = json_spec.get("encode") == "uri"
+
+    def find(self, card, found):
+        for selector in self.selectors:
+            if selector.selector not in found:
+                found[selector.selector] = selector.select_one(card)
+            tag = found[selector.selector]
+            if tag is not None:
+                if self.ignore_if and tag.get(self.ignore_if["attr"]) == self.ignore_if["equals"]:
+                    return None
+                return tag
+        return None
+
+    def raw_value(self, tag):
+        if self.attribute:
+            return tag[self.attribute]
+        if self.compact:
+            return tag.get_text(strip=True)
+        return tag.text.strip()
+
+    # Run the transforms; returns (value, ok) so callers can tell a parsed
+    # value from the fallback
+    def convert(self, raw):
+        value = clean = raw
+        try:
+            for transform, args in self.transforms:
+                if transform is float:
+                    clean = value
+                value = transform(value, *args)
+        except ValueError:
+            if self.label:
+                logger.warning(f"Error parsing {self.label}: '{raw}' -> '{clean}'")
+            return self.fallback, False
+        return value, True
+
+    def find_raw(self, card, found):
+        tag = self.find(card, found)
+        return None if tag is None else self.raw_value(tag)
+
+    # Raw string of the field in a JSON API item (None: not there)
+    def json_raw(self, item):
+        for path in self.json_keys:
+            value = _json_value(item, path)
+            if value is not None and value != "":
+                return self.format_json(value, item)
+        return None
+
+    # The json format with {} replaced by value and {paths} by the item's
+    # fields; None when one of those is missing
+    def format_json(self, value, item):
+        missing = False
+
+        def substitute(match):
+            nonlocal missing
+            found = value
+            if match.group(1):
+                alternatives = (_json_value(item, path.split(".")) for path in match.group(1).split("|"))
+                found = next((alternative for alternative in alternatives if alternative not in (None, "")), None)
+            if found is None:
+                missing = True
+                return ""
+            return quote(str(found), safe=ENCODE_URI_SAFE) if self.json_encode else str(found)
+
+        raw = JSON_PLACEHOLDER_RE.sub(substitute, self.json_format)
+        return None if missing else raw
+
+    # Field value from the raw string read off the card (None: no tag)
+    def from_raw(self, raw):
+        if self.has_const:
+            return self.const
+        has_presence, present, missing = self.presence
+        if has_presence:
+            return present if raw is not None else missing
+        if raw is None:
+            return self.default
+        value, _ = self.convert(raw)
+        return value
+
+    def extract(self, card, found):
+        if self.has_const:
+            return self.const
+        return self.from_raw(self.find_raw(card, found))
+
+    # What the in-page extractor must read for this rule
+    def probe(self):
+        if self.has_const:
+            return {"selectors": [], "value": "text", "ignore_if": None}
+        value = f"attr:{self.attribute}" if self.attribute else ("compact_text" if self.compact else "text")
+        return {
+            "selectors": [selector.selector for selector in self.selectors],
+            "value": value,
+            "ignore_if": self.ignore_if,
+        }
+
+
+class DiscountStrategy(FieldRule):
+    def __init__(self, spec, selectors):
+        super().__init__(spec, selectors)
+        self.kind = spec.get("kind", "amount")
+        self.positive_only = spec.get("positive_only", False)
+        self.next_if_zero = spec.get("next_if_zero", False)
+        self.fallback = spec.get("fallback", 0.0)
+
+    # Returns None when the strategy does not apply to this card
+    def discount(self, card, found, product_price):
+        return self.discount_from_raw(self.find_raw(card, found), product_price)
+
+    def discount_from_raw(self, raw, product_price):
+        if raw is None:
+            return None
+        value, ok = self.convert(raw)
+        if self.kind != "price_difference" or not ok:
+            return value
+        if self.positive_only and value <= product_price:
+            return 0.0
+        return value - product_price
+
+
+class PageCountRule:
+    def __init__(self, spec):
+        self.kind = spec.get("kind", "max_page")
+        if self.kind not in PAGE_COUNT_KINDS:
+            raise ValueError(f"Unknown page count kind: {self.kind}")
+        self.selector = CompiledSelector(spec["selector"])
+
+    # Number of the last page, or None when the page does not tell
+    def last_page(self, soup, per_page):
+        if self.kind == "max_page":
+            numbers = [number for tag in self.selector.select(soup) for number in _numbers(tag.get_text())]
+            return max(numbers) if numbers else None
+        tag = self.selector.select_one(soup)
+        numbers = _numbers(tag.get_text()) if tag is not None else []
+        if not numbers or not per_page:
+            return None
+        return math.ceil(max(numbers) / per_page)
+
+
+class CompiledSpec:
+    def __init__(self, spec, fingerprint=""):
+        self.competitor = spec["competitor"]
+        self.fingerprint = fingerprint
+        self.selectors = {}
+        self.card_selector = CompiledSelector(spec["product_card"])
+        self.next_page_selector = CompiledSelector(spec["next_page"]) if spec.get("next_page") else None
+        self.next_page_css = spec.get("next_page")
+        self.page_count_rules = [PageCountRule(rule) for rule in spec.get("page_count", [])]
+        fields = spec["fields"]
+        self.fields = [
+            (name, FieldRule(fields[name], self.selectors))
+            for name in PRODUCT_FIELDS if name != "discount"
+        ]
+        discount = fields.get("discount", {})
+        self.discount_default = discount.get("default", 0.0)
+        self.discount_strategies = [DiscountStrategy(strategy, self.selectors) for strategy in discount.get("strategies", [])]
+
+    # Strategy results are evaluated lazily so later strategies only run
+    # (and report parse errors) when the earlier ones did not settle it
+    def pick_discount(self, discounts):
+        for discount, strategy in zip(discounts, self.discount_strategies):
+            if discount is None:
+                continue
+            if discount == 0.0 and strategy.next_if_zero:
+                continue
+            return discount
+        return self.discount_default
+
+    def build_product(self, values, category_name, subcategory_name):
+        category_id, sub_category_id = TAXONOMY.resolve(self.competitor, category_name, subcategory_name)
+        return ProductRecord(
+            competitor=self.competitor,
+            category=category_name,
+            sub_category=subcategory_name,
+            category_id=category_id,
+            sub_category_id=sub_category_id,
+            **values
+        )
+
+    # Extract one product from a card element
+    def extract_product(self, card, category_name, subcategory_name):
+        found = {}
+        values = {name: rule.extract(card, found) for name, rule in self.fields}
+        price = values["product_price"]
+        values["discount"] = self.pick_discount(
+            strategy.discount(card, found, price) for strategy in self.discount_strategies
+        )
+        return self.build_product(values, category_name, subcategory_name)
+
+    # Build a product from the raw strings an in-page extractor read, in the
+    # order given by browser_probes()
+    def product_from_raw(self, raws, category_name, subcategory_name):
+        field_count = len(self.fields)
+        values = {name: rule.from_raw(raw) for (name, rule), raw in zip(self.fields, raws[:field_count])}
+        price = values["product_price"]
+        values["discount"] = self.pick_discount(
+            strategy.discount_from_raw(raw, price)
+            for strategy, raw in zip(self.discount_strategies, raws[field_count:])
+        )
+        return self.build_product(values, category_name, subcategory_name)
+
+    # True when every field that is not a constant says where to find it in
+    # an API item, so products can be built from a JSON listing
+    @property
+    def has_json_fields(self):
+        rules = [rule for _, rule in self.fields] + self.discount_strategies
+        return all(rule.has_const or rule.json_keys for rule in rules)
+
+    def item_raws(self, item):
+        rules = [rule for _, rule in self.fields] + self.discount_strategies
+        return [rule.json_raw(item) for rule in rules]
+
+    # One line per product, only formatted when DEBUG logging is on
+    def _log_product(self, product_count, product_data):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Product #{product_count}: {product_data.product_name} | {product_data.product_price} "
+                f"(discount {product_data.discount}) | {product_data.category} - {product_data.sub_category} "
+                f"| {product_data.stock_status} | {product_data.product_url}"
+            )
+
+    def extract_products(self, soup, category_name, subcategory_name):
+        scraped_products = []
+        for product_count, card in enumerate(self.card_selector.select(soup), start=1):
+            product_data = self.extract_product(card, category_name, subcategory_name)
+            scraped_products.append(product_data)
+            self._log_product(product_count, product_data)
+        return scraped_products
+
+    def products_from_raw(self, rows, category_name, subcategory_name):
+        scraped_products = []
+        with stage("extract"):
+            for product_count, raws in enumerate(rows, start=1):
+                product_data = self.product_from_raw(raws, category_name, subcategory_name)
+                scraped_products.append(product_data)
+                self._log_product(product_count, product_data)
+        return scraped_products
+
+    def products_from_items(self, items, category_name, subcategory_name):
+        return self.products_from_raw([self.item_raws(item) for item in items], category_name, subcategory_name)
+
+    # Arguments for BROWSER_EXTRACT_JS: one probe per field, then one per
+    # discount strategy
+    def browser_args(self):
+        rules = [rule for _, rule in self.fields] + self.discount_strategies
+        return {
+            "card": self.card_selector.selector,
+            "probes": [rule.probe() for rule in rules],
+            "next_page": self.next_page_css,
+        }
+
+    # Parse a listing page into (products, has_next)
+    def parse_page(self, html, category_name, subcategory_name):
+        with stage("html"):
+            soup = parse_html(html)
+        with stage("extract"):
+            scraped_products = self.extract_products(soup, category_name, subcategory_name)
+        has_next = self.next_page_selector is not None and self.next_page_selector.select_one(soup) is not None
+        return scraped_products, has_next
+
+    # Last page of a listing as announced on one of its pages holding
+    # per_page products, or None when no page count rule matches
+    def last_page(self, html, per_page):
+        if not self.page_count_rules:
+            return None
+        soup = parse_html(html)
+        for rule in self.page_count_rules:
+            last_page = rule.last_page(soup, per_page)
+            if last_page:
+                return last_page
+        return None
+
+
+# In-page counterpart of CompiledSpec.parse_page for browser-rendered sites.
+# Run with page.evaluate(BROWSER_EXTRACT_JS, spec.browser_args()); it reads
+# the raw strings of every card in one round trip and returns
+# {rows, has_next, signature}, signature being the first card's text so the
+# caller can wait for the grid to change after paginating.
+BROWSER_EXTRACT_JS = """
+(args) => {
+  const compactText = (el) => {
+    const parts = [];
+    const walker = document.createTreeWalker(el, NodeFilter.SHOW_TEXT);
+    while (walker.nextNode()) {
+      const text = walker.currentNode.nodeValue.trim();
+      if (text) parts.push(text);
+    }
+    return parts.join("");
+  };
+  const read = (card, probe) => {
+    for (const selector of probe.selectors) {
+      const el = card.querySelector(selector);
+      if (!el) continue;
+      if (probe.ignore_if && el.getAttribute(probe.ignore_if.attr) === probe.ignore_if.equals) return null;
+      if (probe.value.startsWith("attr:")) return el.getAttribute(probe.value.slice(5)) ?? "";
+      if (probe.value === "compact_text") return compactText(el);
+      return el.textContent.trim();
+    }
+    return null;
+  };
+  const cards = Array.from(document.querySelectorAll(args.card));
+  return {
+    rows: cards.map((card) => args.probes.map((probe) => read(card, probe))),
+    has_next: args.next_page ? document.querySelector(args.next_page) !== null : false,
+    signature: cards.length ? cards[0].textContent : null,
+  };
+}
+"""
+
+
+# Load and compile extractionSpecs/<competitor>.json
+def load_spec(competitor):
+    path = SPECS_DIR / f"{competitor}.json"
+    raw = path.read_bytes()
+    engine_source = Path(__file__).read_bytes()
+    # Products also carry taxonomy IDs, so taxonomy edits invalidate caches
+    fingerprint = hashlib.sha1(raw + engine_source + TAXONOMY.fingerprint.encode("utf-8")).hexdigest()[:16]
+    return CompiledSpec(json.loads(raw.decode("utf-8")), fingerprint)
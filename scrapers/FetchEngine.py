@@ -0,0 +1,313 @@
+import asyncio
+import os
+import sys
+import time
+from urllib.parse import urlparse
+
+from BrowserPool import BROWSER, EMPTY, EMPTY_LISTING_SECONDS, HTTP, FetchModeStore, create_browser_pool
+from CrawlMetrics import METRICS, get_logger
+from HttpCache import DEFAULT_CACHE_DIR, HttpCache, parser_key
+from HostLimiter import HostLimiters
+from HttpClient import HttpStatusError, RetryPolicy, create_session, get_text
+from ProductShema import ProductRecord
+
+# Shared asyncio fetch engine used by the requests-based scrapers.
+# A global semaphore caps the number of requests in flight for the whole run
+# and a per-host adaptive limiter (HostLimiter) keeps a single competitor
+# from being hammered, starting from the per-host limit.
+# The limits can be overridden from the environment so that every scraper
+# picks up the same settings.
+# An optional page budget caps the listing requests of the whole crawl
+# (pages fetched, rendered or planned ahead): once it is spent no unit
+# starts or goes on, and the units cut short are reported to the metrics so
+# the crawl scheduler keeps them due and carries their products over.
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("SCRAPER_MAX_CONCURRENCY", "16"))
+DEFAULT_PER_HOST_LIMIT = int(os.environ.get("SCRAPER_PER_HOST_LIMIT", "4"))
+USE_HTTP_CACHE = os.environ.get("SCRAPER_HTTP_CACHE", "1") != "0"
+
+logger = get_logger("fetch")
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                "(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+}
+
+
+# Flatten a *Links.json mapping into (category, subcategory, url) units
+def iter_link_units(links):
+    for category_name, subcategories in links.items():
+        for subcategory_name, url in subcategories.items():
+            # Handle cases where URL is a list (some subcategories have multiple URLs)
+            urls = url if isinstance(url, list) else [url]
+            for single_url in urls:
+                if not single_url.startswith("http"):
+                    single_url = "https://" + single_url
+                yield category_name, subcategory_name, single_url
+
+
+# Product card selector of a spec-driven parser, waited for when a page has
+# to be rendered in the browser
+def spec_of(parse_page):
+    return getattr(sys.modules.get(parse_page.__module__), "SPEC", None)
+
+
+# Competitor a parser belongs to, for the metrics
+def competitor_of(parse_page):
+    spec = spec_of(parse_page)
+    if spec is not None:
+        return spec.competitor
+    module = parse_page.__module__
+    return module[: -len("Scraper")] if module.endswith("Scraper") else module
+
+
+def card_selector_of(parse_page):
+    spec = spec_of(parse_page)
+    return spec.card_selector.selector if spec is not None else None
+
+
+# Last page announced by a listing page, when its spec knows where to look
+def planned_last_page(parse_page, html, per_page):
+    spec = spec_of(parse_page)
+    return spec.last_page(html, per_page) if spec is not None else None
+
+
+# With a browser pool attached, pages whose static HTML has no product card
+# are rendered in the browser, and fetch_modes remembers per host/path which
+# of the two worked.
+class FetchEngine:
+    def __init__(self, headers=None, max_concurrency=None, per_host_limit=None, timeout=None, retry_policy=None, cache=None, sink=None,
+                 browser=None, fetch_modes=None, page_budget=None):
+        self.headers = headers or DEFAULT_HEADERS
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self.per_host_limit = per_host_limit or DEFAULT_PER_HOST_LIMIT
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.cache = cache
+        self.sink = sink
+        self.browser = browser
+        self.fetch_modes = fetch_modes if fetch_modes is not None else (FetchModeStore() if browser else None)
+        self.session = None
+        self._global_semaphore = None
+        self.limiters = HostLimiters(self.per_host_limit)
+        self.page_budget = page_budget
+        self.pages_requested = 0
+
+    async def __aenter__(self):
+        self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.session = create_session(self.headers, self.limiters.max_limit, self.timeout)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        if self.browser:
+            await self.browser.close()
+        if self.cache:
+            self.cache.save()
+        if self.fetch_modes:
+            self.fetch_modes.save()
+
+    # Count up to count listing requests against the page budget; returns
+    # how many of them may be made
+    def take_pages(self, count=1):
+        count = max(count, 0)
+        if self.page_budget is not None:
+            count = min(count, max(self.page_budget - self.pages_requested, 0))
+        self.pages_requested += count
+        return count
+
+    def _limiter(self, url):
+        return self.limiters.get(urlparse(url).netloc)
+
+    # Download a single page, waiting for a per-host and then a global slot,
+    # both held only while a request is in flight. The per-host limit adapts
+    # to how the host copes (see HostLimiter). Transient failures are retried
+    # by the client layer before giving up.
+    # With a cache attached the request is conditional; the returned flag
+    # tells whether the page is unchanged since the last run.
+    async def fetch_page(self, url):
+        headers = self.cache.conditional_headers(url) if self.cache else None
+        status, response_headers, text = await get_text(
+            self.session, url, self.retry_policy, headers, self._limiter(url), self._global_semaphore
+        )
+        if status == 304 and self.cache:
+            return self.cache.body(url), True
+        if status >= 400:
+            raise HttpStatusError(status)
+        unchanged = self.cache.store(url, response_headers, text) if self.cache else False
+        return text, unchanged
+
+    async def fetch(self, url):
+        html, _ = await self.fetch_page(url)
+        return html
+
+    async def render_page(self, url, wait_selector=None):
+        async with self._limiter(url).attempt() as slot, self._global_semaphore:
+            started = time.perf_counter()
+            html = await self.browser.render(url, wait_selector)
+            slot.succeeded(time.perf_counter() - started)
+            return html
+
+    # Fetch and parse a listing page over HTTP, or in the browser when its
+    # host/path is known to be rendered client-side. A page with no product
+    # whose mode is still unknown is tried once in the browser, budget
+    # permitting; when it has no product there either, the listing is
+    # remembered as empty for a while instead of rendered on every run.
+    # Returns (products, has_next, html).
+    async def fetch_listing(self, current_url, category_name, subcategory_name, parse_page):
+        mode = self.fetch_modes.get(current_url) if self.browser else None
+        if mode == BROWSER:
+            html = await self.render_page(current_url, card_selector_of(parse_page))
+            return (*self.parse(html, category_name, subcategory_name, parse_page), html)
+
+        html, unchanged = await self.fetch_page(current_url)
+        products, has_next = self.parse_cached(
+            current_url, html, unchanged, category_name, subcategory_name, parse_page
+        )
+        if not self.browser:
+            return products, has_next, html
+        if products:
+            self.fetch_modes.set(current_url, HTTP)
+        elif mode is None:
+            if not self.take_pages():
+                METRICS.observe_truncated(competitor_of(parse_page), category_name, subcategory_name)
+                return products, has_next, html
+            logger.info(f"No product card in the static HTML of {current_url}, rendering it in the browser")
+            try:
+                html = await self.render_page(current_url, card_selector_of(parse_page))
+            except Exception as e:
+                logger.warning(f"Browser fallback failed for {current_url}: {str(e)}")
+                return products, has_next, html
+            products, has_next = self.parse(html, category_name, subcategory_name, parse_page)
+            if products:
+                self.fetch_modes.set(current_url, BROWSER)
+            else:
+                self.fetch_modes.set(current_url, EMPTY, EMPTY_LISTING_SECONDS)
+        return products, has_next, html
+
+    # Parse a page, timing it for the metrics
+    def parse(self, html, category_name, subcategory_name, parse_page):
+        started = time.perf_counter()
+        result = parse_page(html, category_name, subcategory_name)
+        METRICS.observe_parse(competitor_of(parse_page), category_name, time.perf_counter() - started)
+        return result
+
+    # Parse a page, reusing the products stored in the cache when the page
+    # did not change since they were extracted
+    def parse_cached(self, current_url, html, unchanged, category_name, subcategory_name, parse_page):
+        if not self.cache:
+            return self.parse(html, category_name, subcategory_name, parse_page)
+        key = parser_key(parse_page, category_name, subcategory_name)
+        cached = self.cache.parsed(current_url, key) if unchanged else None
+        if cached is not None:
+            records, has_next = cached
+            return [ProductRecord(**record) for record in records], has_next
+        products, has_next = self.parse(html, category_name, subcategory_name, parse_page)
+        self.cache.store_parsed(current_url, key, [product.dict() for product in products], has_next)
+        return products, has_next
+
+    # Walk every page of one category URL.
+    # page_url(url, page_num) builds the listing URL of a page and
+    # parse_page(html, category_name, subcategory_name) returns the products
+    # found on it together with a flag telling if a next page exists.
+    # With a sink attached, products are streamed out page by page and the
+    # returned list stays empty.
+    # When the first page fetched announces the page count, every remaining
+    # page is requested at once; results are still consumed in page order,
+    # and "next" links are followed past the announced count if they go on.
+    async def crawl_url(self, url, category_name, subcategory_name, page_url, parse_page):
+        scraped_products = []
+        product_count = 0
+        competitor = competitor_of(parse_page)
+        checkpoint = self.sink.checkpoint if self.sink else None
+        page_num = checkpoint.next_page(category_name, subcategory_name, url) if checkpoint else 1
+        if page_num is None:
+            logger.info(f"Skipping {category_name} - {subcategory_name} ({url}): already done in checkpoint")
+            return scraped_products
+
+        logger.info(f"Scraping category: {category_name} - subcategory: {subcategory_name}")
+
+        # page number -> task already fetching it
+        planned = {}
+        planning_done = False
+        while True:
+            current_url = page_url(url, page_num)
+            logger.debug(f"Scraping page {page_num} - {current_url}")
+            task = planned.pop(page_num, None)
+            if task is None:
+                if not self.take_pages():
+                    logger.info(f"Request budget spent, stopping {category_name} - {subcategory_name} ({url}) at page {page_num}")
+                    METRICS.observe_truncated(competitor, category_name, subcategory_name)
+                    break
+                task = self.fetch_listing(current_url, category_name, subcategory_name, parse_page)
+            try:
+                products, has_next, html = await task
+            except Exception as e:
+                logger.error(f"Error scraping {current_url}: {str(e)}")
+                METRICS.observe_error(competitor, category_name)
+                break
+
+            if not products:
+                logger.debug(f"No products found on page {page_num} of {url}")
+                if checkpoint:
+                    checkpoint.record(category_name, subcategory_name, url, page_num, False, 0, self.sink)
+                break
+            product_count += len(products)
+            METRICS.observe_page(competitor, category_name, len(products), subcategory_name)
+            if self.sink:
+                self.sink.write_many(products)
+                # Nothing awaits between the write and the record, so the
+                # checkpointed offset always covers exactly the finished pages
+                if checkpoint:
+                    checkpoint.record(category_name, subcategory_name, url, page_num, has_next, len(products), self.sink)
+            else:
+                scraped_products.extend(products)
+
+            if not has_next:
+                logger.debug(f"No more pages after page {page_num} of {url}")
+                break
+
+            if not planning_done:
+                planning_done = True
+                last_page = planned_last_page(parse_page, html, len(products))
+                if last_page is not None and last_page > page_num + 1:
+                    # Pages past the budget are left to the loop, which stops there
+                    last_page = page_num + self.take_pages(last_page - page_num)
+                    logger.debug(f"{last_page} pages announced, fetching pages {page_num + 1}-{last_page} of {url} concurrently")
+                    for planned_num in range(page_num + 1, last_page + 1):
+                        planned[planned_num] = asyncio.ensure_future(self.fetch_listing(
+                            page_url(url, planned_num), category_name, subcategory_name, parse_page
+                        ))
+            page_num += 1
+
+        # The listing ended before the announced count: drop the extra pages
+        for task in planned.values():
+            task.cancel()
+        await asyncio.gather(*planned.values(), return_exceptions=True)
+
+        logger.info(f"Scraping completed for {subcategory_name}. Found {product_count} products across {page_num} pages.")
+        return scraped_products
+
+    # Crawl every unit of a *Links.json mapping concurrently
+    async def crawl_links(self, links, page_url, parse_page):
+        tasks = [
+            self.crawl_url(url, category_name, subcategory_name, page_url, parse_page)
+            for category_name, subcategory_name, url in iter_link_units(links)
+        ]
+        results = await asyncio.gather(*tasks)
+        return [product for products in results for product in products]
+
+
+# Blocking entry point used by the scrapers' main()
+def run_crawl(links, page_url, parse_page, headers=None, max_concurrency=None, per_host_limit=None,
+              use_cache=None, sink=None, use_browser=None, page_budget=None):
+    use_cache = USE_HTTP_CACHE if use_cache is None else use_cache
+    # One cache per scraper so parallel runs never share an index file
+    cache = HttpCache(DEFAULT_CACHE_DIR / parse_page.__module__) if use_cache else None
+
+    async def _run():
+        browser = create_browser_pool(use_browser)
+        async with FetchEngine(headers, max_concurrency, per_host_limit, cache=cache, sink=sink, browser=browser,
+                               page_budget=page_budget) as engine:
+            return await engine.crawl_links(links, page_url, parse_page)
+
+    return asyncio.run(_run())
@@ -0,0 +1,185 @@
+import asyncio
+import contextlib
+import os
+import time
+
+from CrawlMetrics import METRICS, get_logger
+
+# Adaptive per-host concurrency (AIMD) with a circuit breaker.
+# Every host starts at the configured per-host limit. Each request attempt
+# takes a slot and reports how it went:
+#   ok        the limit grows by one after a window of successes in a row
+#             (as many as the current limit, about one round trip) whose
+#             latency stays within LATENCY_TOLERANCE times the best latency
+#             seen for the host
+#   throttled 429, 5xx, timeout or connection error: the limit is halved,
+#             at most once per round trip since the requests in flight were
+#             all sent at the old limit; a Retry-After pauses the whole host
+# When the limit is already down to one request and BREAKER_FAILURES
+# attempts in a row still fail, the breaker opens: the host gets no request
+# for a cooldown, then a single probe is let through. A successful probe
+# closes the breaker and restarts from the minimum limit; a failed one
+# reopens it with twice the cooldown.
+# Requests wait while the breaker is open instead of failing, so a host
+# that recovers is crawled to the end.
+# Set SCRAPER_ADAPTIVE_LIMIT=0 to keep the fixed per-host limit.
+ADAPTIVE_LIMIT = os.environ.get("SCRAPER_ADAPTIVE_LIMIT", "1") != "0"
+MAX_PER_HOST_LIMIT = int(os.environ.get("SCRAPER_MAX_PER_HOST_LIMIT", "16"))
+MIN_PER_HOST_LIMIT = 1
+DECREASE_FACTOR = 0.5
+LATENCY_TOLERANCE = 2.0
+# Weight of the latest latency in the moving average
+LATENCY_SMOOTHING = 0.2
+BREAKER_FAILURES = int(os.environ.get("SCRAPER_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("SCRAPER_BREAKER_COOLDOWN", "30"))
+BREAKER_MAX_COOLDOWN = 300.0
+
+OK = "ok"
+THROTTLED = "throttled"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+logger = get_logger("limiter")
+
+
+class Attempt:
+    def __init__(self):
+        self.outcome = THROTTLED
+        self.retry_after = None
+        self.seconds = None
+
+    # seconds is the request's own latency, when the slot was also held
+    # while waiting for something else
+    def succeeded(self, seconds=None):
+        self.outcome = OK
+        self.seconds = seconds
+
+    def throttled(self, retry_after=None):
+        self.outcome = THROTTLED
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    def __init__(self, host, initial, min_limit=MIN_PER_HOST_LIMIT, max_limit=MAX_PER_HOST_LIMIT, adaptive=True):
+        self.host = host
+        self.adaptive = adaptive
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, initial)
+        self.limit = initial
+        self.in_flight = 0
+        self.window_successes = 0
+        self.last_decrease = 0.0
+        self.best_latency = None
+        self.latency = None
+        self.failures = 0
+        self.state = CLOSED
+        self.cooldown = BREAKER_COOLDOWN
+        self.blocked_until = 0.0
+        self._changed = asyncio.Condition()
+
+    def _can_start(self, now):
+        if now < self.blocked_until:
+            return False
+        if self.state == OPEN:
+            # Cooldown over: let one probe through
+            self.state = HALF_OPEN
+            return self.in_flight == 0
+        if self.state == HALF_OPEN:
+            return self.in_flight == 0
+        return self.in_flight < self.limit
+
+    async def acquire(self):
+        async with self._changed:
+            while True:
+                now = time.monotonic()
+                if self._can_start(now):
+                    self.in_flight += 1
+                    return
+                timeout = self.blocked_until - now if now < self.blocked_until else None
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, attempt, seconds):
+        async with self._changed:
+            self.in_flight -= 1
+            if self.adaptive:
+                if attempt.outcome == OK:
+                    self._on_success(seconds if attempt.seconds is None else attempt.seconds)
+                else:
+                    self._on_throttled(attempt.retry_after)
+            self._changed.notify_all()
+
+    # One request attempt holding a slot; the caller reports the outcome
+    @contextlib.asynccontextmanager
+    async def attempt(self):
+        await self.acquire()
+        attempt = Attempt()
+        started = time.monotonic()
+        try:
+            yield attempt
+        finally:
+            await self.release(attempt, time.monotonic() - started)
+
+    def _on_success(self, seconds):
+        self.failures = 0
+        if self.state != CLOSED:
+            logger.info(f"{self.host}: recovered, circuit closed at {self.min_limit} concurrent request(s)")
+            self.state = CLOSED
+            self.cooldown = BREAKER_COOLDOWN
+            self._set_limit(self.min_limit)
+            return
+        self.latency = seconds if self.latency is None else (
+            LATENCY_SMOOTHING * seconds + (1 - LATENCY_SMOOTHING) * self.latency
+        )
+        self.best_latency = seconds if self.best_latency is None else min(self.best_latency, seconds)
+        if self.latency > self.best_latency * LATENCY_TOLERANCE:
+            # Slower than the host can do: hold the limit
+            self.window_successes = 0
+            return
+        self.window_successes += 1
+        if self.window_successes >= self.limit and self.limit < self.max_limit:
+            self._set_limit(self.limit + 1)
+
+    def _on_throttled(self, retry_after):
+        now = time.monotonic()
+        self.failures += 1
+        self.window_successes = 0
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+        sustained = self.failures >= BREAKER_FAILURES and self.limit == self.min_limit
+        if self.state == HALF_OPEN or (self.state == CLOSED and sustained):
+            if self.state == HALF_OPEN:
+                self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+            self.state = OPEN
+            self.blocked_until = max(self.blocked_until, now + self.cooldown)
+            METRICS.observe_breaker(self.host)
+            logger.warning(f"{self.host}: {self.failures} failed requests in a row, pausing it for {self.cooldown:g}s")
+            return
+        if now - self.last_decrease >= (self.latency or 0.0):
+            self.last_decrease = now
+            self._set_limit(max(self.min_limit, int(self.limit * DECREASE_FACTOR)))
+
+    def _set_limit(self, limit):
+        if limit != self.limit:
+            logger.debug(f"{self.host}: concurrency {self.limit} -> {limit}")
+        self.limit = limit
+        self.window_successes = 0
+        METRICS.observe_limit(self.host, limit)
+
+
+# One limiter per host, created on first use
+class HostLimiters:
+    def __init__(self, initial, adaptive=None):
+        self.initial = initial
+        self.adaptive = ADAPTIVE_LIMIT if adaptive is None else adaptive
+        self.max_limit = MAX_PER_HOST_LIMIT if self.adaptive else initial
+        self._limiters = {}
+
+    def get(self, host):
+        if host not in self._limiters:
+            self._limiters[host] = AdaptiveLimiter(host, self.initial, max_limit=self.max_limit, adaptive=self.adaptive)
+        return self._limiters[host]
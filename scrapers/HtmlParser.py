@@ -0,0 +1,163 @@
+import os
+
+import soupsieve
+from bs4 import BeautifulSoup
+
+# Pluggable HTML parsing layer for the scrapers.
+# parse_html() returns a document exposing the small part of the
+# BeautifulSoup API the scrapers rely on: select(), select_one(), .text,
+# get_text(), get() and ["attr"]. The backend is picked with the
+# SCRAPER_HTML_PARSER environment variable:
+#   auto        selectolax if installed, else lxml, else html.parser (default)
+#   selectolax  C-backed lexbor parser and CSS engine
+#   lxml        BeautifulSoup on top of the lxml tree builder
+#   html.parser the original pure-Python BeautifulSoup path
+PARSER_BACKEND = os.environ.get("SCRAPER_HTML_PARSER", "auto")
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml  # noqa: F401
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+
+# Elements whose content BeautifulSoup leaves out of .text and get_text()
+NON_TEXT_TAGS = frozenset(("script", "style"))
+# Elements inside which BeautifulSoup keeps whitespace-only strings as they are
+PRESERVE_WHITESPACE_TAGS = frozenset(("pre", "textarea"))
+SLOW_TEXT_SELECTOR = ", ".join(sorted(NON_TEXT_TAGS | PRESERVE_WHITESPACE_TAGS))
+ASCII_SPACES = " \n\t\x0c\r"
+# lexbor drops NUL characters from text, so it safely separates text nodes
+TEXT_NODE_SEPARATOR = "\x00"
+
+
+# BeautifulSoup stores a string made only of ASCII whitespace as a single
+# newline, or a single space when it has no newline
+def bs4_string(text):
+    if text.strip(ASCII_SPACES):
+        return text
+    return "\n" if "\n" in text else " "
+
+
+# Text nodes under a selectolax node, as BeautifulSoup stores them
+def _bs4_strings(node, preserve):
+    for child in node.iter(include_text=True):
+        if child.tag == "-text":
+            text = child.text_content
+            if text:
+                yield text if preserve else bs4_string(text)
+        elif child.tag not in NON_TEXT_TAGS:
+            yield from _bs4_strings(child, preserve or child.tag in PRESERVE_WHITESPACE_TAGS)
+
+
+# The few nodes of a selectolax page whose text cannot come from lexbor's
+# text() as is, found once per page: the ancestors of script, style and
+# whitespace-preserving elements, and the nodes inside the latter
+class SelectolaxDocument:
+    __slots__ = ("walked", "preserved")
+
+    def __init__(self, root):
+        self.walked = set()
+        self.preserved = set()
+        for node in root.css(SLOW_TEXT_SELECTOR):
+            if node.tag in PRESERVE_WHITESPACE_TAGS:
+                self.preserved.update(child.mem_id for child in node.traverse())
+            parent = node.parent
+            while parent is not None and parent.mem_id not in self.walked:
+                self.walked.add(parent.mem_id)
+                parent = parent.parent
+
+
+# Wrap a selectolax node so it reads like a BeautifulSoup Tag
+class SelectolaxNode:
+    __slots__ = ("node", "document")
+
+    def __init__(self, node, document):
+        self.node = node
+        self.document = document
+
+    def select(self, selector):
+        return [SelectolaxNode(node, self.document) for node in self.node.css(selector)]
+
+    def select_one(self, selector):
+        node = self.node.css_first(selector)
+        return SelectolaxNode(node, self.document) if node is not None else None
+
+    @property
+    def text(self):
+        return self.get_text()
+
+    # lexbor keeps whitespace-only text as is and includes script and style
+    # content in text(); both are brought in line with BeautifulSoup. Text
+    # nodes are split out of one C text() call, except under the nodes the
+    # document marked, which are walked
+    def get_text(self, separator="", strip=False):
+        node = self.node
+        if node.tag in NON_TEXT_TAGS:
+            # BeautifulSoup keeps the content of the script or style itself
+            strings = [node.text(deep=True)]
+        elif node.mem_id in self.document.walked or node.mem_id in self.document.preserved:
+            strings = _bs4_strings(node, node.mem_id in self.document.preserved)
+        else:
+            text = node.text(deep=True, separator=TEXT_NODE_SEPARATOR)
+            strings = [bs4_string(string) for string in text.split(TEXT_NODE_SEPARATOR) if string]
+        if strip:
+            strings = [string.strip() for string in strings]
+            strings = [string for string in strings if string]
+        return separator.join(strings)
+
+    def get(self, attribute, default=None):
+        value = self.node.attributes.get(attribute, default)
+        return default if value is None else value
+
+    def __getitem__(self, attribute):
+        value = self.node.attributes[attribute]
+        return "" if value is None else value
+
+
+# A CSS selector compiled once and applied to many nodes of either backend.
+# soupsieve compiles the selector for BeautifulSoup trees; lexbor takes the
+# selector string directly.
+class CompiledSelector:
+    __slots__ = ("selector", "pattern")
+
+    def __init__(self, selector):
+        self.selector = selector
+        self.pattern = soupsieve.compile(selector)
+
+    def select(self, node):
+        if isinstance(node, SelectolaxNode):
+            return node.select(self.selector)
+        return self.pattern.select(node)
+
+    def select_one(self, node):
+        if isinstance(node, SelectolaxNode):
+            return node.select_one(self.selector)
+        return self.pattern.select_one(node)
+
+
+def resolve_backend(backend=None):
+    backend = backend or PARSER_BACKEND
+    if backend == "auto":
+        if LexborHTMLParser is not None:
+            return "selectolax"
+        return "lxml" if HAS_LXML else "html.parser"
+    if backend == "selectolax" and LexborHTMLParser is None:
+        raise ImportError("SCRAPER_HTML_PARSER=selectolax but selectolax is not installed")
+    if backend == "lxml" and not HAS_LXML:
+        raise ImportError("SCRAPER_HTML_PARSER=lxml but lxml is not installed")
+    return backend
+
+
+# Parse a page with the configured backend
+def parse_html(html, backend=None):
+    backend = resolve_backend(backend)
+    if backend == "selectolax":
+        root = LexborHTMLParser(html).root
+        return SelectolaxNode(root, SelectolaxDocument(root))
+    return BeautifulSoup(html, backend)
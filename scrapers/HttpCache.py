@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# On-disk HTTP cache for category listing pages.
+# For every URL we keep the ETag / Last-Modified validators, a hash of the
+# body and the products parsed from it. The next run sends a conditional
+# request; when the server answers 304, or the body hash did not move, the
+# stored products are reused and the page is not parsed again.
+# The cache is capped in size and evicts the least recently used URLs.
+DEFAULT_CACHE_DIR = Path(__file__).parent / ".cache" / "http"
+DEFAULT_MAX_BYTES = int(os.environ.get("SCRAPER_HTTP_CACHE_MAX_MB", "200")) * 1024 * 1024
+
+
+def _url_key(url):
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+# Identify the parser and the category a parse result was built with, so a
+# change to the scraper's code invalidates the cached products.
+def parser_key(parse_page, category_name, subcategory_name):
+    module = sys.modules.get(parse_page.__module__)
+    source_file = getattr(module, "__file__", None)
+    source = Path(source_file).read_bytes() if source_file else parse_page.__qualname__.encode("utf-8")
+    # Spec-driven scrapers also depend on their extraction spec
+    spec = getattr(module, "SPEC", None)
+    if spec is not None:
+        source += spec.fingerprint.encode("utf-8")
+    digest = hashlib.sha1(source).hexdigest()[:16]
+    return f"{parse_page.__qualname__}:{digest}:{category_name}:{subcategory_name}"
+
+
+class HttpCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.cache_dir / "index.json"
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.index = {}
+
+    # Headers turning the next request for this URL into a conditional GET
+    def conditional_headers(self, url):
+        entry = self.index.get(url)
+        if not entry or not (self.cache_dir / f"{entry['key']}.html").exists():
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def body(self, url):
+        entry = self.index[url]
+        entry["last_access"] = time.time()
+        return (self.cache_dir / f"{entry['key']}.html").read_text(encoding="utf-8")
+
+    # Record a fresh 200 response. Returns True when the body is identical to
+    # the cached one, in which case the stored parse result is still valid.
+    def store(self, url, headers, text):
+        body_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        entry = self.index.get(url)
+        unchanged = entry is not None and entry.get("body_hash") == body_hash
+        if entry is None:
+            entry = self.index[url] = {"key": _url_key(url)}
+        if not unchanged:
+            (self.cache_dir / f"{entry['key']}.html").write_text(text, encoding="utf-8")
+            entry["body_hash"] = body_hash
+            entry["size"] = len(text.encode("utf-8"))
+            entry.pop("parsed_size", None)
+            self._parsed_path(entry).unlink(missing_ok=True)
+        entry["etag"] = headers.get("ETag")
+        entry["last_modified"] = headers.get("Last-Modified")
+        entry["last_access"] = time.time()
+        return unchanged
+
+    def _parsed_path(self, entry):
+        return self.cache_dir / f"{entry['key']}.parsed.json"
+
+    # Parsed products of an unchanged page, or None if the page must be parsed.
+    # parser_key identifies the parser and category the result was built with.
+    def parsed(self, url, parser_key):
+        entry = self.index.get(url)
+        if not entry or entry.get("parser_key") != parser_key:
+            return None
+        try:
+            with open(self._parsed_path(entry), 'r', encoding='utf-8') as f:
+                parsed = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return parsed["records"], parsed["has_next"]
+
+    def store_parsed(self, url, parser_key, records, has_next):
+        entry = self.index[url]
+        path = self._parsed_path(entry)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"records": records, "has_next": has_next}, f, ensure_ascii=False)
+        entry["parser_key"] = parser_key
+        entry["parsed_size"] = path.stat().st_size
+
+    # Drop least recently used URLs until the cache fits its size cap
+    def evict(self):
+        total = sum(entry.get("size", 0) + entry.get("parsed_size", 0) for entry in self.index.values())
+        for url, entry in sorted(self.index.items(), key=lambda item: item[1].get("last_access", 0)):
+            if total <= self.max_bytes:
+                break
+            (self.cache_dir / f"{entry['key']}.html").unlink(missing_ok=True)
+            self._parsed_path(entry).unlink(missing_ok=True)
+            total -= entry.get("size", 0) + entry.get("parsed_size", 0)
+            del self.index[url]
+
+    def save(self):
+        self.evict()
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
@@ -0,0 +1,144 @@
+import asyncio
+import contextlib
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse, urlunparse
+
+import aiohttp
+
+from CrawlMetrics import METRICS, get_logger
+from HostLimiter import Attempt
+
+# Reusable HTTP client layer shared by the scrapers.
+# One aiohttp session keeps a pool of keep-alive connections per competitor
+# host, negotiates compressed responses and retries transient failures with
+# a bounded exponential backoff that honours Retry-After.
+DEFAULT_TIMEOUT = float(os.environ.get("SCRAPER_REQUEST_TIMEOUT", "30"))
+DEFAULT_MAX_RETRIES = int(os.environ.get("SCRAPER_MAX_RETRIES", "3"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Base URL of a local ReplayServer. When set, every competitor URL is
+# requested from it as <replay url>/<host>/<path> instead of the live site.
+REPLAY_URL = os.environ.get("SCRAPER_REPLAY_URL", "").rstrip("/")
+
+logger = get_logger("http")
+
+# aiohttp only decodes brotli when the Brotli package is installed
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+
+class HttpStatusError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class RetryableStatus(HttpStatusError):
+    def __init__(self, status, retry_after=None):
+        super().__init__(status)
+        self.retry_after = retry_after
+
+
+class RetryPolicy:
+    def __init__(self, max_retries=None, backoff_base=0.5, backoff_max=30.0):
+        self.max_retries = DEFAULT_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    # Delay before the given retry attempt (1-based), with full jitter
+    def delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+# Parse a Retry-After header given either in seconds or as an HTTP date
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+# Where a URL is actually requested from
+def replay_url(url):
+    if not REPLAY_URL:
+        return url
+    parts = urlparse(url)
+    return urlunparse(urlparse(f"{REPLAY_URL}/{parts.netloc}{parts.path or '/'}")._replace(query=parts.query))
+
+
+@contextlib.asynccontextmanager
+async def _no_limit():
+    yield Attempt()
+
+
+# Build a pooled session: connections are reused per host and capped so the
+# pool never opens more sockets to one competitor than we allow requests.
+def create_session(headers, per_host_limit, timeout=None):
+    connector = aiohttp.TCPConnector(
+        limit=0,
+        limit_per_host=per_host_limit,
+        keepalive_timeout=60,
+        ttl_dns_cache=300,
+    )
+    session_headers = {"Accept-Encoding": ACCEPT_ENCODING, **headers}
+    client_timeout = aiohttp.ClientTimeout(total=timeout or DEFAULT_TIMEOUT)
+    return aiohttp.ClientSession(headers=session_headers, connector=connector, timeout=client_timeout)
+
+
+# GET a URL with retries. Returns (status, headers, text).
+# Network errors, timeouts and retryable statuses are retried; other server
+# errors raise HttpStatusError at once, and anything else is returned to the
+# caller as is. With a limiter (see HostLimiter), every attempt waits for a
+# slot of the host and reports how it went. The gate (the fetch engine's
+# global semaphore) is only taken once the host lets the attempt start, and
+# neither is held during the backoff between attempts.
+async def get_text(session, url, retry_policy, headers=None, limiter=None, gate=None):
+    attempt = 0
+    while True:
+        try:
+            async with limiter.attempt() if limiter else _no_limit() as slot, gate or contextlib.nullcontext():
+                started = time.perf_counter()
+                async with session.get(replay_url(url), headers=headers) as response:
+                    if response.status in RETRY_STATUSES or response.status >= 500:
+                        METRICS.observe_fetch(url, time.perf_counter() - started, response.status, 0)
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        slot.throttled(retry_after)
+                        if response.status in RETRY_STATUSES:
+                            raise RetryableStatus(response.status, retry_after)
+                        raise HttpStatusError(response.status)
+                    body = await response.read()
+                    text = await response.text()
+                    seconds = time.perf_counter() - started
+                    METRICS.observe_fetch(url, seconds, response.status, len(body))
+                    slot.succeeded(seconds)
+                    return response.status, response.headers, text
+        except (aiohttp.ClientError, asyncio.TimeoutError, RetryableStatus) as e:
+            if not isinstance(e, RetryableStatus):
+                METRICS.observe_fetch_error(url)
+            attempt += 1
+            if attempt > retry_policy.max_retries:
+                raise
+            METRICS.observe_retry(url)
+            retry_after = e.retry_after if isinstance(e, RetryableStatus) else None
+            delay = retry_policy.delay(attempt, retry_after)
+            logger.warning(f"Retrying {url} in {delay:.1f}s (attempt {attempt}/{retry_policy.max_retries}): {e}")
+            await asyncio.sleep(delay)
@@ -0,0 +1,145 @@
+import argparse
+import importlib.util
+import json
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+from CrawlMetrics import METRICS, flush_logging
+from CrawlScheduler import allocate_budget, set_budget
+from Profiler import profiler
+
+# Run every competitor scraper at the same time and collect one run report.
+# A scraper is registered by dropping a <Competitor>Scraper.py file exposing a
+# main() function into scrapers/; files without main() are ignored. A
+# scraper declaring NIGHTLY = False (WikiScraper, whose selectors are not
+# verified yet) is left out of the default set and only runs when named.
+# With --budget, the listing requests of the whole run are shared between
+# the competitors by CrawlScheduler: the subcategories of every competitor
+# compete on priority, and a competitor with nothing due is skipped. The
+# share a competitor won also caps its fetch engine, which stops requesting
+# pages once it is spent whatever the estimates were.
+SCRAPERS_DIR = Path(__file__).parent / "scrapers"
+OUTPUT_DIR = Path(__file__).parent / "output"
+
+
+# The module is registered under its name like a regular import, so code
+# looking a scraper module up through sys.modules finds it
+def load_scraper_module(path):
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# Find the registered scrapers, keyed by competitor name; with nightly_only
+# the ones opted out of the default run are skipped
+def discover_scrapers(nightly_only=False):
+    scrapers = {}
+    for path in sorted(SCRAPERS_DIR.glob("*Scraper.py")):
+        # testScraper.py and friends are ad-hoc scripts, not competitors
+        if not path.stem[0].isupper():
+            continue
+        source = path.read_text(encoding="utf-8")
+        if not re.search(r"^def main\(", source, re.M):
+            continue
+        if nightly_only and re.search(r"^NIGHTLY = False", source, re.M):
+            continue
+        scrapers[path.stem[: -len("Scraper")]] = path
+    return scrapers
+
+
+# Worker entry point: run one scraper and report how it went. Its log
+# records are written out before the result goes back to the parent.
+def run_scraper(competitor, path, profile=False, budget=None):
+    started = time.perf_counter()
+    result = {"competitor": competitor, "status": "ok", "products": None, "error": None}
+    try:
+        if budget is not None:
+            set_budget(competitor, budget)
+        module = load_scraper_module(Path(path))
+        with profiler(competitor, profile):
+            result["products"] = module.main()
+        result["metrics"] = METRICS.summary(competitor)
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    finally:
+        flush_logging()
+    result["duration_seconds"] = round(time.perf_counter() - started, 2)
+    return result
+
+
+def run_all(competitors, workers, executor="process", profile=False, budget=None):
+    scrapers = discover_scrapers()
+    unknown = [name for name in competitors if name not in scrapers]
+    if unknown:
+        raise SystemExit(f"Unknown scraper(s): {', '.join(unknown)}. Available: {', '.join(scrapers)}")
+    selected = {name: scrapers[name] for name in (competitors or discover_scrapers(nightly_only=True))}
+    budgets = allocate_budget(list(selected), budget) if budget is not None else {}
+    results = []
+    for name, share in budgets.items():
+        if share == 0:
+            del selected[name]
+            results.append({"competitor": name, "status": "skipped", "products": 0, "error": None, "duration_seconds": 0})
+            print(f"[{name}] skipped: nothing due within the budget")
+
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    with pool_class(max_workers=workers or len(selected) or 1) as pool:
+        futures = {
+            pool.submit(run_scraper, name, str(path), profile, budgets.get(name)): name for name, path in selected.items()
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{result['competitor']}] {result['status']} in {result['duration_seconds']}s")
+
+    results.sort(key=lambda result: result["competitor"])
+    return {
+        "started_at": started_at.isoformat(),
+        "duration_seconds": round(time.perf_counter() - started, 2),
+        "workers": workers or len(selected),
+        "executor": executor,
+        "request_budget": budget,
+        "budgets": budgets,
+        "succeeded": sum(1 for result in results if result["status"] == "ok"),
+        "skipped": sum(1 for result in results if result["status"] == "skipped"),
+        "failed": sum(1 for result in results if result["status"] == "failed"),
+        "scrapers": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run all competitor scrapers in parallel")
+    parser.add_argument("competitors", nargs="*", help="Only run these competitors (default: all but NIGHTLY = False ones)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of scrapers running at once")
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    parser.add_argument("--report", type=Path, default=OUTPUT_DIR / "RunReport.json")
+    parser.add_argument("--profile", action="store_true", help="Profile every scraper (see Profiler.py)")
+    parser.add_argument("--budget", type=int, default=None,
+                        help="Listing requests for the whole run, shared by change rate (see CrawlScheduler.py)")
+    args = parser.parse_args()
+
+    report = run_all(args.competitors, args.workers, args.executor, args.profile, args.budget)
+
+    args.report.parent.mkdir(exist_ok=True)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"\nRun finished in {report['duration_seconds']}s: "
+          f"{report['succeeded']} succeeded, {report['skipped']} skipped, {report['failed']} failed")
+    print(f"Run report saved to {args.report}")
+    if report["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
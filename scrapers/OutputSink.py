@@ -0,0 +1,128 @@
+import gzip
+import json
+import os
+from pathlib import Path
+
+from ProductShema import validate_records
+from Profiler import stage
+
+# Streaming product output.
+# NdjsonSink writes every product as one JSON line as soon as its page is
+# parsed instead of keeping the whole catalog in memory. Lines go to a
+# "<name>.part" file that is atomically renamed to its final name when the
+# run finishes, so a crashed run still leaves a readable partial file and a
+# finished one never exposes a half-written snapshot.
+# With compression each batch is appended as its own gzip member; the
+# concatenated members form a valid .gz file that gzip.open() reads back.
+OUTPUT_DIR = Path(__file__).parent / "output"
+COMPRESS_OUTPUT = os.environ.get("SCRAPER_OUTPUT_COMPRESS", "0") == "1"
+
+
+# Where a competitor's snapshot is written
+def output_path(competitor, compress=None):
+    compress = COMPRESS_OUTPUT if compress is None else compress
+    return OUTPUT_DIR / f"{competitor}Products.ndjson{'.gz' if compress else ''}"
+
+
+# An optional CheckpointStore makes the sink resumable: an interrupted run's
+# .part file is truncated to the last checkpointed offset and appended to.
+# An optional DeltaOutput.DeltaTracker sees every written product and
+# records how it differs from the previous snapshot.
+class NdjsonSink:
+    def __init__(self, path, compress=None, checkpoint=None, delta=None):
+        self.path = Path(path)
+        self.compress = self.path.suffix == ".gz" if compress is None else compress
+        self.part_path = self.path.with_name(self.path.name + ".part")
+        self.checkpoint = checkpoint
+        self.delta = delta
+        self.count = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        resume_point = checkpoint.resume_point(self.part_path) if checkpoint else None
+        if resume_point is not None:
+            offset, self.count = resume_point
+            self._file = open(self.part_path, 'r+b')
+            self._file.truncate(offset)
+            self._file.seek(offset)
+            # Products kept from the interrupted run are compared again
+            if delta:
+                delta.observe_many(list(read_products(self.part_path)))
+        else:
+            self._file = open(self.part_path, 'wb')
+
+    # Bytes written so far, used as the resume point of a checkpoint
+    @property
+    def offset(self):
+        return self._file.tell()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Keep the partial output (and checkpoint) around for a resume
+            self._file.close()
+            if self.checkpoint:
+                self.checkpoint.close()
+            if self.delta:
+                self.delta.abort()
+
+    # Write one page worth of products in a single call. Products are built
+    # without validation while scraping, the whole page is validated here.
+    def write_many(self, products):
+        with stage("validate"):
+            records = validate_records([product if isinstance(product, dict) else product.dict() for product in products])
+        if not records:
+            return
+        with stage("write"):
+            lines = [json.dumps(record, ensure_ascii=False) for record in records]
+            data = ("\n".join(lines) + "\n").encode("utf-8")
+            self._file.write(gzip.compress(data) if self.compress else data)
+            self._file.flush()
+        self.count += len(lines)
+        if self.delta:
+            with stage("delta"):
+                self.delta.observe_many(records)
+
+    def write(self, product):
+        self.write_many([product])
+
+    # Flush to disk and atomically move the file to its final name
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        if self.delta:
+            self.delta.finish()
+        os.replace(self.part_path, self.path)
+        if self.checkpoint:
+            self.checkpoint.clear()
+
+
+# Iterate the product dicts of a snapshot, whatever format it was saved in:
+# the legacy indented JSON array, NDJSON, gzipped NDJSON or a .part file
+def read_products(path):
+    path = Path(path)
+    name = path.name[: -len(".part")] if path.name.endswith(".part") else path.name
+    if name.endswith(".json"):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+    opener = gzip.open if name.endswith(".gz") else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+# Most recent snapshot of a competitor, NDJSON or legacy JSON
+def find_snapshot(competitor, output_dir=OUTPUT_DIR):
+    candidates = [
+        output_dir / f"{competitor}Products.ndjson",
+        output_dir / f"{competitor}Products.ndjson.gz",
+        output_dir / f"{competitor}Products.json",
+    ]
+    existing = [candidate for candidate in candidates if candidate.exists()]
+    return max(existing, key=lambda candidate: candidate.stat().st_mtime) if existing else None
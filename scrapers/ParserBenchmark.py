@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import re
+import time
+import tracemalloc
+from pathlib import Path
+
+from BrowserPool import create_browser_pool
+from ExtractionSpec import load_spec
+from FetchEngine import FetchEngine, iter_link_units
+from HtmlParser import parse_html, resolve_backend
+from HttpCache import DEFAULT_CACHE_DIR
+from Orchestrator import discover_scrapers
+from ProductShema import validate_records
+
+# Offline benchmark of the listing page parsers.
+# Listing pages of every competitor are recorded once into
+# benchmarks/<Competitor>/<fixture>.html.gz, next to a golden
+# <fixture>.json holding the products (and next-page flag) they must parse
+# into. A run then parses every fixture without touching the network and
+# reports, per competitor:
+#   products/sec  best of --repeat runs of the competitor's parse_page
+#   field times   microseconds per card spent in each field rule; a selector
+#                 shared by several fields is charged to the first one
+#   peak memory   tracemalloc peak while parsing one fixture
+#   golden        whether the output still equals the golden JSON
+# A run fails (exit status 1) when a fixture no longer matches its golden
+# file, or when throughput drops or peak memory grows by more than the
+# tolerance compared to the baseline saved with --save-baseline. The
+# baseline depends on the machine, so it lives in the local cache.
+# The committed fixtures hold the first two subcategories of every verified
+# competitor, rebuilt in each site's listing markup from the products of
+# output/<Competitor>Products.json. Their golden files were produced by the
+# bs4 scrapers the extraction specs replaced, so a spec drifting from the
+# original parsing fails the run; --record swaps them for live captures.
+# Megapc is left out: its cards are read inside the browser by
+# BROWSER_EXTRACT_JS, or built from its JSON listing API, so parse_page on
+# static HTML is not what runs in production. The json item mapping could
+# be timed instead once a listing API payload has been captured.
+#   python ParserBenchmark.py --record [competitors] [--pages N]
+#   python ParserBenchmark.py [competitors] [--save-baseline]
+#   python ParserBenchmark.py --update-golden [competitors]
+FIXTURES_DIR = Path(__file__).parent / "benchmarks"
+LINKS_DIR = Path(__file__).parent / "categorieLinks"
+BASELINE_PATH = DEFAULT_CACHE_DIR.parent / "benchmark_baseline.json"
+DEFAULT_TOLERANCE = float(os.environ.get("SCRAPER_BENCH_TOLERANCE", "0.25"))
+DEFAULT_REPEAT = 5
+DEFAULT_RECORD_PAGES = 2
+NOT_BENCHMARKED = {"Megapc": "extracted in the browser or from its JSON API, not by parse_page"}
+
+
+def fixture_name(category_name, subcategory_name):
+    return re.sub(r"[^a-z0-9]+", "-", f"{category_name} {subcategory_name}".lower()).strip("-")
+
+
+def benchmarked_competitors(selected=None):
+    competitors = [
+        name for name in discover_scrapers()
+        if (Path(__file__).parent / "extractionSpecs" / f"{name}.json").exists() and name not in NOT_BENCHMARKED
+    ]
+    if selected:
+        for name in selected:
+            if name in NOT_BENCHMARKED:
+                raise SystemExit(f"{name} is not benchmarked: {NOT_BENCHMARKED[name]}")
+        unknown = [name for name in selected if name not in competitors]
+        if unknown:
+            raise SystemExit(f"Unknown competitor(s): {', '.join(unknown)}. Available: {', '.join(competitors)}")
+        competitors = [name for name in competitors if name in selected]
+    return competitors
+
+
+def golden_data(spec, fixture):
+    products, has_next = spec.parse_page(fixture["html"], fixture["category"], fixture["sub_category"])
+    return {
+        "url": fixture["url"],
+        "category": fixture["category"],
+        "sub_category": fixture["sub_category"],
+        "has_next": has_next,
+        "products": validate_records([product.dict() for product in products]),
+    }
+
+
+def write_golden(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+# Recorded fixtures of a competitor: html plus the golden data next to it
+def load_fixtures(competitor):
+    fixtures = []
+    for html_path in sorted((FIXTURES_DIR / competitor).glob("*.html.gz")):
+        golden_path = html_path.with_name(html_path.name[: -len(".html.gz")] + ".json")
+        with open(golden_path, 'r', encoding='utf-8') as f:
+            golden = json.load(f)
+        fixtures.append({
+            "name": golden_path.stem,
+            "html": gzip.decompress(html_path.read_bytes()).decode("utf-8"),
+            "url": golden["url"],
+            "category": golden["category"],
+            "sub_category": golden["sub_category"],
+            "golden": golden,
+            "golden_path": golden_path,
+        })
+    return fixtures
+
+
+# Download the first listing page of a few subcategories of a competitor,
+# rendering it in the browser when the static HTML has no product card
+async def record_competitor(competitor, pages):
+    spec = load_spec(competitor)
+    with open(LINKS_DIR / f"{competitor}Links.json", 'r', encoding='utf-8') as f:
+        links = json.load(f)
+    units = list(iter_link_units(links))[:pages]
+    directory = FIXTURES_DIR / competitor
+    directory.mkdir(parents=True, exist_ok=True)
+    async with FetchEngine(browser=create_browser_pool()) as engine:
+        for category_name, subcategory_name, url in units:
+            try:
+                html = await engine.fetch(url)
+                if not spec.card_selector.select(parse_html(html)) and engine.browser:
+                    html = await engine.render_page(url, spec.card_selector.selector)
+            except Exception as e:
+                print(f"[{competitor}] Could not record {url}: {str(e)}")
+                continue
+            name = fixture_name(category_name, subcategory_name)
+            (directory / f"{name}.html.gz").write_bytes(gzip.compress(html.encode("utf-8")))
+            fixture = {"html": html, "url": url, "category": category_name, "sub_category": subcategory_name}
+            golden = golden_data(spec, fixture)
+            write_golden(directory / f"{name}.json", golden)
+            print(f"[{competitor}] Recorded {name}: {len(golden['products'])} products")
+
+
+# Time spent in each field rule, in seconds, over every card of the fixtures
+def field_times(spec, fixtures):
+    timings = {name: 0.0 for name, _ in spec.fields}
+    timings["discount"] = 0.0
+    cards = 0
+    clock = time.perf_counter
+    for fixture in fixtures:
+        for card in spec.card_selector.select(parse_html(fixture["html"])):
+            cards += 1
+            found = {}
+            values = {}
+            for name, rule in spec.fields:
+                started = clock()
+                values[name] = rule.extract(card, found)
+                timings[name] += clock() - started
+            started = clock()
+            spec.pick_discount(
+                strategy.discount(card, found, values["product_price"]) for strategy in spec.discount_strategies
+            )
+            timings["discount"] += clock() - started
+    return timings, cards
+
+
+def benchmark_competitor(competitor, fixtures, repeat):
+    spec = load_spec(competitor)
+    mismatches = []
+    for fixture in fixtures:
+        golden = golden_data(spec, fixture)
+        expected = fixture["golden"]
+        if golden["has_next"] != expected["has_next"]:
+            mismatches.append(f"{fixture['name']}: has_next {golden['has_next']} != {expected['has_next']}")
+        if golden["products"] != expected["products"]:
+            mismatches.append(f"{fixture['name']}: {describe_difference(golden['products'], expected['products'])}")
+
+    products = 0
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        products = sum(
+            len(spec.parse_page(fixture["html"], fixture["category"], fixture["sub_category"])[0])
+            for fixture in fixtures
+        )
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = 0
+    for fixture in fixtures:
+        tracemalloc.start()
+        spec.parse_page(fixture["html"], fixture["category"], fixture["sub_category"])
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    timings, cards = field_times(spec, fixtures)
+    return {
+        "fixtures": len(fixtures),
+        "products": products,
+        "seconds": round(best, 6),
+        "products_per_sec": round(products / best, 1) if best else 0.0,
+        "peak_kb": round(peak / 1024, 1),
+        "field_us_per_card": {name: round(seconds * 1e6 / cards, 2) if cards else 0.0 for name, seconds in timings.items()},
+        "golden_ok": not mismatches,
+        "mismatches": mismatches,
+    }
+
+
+# First difference between parsed and golden products, for the report
+def describe_difference(products, expected):
+    if len(products) != len(expected):
+        return f"{len(products)} products, golden has {len(expected)}"
+    for index, (product, golden) in enumerate(zip(products, expected)):
+        fields = [field for field in golden if product.get(field) != golden[field]]
+        if fields:
+            field = fields[0]
+            return f"product #{index + 1} {field}: {product.get(field)!r} != {golden[field]!r}"
+    return "products differ"
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    baseline = load_baseline(path)
+    for competitor, result in results.items():
+        baseline[competitor] = {"products_per_sec": result["products_per_sec"], "peak_kb": result["peak_kb"]}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+# Regressions of a result against its baseline, as readable messages
+def regressions(result, baseline, tolerance):
+    if not baseline:
+        return []
+    problems = []
+    min_rate = baseline["products_per_sec"] / (1 + tolerance)
+    if result["products_per_sec"] < min_rate:
+        problems.append(f"throughput {result['products_per_sec']}/s below {min_rate:.1f}/s "
+                        f"(baseline {baseline['products_per_sec']}/s)")
+    max_peak = baseline["peak_kb"] * (1 + tolerance)
+    if result["peak_kb"] > max_peak:
+        problems.append(f"peak memory {result['peak_kb']} KB above {max_peak:.1f} KB (baseline {baseline['peak_kb']} KB)")
+    return problems
+
+
+def print_report(results):
+    print(f"\nParser benchmark ({resolve_backend()} backend)")
+    print(f"{'Competitor':<20}{'Fixtures':>9}{'Products':>10}{'Products/s':>12}{'Peak KB':>10}  Golden")
+    for competitor, result in results.items():
+        print(f"{competitor:<20}{result['fixtures']:>9}{result['products']:>10}{result['products_per_sec']:>12}"
+              f"{result['peak_kb']:>10}  {'ok' if result['golden_ok'] else 'MISMATCH'}")
+    print("\nField time (us per card)")
+    for competitor, result in results.items():
+        fields = ", ".join(f"{name} {us}" for name, us in result["field_us_per_card"].items())
+        print(f"{competitor:<20}{fields}")
+
+
+def run(competitors, repeat, tolerance, update_baseline, report_path=None):
+    baseline = load_baseline()
+    results = {}
+    failures = []
+    for competitor in competitors:
+        fixtures = load_fixtures(competitor)
+        if not fixtures:
+            print(f"[{competitor}] No fixtures in {FIXTURES_DIR / competitor}, record them with --record")
+            continue
+        result = benchmark_competitor(competitor, fixtures, repeat)
+        result["regressions"] = regressions(result, baseline.get(competitor), tolerance)
+        results[competitor] = result
+        failures += [f"[{competitor}] {message}" for message in result["mismatches"] + result["regressions"]]
+
+    if not results:
+        raise SystemExit("No fixtures to benchmark")
+    print_report(results)
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if update_baseline:
+        save_baseline(results)
+        print(f"\nBaseline saved to {BASELINE_PATH}")
+    if failures:
+        print("\nFAILED")
+        for failure in failures:
+            print(failure)
+        raise SystemExit(1)
+    print("\nOK")
+
+
+# Re-parse every fixture and overwrite its golden file, after an intended
+# change to a spec
+def update_golden(competitors):
+    for competitor in competitors:
+        spec = load_spec(competitor)
+        for fixture in load_fixtures(competitor):
+            write_golden(fixture["golden_path"], golden_data(spec, fixture))
+            print(f"[{competitor}] Updated {fixture['golden_path'].name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the listing page parsers on recorded fixtures")
+    parser.add_argument("competitors", nargs="*", help="Only these competitors (default: all)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", action="store_true", help="Download new fixtures and their golden files")
+    mode.add_argument("--update-golden", action="store_true", help="Rewrite the golden files from the current parsers")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed runs per competitor, the best counts")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed throughput drop / memory growth against the baseline (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run's numbers as the baseline")
+    parser.add_argument("--pages", type=int, default=DEFAULT_RECORD_PAGES, help="Listing pages recorded per competitor")
+    parser.add_argument("--report", type=Path, default=None, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    competitors = benchmarked_competitors(args.competitors)
+    if args.record:
+        for competitor in competitors:
+            asyncio.run(record_competitor(competitor, args.pages))
+    elif args.update_golden:
+        update_golden(competitors)
+    else:
+        run(competitors, args.repeat, args.tolerance, args.save_baseline, args.report)
+
+
+if __name__ == "__main__":
+    main()
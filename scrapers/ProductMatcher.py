@@ -0,0 +1,400 @@
+import argparse
+import json
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from DeltaOutput import find_delta
+from OutputSink import OUTPUT_DIR, find_snapshot, read_products
+
+# Cross-competitor product matching.
+# Product names are normalized into tokens: accents and case are dropped,
+# capacities are rewritten to one unit spelling ("512 Go" -> "512gb") and
+# model codes are kept whole ("i5-12450H" -> "i512450h", "RTX 3050" ->
+# "rtx3050"). Only products sharing a model code in the same category (the
+# canonical category_id when the snapshot has one) are ever compared
+# (blocking), so the work grows with the block sizes instead of with the
+# square of the catalog. Inside a block every pair is scored at once as the
+# cosine of IDF-weighted token vectors, pairs whose capacities disagree are
+# rejected, and the best pairs are merged into groups holding at most one
+# product per competitor.
+# Groups are saved to output/ProductMatches.json. A delta from the last
+# scraper run is applied in place: removed products leave their group,
+# added (or renamed) products are scored against their blocks only. The
+# timestamp of the last delta applied per competitor is saved with the
+# groups, so running --delta again does not apply the same change set twice.
+MATCHES_PATH = OUTPUT_DIR / "ProductMatches.json"
+MATCH_THRESHOLD = float(os.environ.get("MATCH_THRESHOLD", "0.6"))
+# Keys shared by more products than this are too generic to block on
+MAX_BLOCK_SIZE = 300
+
+STOPWORDS = {
+    "pc", "de", "du", "des", "la", "le", "les", "et", "avec", "pour", "sans", "en", "a", "au",
+    "noir", "noire", "blanc", "blanche", "gris", "grise", "bleu", "rouge", "rose", "vert", "argent",
+    "black", "white", "grey", "gray", "silver", "gold", "dore",
+}
+CAPACITY_UNITS = {"go": "gb", "gb": "gb", "g": "gb", "to": "tb", "tb": "tb", "mo": "mb", "mb": "mb"}
+CAPACITY_RE = re.compile(r"(?<![a-z0-9])(\d+(?:[.,]\d+)?)\s*(go|gb|g|to|tb|mo|mb)(?![a-z])")
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+# "13eme", "13e", "4th", "gen4": generation markers, not model codes
+ORDINAL_RE = re.compile(r"^(\d+(e|eme|er|th|nd|rd|st|gen)|gen\d+)$")
+
+
+def strip_accents(text):
+    return "".join(char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char))
+
+
+def is_model_code(token):
+    if ORDINAL_RE.match(token):
+        return False
+    if token.isdigit():
+        return len(token) >= 4
+    return len(token) >= 4 and any(char.isdigit() for char in token) and any(char.isalpha() for char in token)
+
+
+# (tokens, capacities, model codes) of a product name
+def normalize_name(name):
+    text = strip_accents(name or "").lower()
+    capacities = set()
+
+    def capacity(match):
+        value = match.group(1).replace(",", ".")
+        if "." in value:
+            value = value.rstrip("0").rstrip(".")
+        token = f"{value}{CAPACITY_UNITS[match.group(2)]}"
+        capacities.add(token)
+        return f" {token} "
+
+    text = CAPACITY_RE.sub(capacity, text)
+    tokens = set()
+    words = TOKEN_RE.findall(text)
+    for word in words:
+        parts = word.split("-")
+        tokens.update(parts)
+        if len(parts) > 1:
+            tokens.add("".join(parts))
+    # "rtx 3050", "vostro 3530": a word followed by its number is a model
+    for first, second in zip(words, words[1:]):
+        if first.isalpha() and second.isdigit():
+            tokens.add(first + second)
+    tokens -= STOPWORDS
+    codes = {token for token in tokens if is_model_code(token) and token not in capacities}
+    return tokens, capacities, codes
+
+
+def product_key(competitor, product_url):
+    return f"{competitor}|{product_url}"
+
+
+class MatchIndex:
+    def __init__(self):
+        # key -> {"competitor", "product_url", "product_name", "category", "group"}
+        self.products = {}
+        self.features = {}
+        self.blocks = defaultdict(set)
+        self.doc_freq = Counter()
+        # group id -> {"members": [...], "score": ...}
+        self.groups = {}
+        self.next_group = 1
+        # competitor -> mtime (ns) of the last delta the groups include
+        self.applied_deltas = {}
+
+    # Index a product (a Product dict) without matching it
+    def add(self, record):
+        key = product_key(record["competitor"], record["product_url"])
+        if key in self.products:
+            self.remove(key)
+        tokens, capacities, codes = normalize_name(record.get("product_name"))
+        self.products[key] = {
+            "competitor": record["competitor"],
+            "product_url": record["product_url"],
+            "product_name": record.get("product_name"),
+            "category": record.get("category_id") or record.get("category"),
+            "group": None,
+        }
+        self.features[key] = (tokens, capacities, codes)
+        self.doc_freq.update(tokens)
+        for code in codes:
+            self.blocks[(self.products[key]["category"], code)].add(key)
+        return key
+
+    def remove(self, key):
+        product = self.products.pop(key, None)
+        if product is None:
+            return
+        self._leave_group(key, product["group"])
+        tokens, _, codes = self.features.pop(key)
+        self.doc_freq.subtract(tokens)
+        for code in codes:
+            block = self.blocks.get((product["category"], code))
+            if block is not None:
+                block.discard(key)
+                if not block:
+                    del self.blocks[(product["category"], code)]
+
+    def _leave_group(self, key, group_id):
+        if group_id is None:
+            return
+        group = self.groups[group_id]
+        group["members"].remove(key)
+        if len(group["members"]) < 2:
+            for member in group["members"]:
+                self.products[member]["group"] = None
+            del self.groups[group_id]
+
+    def idf(self, token):
+        return math.log((len(self.products) + 1) / (self.doc_freq.get(token, 0) + 1)) + 1
+
+    # Rows of L2-normalized IDF-weighted token vectors over a local vocabulary,
+    # plus a 0/1 matrix of capacities
+    def vectors(self, keys):
+        vocabulary = {}
+        capacity_vocabulary = {}
+        for key in keys:
+            tokens, capacities, _ = self.features[key]
+            for token in tokens:
+                vocabulary.setdefault(token, len(vocabulary))
+            for token in capacities:
+                capacity_vocabulary.setdefault(token, len(capacity_vocabulary))
+        weights = np.zeros((len(keys), max(len(vocabulary), 1)), dtype=np.float32)
+        capacity = np.zeros((len(keys), max(len(capacity_vocabulary), 1)), dtype=np.float32)
+        for row, key in enumerate(keys):
+            tokens, capacities, _ = self.features[key]
+            for token in tokens:
+                weights[row, vocabulary[token]] = self.idf(token)
+            for token in capacities:
+                capacity[row, capacity_vocabulary[token]] = 1.0
+        norms = np.linalg.norm(weights, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return weights / norms, capacity
+
+    # Scores of the rows of `left` against the rows of `right`, with pairs of
+    # the same competitor or with disagreeing capacities set to 0
+    def score(self, left, right):
+        left_keys = set(left)
+        keys = left + [key for key in right if key not in left_keys]
+        weights, capacity = self.vectors(keys)
+        position = {key: row for row, key in enumerate(keys)}
+        rows = [position[key] for key in left]
+        columns = [position[key] for key in right]
+        scores = weights[rows] @ weights[columns].T
+        shared = capacity[rows] @ capacity[columns].T
+        counts = capacity.sum(axis=1)
+        # One name's capacities must all appear in the other's
+        conflict = shared < np.minimum(counts[rows][:, None], counts[columns][None, :])
+        scores[conflict] = 0.0
+        competitors = np.array([self.products[key]["competitor"] for key in keys])
+        scores[competitors[rows][:, None] == competitors[columns][None, :]] = 0.0
+        return scores
+
+    # Candidate pairs above the threshold from every usable block
+    def candidate_pairs(self, threshold):
+        pairs = {}
+        for block in self.blocks.values():
+            if len(block) < 2 or len(block) > MAX_BLOCK_SIZE:
+                continue
+            keys = sorted(block)
+            if len({self.products[key]["competitor"] for key in keys}) < 2:
+                continue
+            scores = self.score(keys, keys)
+            rows, columns = np.nonzero(np.triu(scores, k=1) >= threshold)
+            for row, column in zip(rows.tolist(), columns.tolist()):
+                pairs[(keys[row], keys[column])] = float(scores[row, column])
+        return pairs
+
+    def _competitors(self, key):
+        group_id = self.products[key]["group"]
+        if group_id is None:
+            return {self.products[key]["competitor"]}
+        return {self.products[member]["competitor"] for member in self.groups[group_id]["members"]}
+
+    # Join two products' groups when no competitor would appear twice
+    def _link(self, first, second, score):
+        first_group, second_group = self.products[first]["group"], self.products[second]["group"]
+        if first_group is not None and first_group == second_group:
+            return False
+        if self._competitors(first) & self._competitors(second):
+            return False
+        if first_group is None and second_group is None:
+            group_id = f"g{self.next_group}"
+            self.next_group += 1
+            self.groups[group_id] = {"members": [first, second], "score": round(score, 4)}
+            self.products[first]["group"] = self.products[second]["group"] = group_id
+            return True
+        if first_group is None or (second_group is not None and len(self.groups[second_group]["members"]) > len(self.groups[first_group]["members"])):
+            first, second = second, first
+            first_group, second_group = second_group, first_group
+        group = self.groups[first_group]
+        moved = self.groups.pop(second_group)["members"] if second_group is not None else [second]
+        size = len(group["members"])
+        group["score"] = round((group["score"] * (size - 1) + score) / size, 4)
+        for member in moved:
+            group["members"].append(member)
+            self.products[member]["group"] = first_group
+        return True
+
+    # Match everything from scratch
+    def match_all(self, threshold=MATCH_THRESHOLD):
+        self.groups = {}
+        self.next_group = 1
+        # competitor -> mtime (ns) of the last delta the groups include
+        self.applied_deltas = {}
+        for product in self.products.values():
+            product["group"] = None
+        pairs = self.candidate_pairs(threshold)
+        # Best pairs first, so a weak link never blocks a strong one
+        for (first, second), score in sorted(pairs.items(), key=lambda item: -item[1]):
+            self._link(first, second, score)
+        return len(pairs)
+
+    # Match one indexed product against its blocks only
+    def match_one(self, key, threshold=MATCH_THRESHOLD):
+        product = self.products[key]
+        _, _, codes = self.features[key]
+        candidates = set()
+        for code in codes:
+            block = self.blocks.get((product["category"], code), ())
+            if len(block) <= MAX_BLOCK_SIZE:
+                candidates.update(block)
+        candidates.discard(key)
+        candidates = sorted(candidates)
+        if not candidates:
+            return False
+        scores = self.score([key], candidates)[0]
+        for column in np.argsort(-scores).tolist():
+            if scores[column] < threshold:
+                break
+            if self._link(key, candidates[column], float(scores[column])):
+                return True
+        return False
+
+    # Apply the change records of a delta file
+    def apply_delta(self, changes, threshold=MATCH_THRESHOLD):
+        stats = {"added": 0, "removed": 0, "renamed": 0, "matched": 0}
+        to_match = []
+        for change in changes:
+            if change["change"] == "removed":
+                self.remove(product_key(change["competitor"], change["product_url"]))
+                stats["removed"] += 1
+                continue
+            record = change["product"]
+            if change["change"] == "updated" and "product_name" not in change["fields"]:
+                continue
+            stats["renamed" if change["change"] == "updated" else "added"] += 1
+            to_match.append(self.add(record))
+        for key in to_match:
+            if key in self.products and self.products[key]["group"] is None and self.match_one(key, threshold):
+                stats["matched"] += 1
+        return stats
+
+    def save(self, path=MATCHES_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "next_group": self.next_group,
+            "products": self.products,
+            "groups": self.groups,
+            "applied_deltas": self.applied_deltas,
+        }
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=MATCHES_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        index = cls()
+        for product in data["products"].values():
+            index.add(product)
+        for key, product in data["products"].items():
+            index.products[key]["group"] = product["group"]
+        index.groups = data["groups"]
+        index.next_group = data["next_group"]
+        index.applied_deltas = data.get("applied_deltas", {})
+        return index
+
+
+# Competitors that have a snapshot in the output directory
+def discover_competitors(output_dir=OUTPUT_DIR):
+    return sorted({path.name.split("Products.")[0] for path in output_dir.glob("*Products.*")})
+
+
+def build_index(competitors):
+    index = MatchIndex()
+    for competitor in competitors:
+        path = find_snapshot(competitor)
+        if path is None:
+            print(f"No snapshot found for {competitor}")
+            continue
+        for record in read_products(path):
+            url = record.get("product_url")
+            if url and url != "N/A" and product_key(competitor, url) not in index.products:
+                index.add(record)
+    return index
+
+
+# Timestamp identifying a delta file: the time its run finished
+def delta_stamp(path):
+    return path.stat().st_mtime_ns
+
+
+# Apply the last delta of every competitor unless the groups already
+# include it
+def apply_deltas(index, competitors, threshold=MATCH_THRESHOLD):
+    for competitor in competitors:
+        path = find_delta(competitor)
+        if path is None:
+            continue
+        stamp = delta_stamp(path)
+        if stamp <= index.applied_deltas.get(competitor, 0):
+            print(f"{competitor}: {path.name} already applied, skipping it")
+            continue
+        stats = index.apply_delta(read_products(path), threshold)
+        index.applied_deltas[competitor] = stamp
+        print(f"{competitor}: {stats['added']} added, {stats['renamed']} renamed, "
+              f"{stats['removed']} removed, {stats['matched']} newly matched")
+
+
+# A snapshot is written at the end of the same run as its delta, so groups
+# rebuilt from the snapshots already include the last deltas
+def mark_deltas_applied(index, competitors):
+    for competitor in competitors:
+        path = find_delta(competitor)
+        if path is not None:
+            index.applied_deltas[competitor] = delta_stamp(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Group the same product across competitors")
+    parser.add_argument("competitors", nargs="*", help="Competitors to match (default: every snapshot in output/)")
+    parser.add_argument("--delta", action="store_true", help="Update the saved groups with the last run's deltas")
+    parser.add_argument("--threshold", type=float, default=MATCH_THRESHOLD)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    competitors = args.competitors or discover_competitors()
+
+    if args.delta and MATCHES_PATH.exists():
+        index = MatchIndex.load()
+        apply_deltas(index, competitors, args.threshold)
+    else:
+        index = build_index(competitors)
+        mark_deltas_applied(index, competitors)
+        pairs = index.match_all(args.threshold)
+        print(f"{len(index.products)} products, {len(index.blocks)} blocks, {pairs} candidate pairs above {args.threshold}")
+
+    index.save()
+    grouped = sum(len(group["members"]) for group in index.groups.values())
+    print(f"{len(index.groups)} match groups covering {grouped} products "
+          f"in {time.perf_counter() - started:.2f}s -> {MATCHES_PATH}")
+
+
+if __name__ == "__main__":
+    main()
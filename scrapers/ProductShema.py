@@ -1,4 +1,13 @@
-from pydantic import BaseModel
+import logging
+from typing import List, Optional
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from typing_extensions import NotRequired, TypedDict
+
+# A plain child of the crawl logger: importing the schema (the migration
+# scripts do) must not start CrawlMetrics' logging thread. In a scraper run
+# the records go through the handler get_logger() installed.
+logger = logging.getLogger("competitracker.products")
 
 class Product(BaseModel):
     competitor: str 
@@ -9,5 +18,80 @@ class Product(BaseModel):
     category: str
     sub_category: str
     stock_status: str
+    # Canonical taxonomy IDs (see Taxonomy.py), None for names outside it
+    category_id: Optional[str] = None
+    sub_category_id: Optional[str] = None
+
+PRODUCT_FIELDS = tuple(Product.model_fields)
+
+# Plain product record built in the scraping hot loop. It has the fields of
+# Product but no per-instance validation; records are validated together
+# with validate_records() when they reach the output. dict() gives the same
+# mapping as Product.dict().
+class ProductRecord:
+    __slots__ = PRODUCT_FIELDS
+
+    def __init__(self, competitor, product_name, product_url, product_price, discount, category,
+                 sub_category, stock_status, category_id=None, sub_category_id=None):
+        self.competitor = competitor
+        self.product_name = product_name
+        self.product_url = product_url
+        self.product_price = product_price
+        self.discount = discount
+        self.category = category
+        self.sub_category = sub_category
+        self.stock_status = stock_status
+        self.category_id = category_id
+        self.sub_category_id = sub_category_id
+
+    def dict(self):
+        return {
+            "competitor": self.competitor,
+            "product_name": self.product_name,
+            "product_url": self.product_url,
+            "product_price": self.product_price,
+            "discount": self.discount,
+            "category": self.category,
+            "sub_category": self.sub_category,
+            "stock_status": self.stock_status,
+            "category_id": self.category_id,
+            "sub_category_id": self.sub_category_id,
+        }
+
+    def __repr__(self):
+        return "ProductRecord(" + ", ".join(f"{field}={getattr(self, field)!r}" for field in PRODUCT_FIELDS) + ")"
+
+    def __eq__(self, other):
+        return isinstance(other, ProductRecord) and self.dict() == other.dict()
+
+# Same schema as Product, validated as plain dicts in a single call per batch.
+# Fields with a default may be missing, as in records written before they
+# existed; validate_records() fills them in like Product does.
+PRODUCT_DEFAULTS = {name: field.default for name, field in Product.model_fields.items() if not field.is_required()}
+ProductDict = TypedDict("ProductDict", {
+    name: NotRequired[field.annotation] if name in PRODUCT_DEFAULTS else field.annotation
+    for name, field in Product.model_fields.items()
+})
+PRODUCT_BATCH = TypeAdapter(List[ProductDict])
+
+# Validate and coerce product dicts the way Product would. Invalid records
+# are reported and dropped instead of failing the whole batch.
+def validate_records(records):
+    try:
+        valid = PRODUCT_BATCH.validate_python(records)
+    except ValidationError:
+        valid = []
+        for record in records:
+            try:
+                valid.append(Product(**record).dict())
+            except ValidationError as e:
+                logger.warning(f"Dropping invalid product {record.get('product_url')}: {e.errors()[0]['msg']}")
+        return valid
+    for record in valid:
+        for name, default in PRODUCT_DEFAULTS.items():
+            if name not in record:
+                record[name] = default
+    return valid
+
 def sum(a: int, b: int) -> int:
-    return a + b
\ No newline at end of file
+    return a + b
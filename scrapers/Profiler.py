@@ -0,0 +1,184 @@
+import argparse
+import contextlib
+import os
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+
+from CrawlMetrics import get_logger
+
+# Sampling profiler for scraper runs.
+# A background thread takes the stack of the thread running the crawl every
+# few milliseconds. Each sample is tagged with the pipeline stage the code is
+# in, declared around the synchronous sections with stage():
+#   html      building the HTML tree (parse_html)
+#   extract   reading the fields of every card; samples inside the field
+#             transforms (regex and price cleanup) are tagged clean
+#   validate  batch validation of the products before they are written
+#   write     JSON encoding and writing of the output
+#   delta     comparison with the previous snapshot
+#   fetch     everything else: the event loop, aiohttp, the browser and
+#             waiting on the network
+# Those sections never await, so the stage of the crawl thread at sample time
+# is exact even with many listings in flight. The sampler only runs when the
+# crawl thread hands over the GIL, which by default it mostly does on I/O;
+# the interpreter switch interval is lowered while profiling so pure-Python
+# work gets sampled as often as I/O.
+# At the end of the run, output/profiles/ receives <Competitor>.folded (one
+# "stage;frame;frame count" line per stack, for flamegraph.pl, inferno or
+# speedscope) and <Competitor>Profile.txt with the time per stage and the
+# top-N functions by own and cumulative samples.
+# Run a scraper with --profile, or the orchestrator with --profile.
+PROFILE_DIR = Path(__file__).parent / "output" / "profiles"
+DEFAULT_INTERVAL = float(os.environ.get("SCRAPER_PROFILE_INTERVAL", "0.005"))
+DEFAULT_TOP = 25
+DEFAULT_STAGE = "fetch"
+# Functions whose samples are moved from extract to clean
+CLEAN_FUNCTIONS = {"convert", "decimal_comma", "_remove"}
+EXTRACTION_FILE = "ExtractionSpec.py"
+
+logger = get_logger("profiler")
+
+# thread id -> stages entered, innermost last
+_stages = {}
+# Profilers running in this process (one per thread with the thread executor)
+_active = 0
+_NO_STAGE = contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def _stage(name):
+    stack = _stages.setdefault(threading.get_ident(), [])
+    stack.append(name)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+# Tag the enclosed synchronous code with a stage; free when not profiling
+def stage(name):
+    return _stage(name) if _active else _NO_STAGE
+
+
+def frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, competitor, interval=DEFAULT_INTERVAL, top=DEFAULT_TOP, profile_dir=PROFILE_DIR):
+        self.competitor = competitor
+        self.interval = interval
+        self.top = top
+        self.profile_dir = Path(profile_dir)
+        # (stage, code objects from the outermost frame) -> samples
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._target = None
+        self._switch_interval = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        self.write()
+
+    def start(self):
+        global _active
+        _active += 1
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval / 5))
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        global _active
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+        _active -= 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                self._sample(frame)
+
+    def _sample(self, frame):
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        stages = _stages.get(self._target)
+        current = stages[-1] if stages else DEFAULT_STAGE
+        if current == "extract" and any(
+            code.co_name in CLEAN_FUNCTIONS and code.co_filename.endswith(EXTRACTION_FILE) for code in codes
+        ):
+            current = "clean"
+        self.samples[(current, tuple(codes))] += 1
+
+    def folded(self):
+        stacks = Counter()
+        for (stage_name, codes), count in self.samples.items():
+            stacks[";".join([stage_name] + [frame_name(code) for code in codes])] += count
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+    # Time per stage and the hottest functions, as a text table
+    def report(self, top=None):
+        top = top or self.top
+        total = sum(self.samples.values())
+        per_stage = Counter()
+        own = Counter()
+        cumulative = Counter()
+        for (stage_name, codes), count in self.samples.items():
+            per_stage[stage_name] += count
+            if codes:
+                own[codes[-1]] += count
+            for code in set(codes):
+                cumulative[code] += count
+
+        def share(count):
+            return f"{100 * count / total:5.1f}%" if total else "  0.0%"
+
+        lines = [f"Profile of {self.competitor}: {total} samples every {self.interval * 1000:g} ms "
+                 f"(~{total * self.interval:.1f}s)", "", "Stage        Samples   Share"]
+        for stage_name, count in per_stage.most_common():
+            lines.append(f"{stage_name:<12}{count:>8}  {share(count)}")
+        lines += ["", f"Top {top} functions by own samples", f"{'Own':>8} {'Share':>6} {'Cumul':>8}  Function"]
+        for code, count in own.most_common(top):
+            lines.append(f"{count:>8} {share(count)} {cumulative[code]:>8}  {frame_name(code)}")
+        lines += ["", f"Top {top} functions by cumulative samples", f"{'Cumul':>8} {'Share':>6}  Function"]
+        for code, count in cumulative.most_common(top):
+            lines.append(f"{count:>8} {share(count)}  {frame_name(code)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        folded_path = self.profile_dir / f"{self.competitor}.folded"
+        report_path = self.profile_dir / f"{self.competitor}Profile.txt"
+        folded_path.write_text(self.folded(), encoding="utf-8")
+        report = self.report()
+        report_path.write_text(report, encoding="utf-8")
+        logger.info("\n" + self.report(top=10))
+        logger.info(f"Profile of {self.competitor} saved to {folded_path} and {report_path}")
+
+
+def profiler(competitor, enabled, interval=DEFAULT_INTERVAL, top=DEFAULT_TOP):
+    return SamplingProfiler(competitor, interval, top) if enabled else contextlib.nullcontext()
+
+
+# Command line entry point of a scraper: run main(), profiled with --profile
+def run_main(main, competitor):
+    parser = argparse.ArgumentParser(description=f"Scrape the {competitor} catalog")
+    parser.add_argument("--profile", action="store_true", help="Sample the run and write a flamegraph and top-N table")
+    parser.add_argument("--profile-interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between samples")
+    parser.add_argument("--profile-top", type=int, default=DEFAULT_TOP, help="Functions listed in the table")
+    args = parser.parse_args()
+    with profiler(competitor, args.profile, args.profile_interval, args.profile_top):
+        return main()
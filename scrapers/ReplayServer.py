@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import zlib
+from collections import Counter
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+from aiohttp import web
+from bs4 import BeautifulSoup
+
+from ExtractionSpec import load_spec
+from FetchEngine import iter_link_units
+from HtmlParser import HAS_LXML
+from ParserBenchmark import LINKS_DIR, benchmarked_competitors, load_fixtures
+
+# Local replay of the competitor sites for offline crawl load tests.
+# The listing pages recorded by ParserBenchmark (benchmarks/<Competitor>/)
+# are served under the URL shapes of categorieLinks/*Links.json, prefixed by
+# the host: https://www.mytek.tn/a/b.html?p=2 is served as
+# http://127.0.0.1:<port>/www.mytek.tn/a/b.html?p=2. Scrapers started with
+# SCRAPER_REPLAY_URL=http://127.0.0.1:<port> request those URLs instead of
+# the live sites (see HttpClient.replay_url).
+# A listing URL gets the fixture recorded for it, or else one of its
+# competitor's fixtures picked from the path, so every category works. It
+# has as many pages as the fixture announces (its page count markup), or
+# --pages when it announces none: the last page has no next-page link and
+# pages past it have no product card.
+# Latency, server errors and 429 responses are injected at the given rates
+# from a seeded random generator, so a load test can be repeated exactly.
+# GET /_stats returns the request counters.
+# Megapc pages are static snapshots of the rendered grid: the browser sees
+# page 1 but its client-side "next" button does nothing.
+DEFAULT_REPLAY_PORT = int(os.environ.get("SCRAPER_REPLAY_PORT", "8765"))
+DEFAULT_PAGES = 3
+# Query parameters selecting the listing page, per the scrapers' page_url()
+PAGE_PARAMS = ("page", "p", "_pagination")
+
+
+def soup_of(html):
+    return BeautifulSoup(html, "lxml" if HAS_LXML else "html.parser")
+
+
+def without(html, selectors):
+    soup = soup_of(html)
+    for selector in selectors:
+        for tag in soup.select(selector):
+            tag.decompose()
+    return str(soup)
+
+
+# The three variants of a recorded page served for one listing
+class ReplayPage:
+    def __init__(self, spec, fixture, default_pages):
+        html = fixture["html"]
+        cards = len(spec.card_selector.select(soup_of(html)))
+        self.pages = spec.last_page(html, cards) if cards else None
+        self.pages = self.pages or default_pages
+        next_selectors = [spec.next_page_css] if spec.next_page_css else []
+        self.html = html
+        self.last_html = without(html, next_selectors)
+        self.empty_html = without(html, next_selectors + [spec.card_selector.selector])
+
+    def body(self, page_num):
+        if page_num < self.pages:
+            return self.html
+        if page_num == self.pages:
+            return self.last_html
+        return self.empty_html
+
+
+def listing_key(host, path, query):
+    params = [(key, value) for key, value in parse_qsl(query, keep_blank_values=True) if key not in PAGE_PARAMS]
+    return f"{host}{path}?{urlencode(params)}"
+
+
+def page_number(query):
+    params = dict(parse_qsl(query))
+    for param in PAGE_PARAMS:
+        if param in params and params[param].isdigit():
+            return int(params[param])
+    return 1
+
+
+class ReplaySite:
+    def __init__(self, competitors=None, default_pages=DEFAULT_PAGES):
+        # host -> competitor, competitor -> pages, listing key -> page
+        self.hosts = {}
+        self.pages = {}
+        self.recorded = {}
+        for competitor in benchmarked_competitors(competitors):
+            fixtures = load_fixtures(competitor)
+            if not fixtures:
+                continue
+            spec = load_spec(competitor)
+            with open(LINKS_DIR / f"{competitor}Links.json", 'r', encoding='utf-8') as f:
+                links = json.load(f)
+            for _, _, url in iter_link_units(links):
+                self.hosts[urlparse(url).netloc] = competitor
+            self.pages[competitor] = []
+            for fixture in fixtures:
+                page = ReplayPage(spec, fixture, default_pages)
+                self.pages[competitor].append(page)
+                parts = urlparse(fixture["url"])
+                self.recorded[listing_key(parts.netloc, parts.path, parts.query)] = page
+
+    def page_for(self, host, path, query):
+        page = self.recorded.get(listing_key(host, path, query))
+        if page is not None:
+            return page
+        pages = self.pages.get(self.hosts.get(host))
+        if not pages:
+            return None
+        return pages[zlib.crc32(path.encode("utf-8")) % len(pages)]
+
+
+class FaultInjector:
+    def __init__(self, latency_ms=0, jitter=0.5, error_rate=0.0, rate_limit=0.0, retry_after=1, seed=None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+    def delay(self):
+        if not self.latency:
+            return 0.0
+        return self.latency * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    # Injected response status, or None to serve the page
+    def fault(self):
+        draw = self.random.random()
+        if draw < self.rate_limit:
+            return 429
+        if draw < self.rate_limit + self.error_rate:
+            return 503
+        return None
+
+
+def make_app(site, faults):
+    stats = Counter()
+
+    async def serve(request):
+        host, _, path = request.match_info["tail"].partition("/")
+        stats["requests"] += 1
+        await asyncio.sleep(faults.delay())
+        status = faults.fault()
+        if status == 429:
+            stats["429"] += 1
+            return web.Response(status=429, headers={"Retry-After": str(faults.retry_after)}, text="Too Many Requests")
+        if status is not None:
+            stats[str(status)] += 1
+            return web.Response(status=status, text="Service Unavailable")
+        page = site.page_for(host, "/" + path, request.query_string)
+        if page is None:
+            stats["404"] += 1
+            return web.Response(status=404, text="Not Found")
+        stats["200"] += 1
+        return web.Response(text=page.body(page_number(request.query_string)), content_type="text/html")
+
+    async def show_stats(request):
+        return web.json_response(dict(stats))
+
+    async def print_stats(app):
+        print(f"Replay server served {stats['requests']} requests: "
+              + ", ".join(f"{key} x{count}" for key, count in sorted(stats.items()) if key != "requests"))
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_get("/_stats", show_stats)
+    app.router.add_get("/{tail:.*}", serve)
+    app.on_cleanup.append(print_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded competitor listing pages for offline load tests")
+    parser.add_argument("competitors", nargs="*", help="Only these competitors (default: all with fixtures)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_REPLAY_PORT)
+    parser.add_argument("--pages", type=int, default=DEFAULT_PAGES, help="Pages of a listing announcing no page count")
+    parser.add_argument("--latency", type=float, default=0, help="Mean response latency in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Latency spread, as a fraction of the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the fault injection")
+    args = parser.parse_args()
+
+    site = ReplaySite(args.competitors, args.pages)
+    if not site.pages:
+        raise SystemExit("No fixtures to replay, record them with ParserBenchmark.py --record")
+    faults = FaultInjector(args.latency, args.jitter, args.error_rate, args.rate_limit, args.retry_after, args.seed)
+    for competitor, pages in site.pages.items():
+        print(f"{competitor}: {len(pages)} recorded page(s)")
+    print(f"Run the scrapers with SCRAPER_REPLAY_URL=http://{args.host}:{args.port}")
+    web.run_app(make_app(site, faults), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
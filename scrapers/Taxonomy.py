@@ -0,0 +1,103 @@
+import hashlib
+import json
+import re
+import unicodedata
+from pathlib import Path
+
+# Canonical category taxonomy.
+# categorieLinks/categories.json is the reference list of categories and
+# their subcategories. The names used in the *Links.json files only loosely
+# follow it, so categorieLinks/categoryAliases.json maps the other spellings
+# to canonical names, for every competitor ("*") or for one:
+#   {"<Competitor>": {"categories": {"raw": "canonical"},
+#                     "sub_categories": {"raw": "canonical"}}}
+# Everything is compiled once into dictionaries keyed by a normalized name
+# (no accents, case or repeated spaces), so resolving the names of a product
+# is a couple of lookups. Scrapers stamp the resulting IDs on every Product:
+# category_id is the slug of the category ("composants-informatiques") and
+# sub_category_id the slug of the subcategory ("disque-dur-ssd"), shared by
+# every category listing it.
+TAXONOMY_PATH = Path(__file__).parent / "categorieLinks" / "categories.json"
+ALIASES_PATH = Path(__file__).parent / "categorieLinks" / "categoryAliases.json"
+
+
+def normalize(name):
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.casefold().split())
+
+
+def slugify(name):
+    return re.sub(r"[^a-z0-9]+", "-", normalize(name)).strip("-")
+
+
+class Taxonomy:
+    def __init__(self, categories, aliases=None, fingerprint=""):
+        aliases = aliases or {}
+        self.fingerprint = fingerprint
+        # normalized canonical name -> id
+        self.category_ids = {}
+        self.sub_category_ids = {}
+        # id -> canonical name
+        self.category_names = {}
+        self.sub_category_names = {}
+        # category id -> ids of its subcategories
+        self.children = {}
+        for category, sub_categories in categories.items():
+            category_id = slugify(category)
+            self.category_ids[normalize(category)] = category_id
+            self.category_names[category_id] = category
+            self.children[category_id] = []
+            for sub_category in sub_categories:
+                sub_category_id = slugify(sub_category)
+                self.sub_category_ids[normalize(sub_category)] = sub_category_id
+                self.sub_category_names[sub_category_id] = sub_category
+                self.children[category_id].append(sub_category_id)
+
+        # (competitor or "*", normalized raw name) -> id
+        self.category_aliases = {}
+        self.sub_category_aliases = {}
+        for competitor, tables in aliases.items():
+            for raw, canonical in tables.get("categories", {}).items():
+                self.category_aliases[(competitor, normalize(raw))] = self._canonical_id(self.category_ids, canonical)
+            for raw, canonical in tables.get("sub_categories", {}).items():
+                self.sub_category_aliases[(competitor, normalize(raw))] = self._canonical_id(self.sub_category_ids, canonical)
+        self._resolved = {}
+
+    @staticmethod
+    def _canonical_id(ids, canonical):
+        key = normalize(canonical)
+        if key not in ids:
+            raise ValueError(f"Alias target is not in the taxonomy: {canonical}")
+        return ids[key]
+
+    @staticmethod
+    def _lookup(ids, aliases, competitor, name):
+        key = normalize(name)
+        return aliases.get((competitor, key)) or aliases.get(("*", key)) or ids.get(key)
+
+    # (category_id, sub_category_id) of a competitor's names, None when a
+    # name is not part of the taxonomy
+    def resolve(self, competitor, category, sub_category):
+        cache_key = (competitor, category, sub_category)
+        if cache_key not in self._resolved:
+            self._resolved[cache_key] = (
+                self._lookup(self.category_ids, self.category_aliases, competitor, category),
+                self._lookup(self.sub_category_ids, self.sub_category_aliases, competitor, sub_category),
+            )
+        return self._resolved[cache_key]
+
+
+# Load the taxonomy files. The fingerprint changes with them, so cached
+# parse results carrying old IDs are invalidated.
+def load_taxonomy(path=TAXONOMY_PATH, aliases_path=ALIASES_PATH):
+    raw = Path(path).read_bytes()
+    try:
+        raw_aliases = Path(aliases_path).read_bytes()
+    except FileNotFoundError:
+        raw_aliases = b"{}"
+    fingerprint = hashlib.sha1(raw + raw_aliases + Path(__file__).read_bytes()).hexdigest()[:16]
+    return Taxonomy(json.loads(raw.decode("utf-8")), json.loads(raw_aliases.decode("utf-8")), fingerprint)
+
+
+TAXONOMY = load_taxonomy()
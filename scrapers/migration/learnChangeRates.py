@@ -0,0 +1,81 @@
+from pymongo import MongoClient
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import os
+import sys
+import time
+
+# Add parent directory to path to import the shared scraper modules
+sys.path.append(str(Path(__file__).parent.parent))
+from CrawlScheduler import CrawlScheduler
+
+# Seed the crawl scheduler's change rates from the price history.
+# loadData.py writes a product_history entry when a product is first seen
+# and then every time its price or discount moves, so a product with n
+# entries, the first one d days ago, changed n - 1 times in d days. Summed
+# over the products of a (competitor, category, subcategory), that gives the
+# unit's changes per product and per day, written into
+# output/schedule/<Competitor>.json. Later runs keep refining the rates from
+# their own deltas.
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+# Units observed for less than this are left to the scraper runs
+MIN_EXPOSURE_DAYS = 7.0
+
+client = MongoClient(MONGO_URI)
+db = client["CompetiTracker"]
+
+products_col = db["products"]
+history_col = db["product_history"]
+
+
+# (entries, first timestamp) per product, from one aggregation over the
+# (product_id, timestamp) index
+def history_per_product():
+    pipeline = [
+        {"$group": {"_id": "$product_id", "entries": {"$sum": 1}, "first": {"$min": "$timestamp"}}},
+    ]
+    return {doc["_id"]: (doc["entries"], doc["first"]) for doc in history_col.aggregate(pipeline, allowDiskUse=True)}
+
+
+# competitor -> (category, subcategory) -> changes per product and per day
+def unit_rates(history, now):
+    # unit -> [changes, product days observed]
+    totals = defaultdict(lambda: [0, 0.0])
+    projection = {"competitor": 1, "category": 1, "sub_category": 1}
+    for product in products_col.find({"removed_at": {"$exists": False}}, projection):
+        entry = history.get(product["_id"])
+        if entry is None:
+            continue
+        entries, first = entry
+        if first.tzinfo is None:
+            first = first.replace(tzinfo=timezone.utc)
+        unit = totals[(product["competitor"], product["category"], product["sub_category"])]
+        unit[0] += entries - 1
+        unit[1] += (now - first).total_seconds() / 86400
+    rates = defaultdict(dict)
+    for (competitor, category, sub_category), (changes, days) in totals.items():
+        if days >= MIN_EXPOSURE_DAYS:
+            rates[competitor][(category, sub_category)] = changes / days
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the crawl scheduler's change rates from product_history")
+    parser.add_argument("competitors", nargs="*", help="Competitors to seed (default: every competitor with history)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rates = unit_rates(history_per_product(), datetime.now(timezone.utc))
+    for competitor in args.competitors or sorted(rates):
+        if competitor not in rates:
+            print(f"No price history for {competitor}")
+            continue
+        CrawlScheduler(competitor).seed(rates[competitor])
+        print(f"{competitor}: change rate seeded for {len(rates[competitor])} subcategories")
+    print(f"Change rates learned in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
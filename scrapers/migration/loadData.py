@@ -1,23 +1,136 @@
-from pymongo import MongoClient
-from datetime import datetime
-from bson import ObjectId
-import random
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import os
+import sys
+import time
 
-client = MongoClient("mongodb://localhost:27017")
+# Add parent directory to path to import the shared scraper modules
+sys.path.append(str(Path(__file__).parent.parent))
+from DeltaOutput import PRICE_FIELDS, find_delta
+from OutputSink import OUTPUT_DIR, read_products
+
+# Price history snapshot job.
+# Streams the products with only the fields we compare, looks up each
+# product's latest history entry and writes a new entry only when the price
+# or the discount moved. New entries are written with batched insert_many.
+# With --delta the scrapers' change sets say which products moved, so only
+# those are looked up (run loadProducts.py --delta first so added products
+# have an id).
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+BATCH_SIZE = 1000
+
+client = MongoClient(MONGO_URI)
 db = client["CompetiTracker"]
 
 products_col = db["products"]
 history_col = db["product_history"]
 
-# Get all products
-for product in products_col.find():
-    new_price = product["product_price"] 
-    new_discount = product["discount"]
-
-    # Insert into product_history
-    history_col.insert_one({
-        "product_id": product["_id"],
-        "product_price": new_price,
-        "discount": new_discount,
-        "timestamp": datetime.utcnow()
-    })
+
+# Latest (price, discount) per product, from one aggregation over the
+# (product_id, timestamp) index instead of one query per product
+def latest_history():
+    pipeline = [
+        {"$sort": {"product_id": 1, "timestamp": -1}},
+        {"$group": {
+            "_id": "$product_id",
+            "product_price": {"$first": "$product_price"},
+            "discount": {"$first": "$discount"},
+        }},
+    ]
+    return {
+        doc["_id"]: (doc["product_price"], doc["discount"])
+        for doc in history_col.aggregate(pipeline, allowDiskUse=True)
+    }
+
+
+# History rows for products whose price or discount changed
+def iter_changes(products, latest, timestamp):
+    for product in products:
+        current = (product["product_price"], product["discount"])
+        if latest.get(product["_id"]) == current:
+            continue
+        yield {
+            "product_id": product["_id"],
+            "product_price": current[0],
+            "discount": current[1],
+            "timestamp": timestamp,
+        }
+
+
+# History rows for the added products and the price/discount updates of a
+# competitor's delta file
+def iter_delta_changes(competitor, path, timestamp):
+    prices = {}
+    for change in read_products(path):
+        if change["change"] == "added" or (
+                change["change"] == "updated" and any(field in PRICE_FIELDS for field in change["fields"])):
+            product = change["product"]
+            prices[product["product_url"]] = (product["product_price"], product["discount"])
+    urls = list(prices)
+    for start in range(0, len(urls), BATCH_SIZE):
+        query = {"competitor": competitor, "product_url": {"$in": urls[start:start + BATCH_SIZE]}}
+        for product in products_col.find(query, {"product_url": 1}):
+            price, discount = prices[product["product_url"]]
+            yield {
+                "product_id": product["_id"],
+                "product_price": price,
+                "discount": discount,
+                "timestamp": timestamp,
+            }
+
+
+# Competitors that have a delta file in the output directory
+def delta_competitors(output_dir=OUTPUT_DIR):
+    return sorted({path.name.split("Delta.")[0] for path in output_dir.glob("*Delta.ndjson*")})
+
+
+def write_batches(rows):
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            history_col.insert_many(batch, ordered=False)
+            written += len(batch)
+            batch = []
+    if batch:
+        history_col.insert_many(batch, ordered=False)
+        written += len(batch)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record price history for products whose price moved")
+    parser.add_argument("competitors", nargs="*", help="With --delta, competitors to record (default: every delta in output/)")
+    parser.add_argument("--delta", action="store_true", help="Use the last run's change sets instead of comparing every product")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    # Serves this job's aggregation and the backend's per-product history reads
+    history_col.create_index([("product_id", ASCENDING), ("timestamp", DESCENDING)])
+
+    if args.delta:
+        timestamp = datetime.now(timezone.utc)
+        written = 0
+        for competitor in args.competitors or delta_competitors():
+            path = find_delta(competitor)
+            if path is None:
+                print(f"No delta found for {competitor}")
+                continue
+            written += write_batches(iter_delta_changes(competitor, path, timestamp))
+        print(f"Price history snapshot: {written} changed products recorded from deltas "
+              f"in {time.perf_counter() - started:.2f}s")
+        return
+
+    latest = latest_history()
+    products = products_col.find({}, {"product_price": 1, "discount": 1}, batch_size=BATCH_SIZE)
+    written = write_batches(iter_changes(products, latest, datetime.now(timezone.utc)))
+
+    print(f"Price history snapshot: {written} changed products recorded "
+          f"({len(latest)} products already tracked) in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.errors import OperationFailure
+
+# Add parent directory to path to import the shared scraper modules
+sys.path.append(str(Path(__file__).parent.parent))
+from DeltaOutput import find_delta
+from OutputSink import OUTPUT_DIR, find_snapshot, read_products
+
+# Load scraper output into the products collection read by the backend.
+# Products are identified by (competitor, product_url). Existing documents
+# carry a hash of their scraped fields, so unchanged products are not sent
+# at all and only new or modified ones are upserted, in batches written by
+# a small pool of threads. A product listed again after a delta marked it
+# removed has its removed_at cleared, even when its fields did not change.
+# With --delta the change set written by the last scraper run
+# (output/<Competitor>Delta.ndjson) is applied instead of the full snapshot:
+# added and updated products are upserted and removed ones are stamped with
+# removed_at, without reading the existing documents first.
+# Documents written before this loader only carry the backend's "url" field
+# and can repeat a URL; before the unique index is created they get their
+# product_url from url and only the last updated document of each
+# (competitor, product_url) is kept.
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("MONGO_DB", "CompetiTracker")
+
+PRODUCT_FIELDS = (
+    "competitor", "product_name", "product_url", "product_price",
+    "discount", "category", "sub_category", "stock_status",
+    "category_id", "sub_category_id",
+)
+
+
+def content_hash(record):
+    payload = json.dumps([record.get(field) for field in PRODUCT_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+# Competitors that have a snapshot in the output directory
+def discover_competitors(output_dir=OUTPUT_DIR):
+    competitors = set()
+    for path in output_dir.glob("*Products.*"):
+        competitors.add(path.name.split("Products.")[0])
+    return sorted(competitors)
+
+
+# Backfill product_url and drop duplicate documents; returns how many
+# documents were backfilled and removed
+def migrate_legacy_documents(products_col, batch_size=1000):
+    backfill = [
+        UpdateOne({"_id": doc["_id"]}, {"$set": {"product_url": doc["url"]}})
+        for doc in products_col.find({"product_url": {"$exists": False}, "url": {"$exists": True}}, {"url": 1})
+    ]
+    for batch in batched(backfill, batch_size):
+        products_col.bulk_write(batch, ordered=False)
+
+    latest = {}
+    duplicates = []
+    projection = {"competitor": 1, "product_url": 1}
+    for doc in products_col.find({}, projection).sort([("LastUpdate", ASCENDING), ("_id", ASCENDING)]):
+        key = (doc.get("competitor"), doc.get("product_url"))
+        if key in latest:
+            duplicates.append(latest[key])
+        latest[key] = doc["_id"]
+    for batch in batched(duplicates, batch_size):
+        products_col.delete_many({"_id": {"$in": batch}})
+    return len(backfill), len(duplicates)
+
+
+def ensure_indexes(products_col):
+    backfilled, removed = migrate_legacy_documents(products_col)
+    if backfilled or removed:
+        print(f"Legacy documents: {backfilled} given a product_url, {removed} duplicates removed")
+    try:
+        products_col.create_index(
+            [("competitor", ASCENDING), ("product_url", ASCENDING)],
+            unique=True,
+            name="competitor_product_url",
+        )
+    except OperationFailure as e:
+        # DuplicateKeyError included: documents written while migrating
+        raise SystemExit(f"Could not create the unique (competitor, product_url) index on products: {e}. "
+                         f"Run the loader again once no other writer is adding products.")
+    # Category pages filter on the canonical taxonomy IDs
+    products_col.create_index([("category_id", ASCENDING), ("sub_category_id", ASCENDING)])
+    products_col.create_index([("sub_category_id", ASCENDING)])
+
+
+# Yield UpdateOne operations for the new, changed and relisted products of a
+# snapshot; existing maps (competitor, product_url) to (content_hash, removed)
+def iter_upserts(records, existing, stats, now):
+    seen = set()
+    for record in records:
+        url = record.get("product_url")
+        if not url or url == "N/A":
+            stats["skipped"] += 1
+            continue
+        key = (record["competitor"], url)
+        # The same product can be listed in several subcategories: first wins
+        if key in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(key)
+
+        digest = content_hash(record)
+        previous_digest, removed = existing.get(key, (None, False))
+        if previous_digest == digest and not removed:
+            stats["unchanged"] += 1
+            continue
+        if removed:
+            stats["relisted"] += 1
+
+        yield UpdateOne(
+            {"competitor": key[0], "product_url": url},
+            {"$set": product_document(record, digest, now), "$unset": {"removed_at": ""}},
+            upsert=True,
+        )
+
+
+def product_document(record, digest, now):
+    document = {field: record.get(field) for field in PRODUCT_FIELDS}
+    # The backend Product model reads the product link from "url"
+    document["url"] = record.get("product_url")
+    document["content_hash"] = digest
+    document["LastUpdate"] = now
+    return document
+
+
+# UpdateOne operations applying the changes of a delta file
+def iter_delta_operations(changes, stats, now):
+    for change in changes:
+        if change["change"] == "removed":
+            stats["removed"] += 1
+            yield UpdateOne(
+                {"competitor": change["competitor"], "product_url": change["product_url"]},
+                {"$set": {"removed_at": now}},
+            )
+            continue
+        record = change["product"]
+        yield UpdateOne(
+            {"competitor": record["competitor"], "product_url": record["product_url"]},
+            {"$set": product_document(record, content_hash(record), now), "$unset": {"removed_at": ""}},
+            upsert=True,
+        )
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_operations(products_col, operations, batch_size, workers, stats):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(products_col.bulk_write, batch, ordered=False)
+            for batch in batched(operations, batch_size)
+        ]
+        for future in futures:
+            result = future.result()
+            stats["upserted"] += result.upserted_count
+            stats["modified"] += result.modified_count
+
+
+def load_snapshot(products_col, competitor, path, batch_size, workers):
+    stats = {"competitor": competitor, "file": str(path), "upserted": 0, "modified": 0,
+             "unchanged": 0, "relisted": 0, "duplicates": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    projection = {"_id": 0, "competitor": 1, "product_url": 1, "content_hash": 1, "removed_at": 1}
+    existing = {
+        (doc["competitor"], doc["product_url"]): (doc.get("content_hash"), "removed_at" in doc)
+        for doc in products_col.find({"competitor": competitor}, projection)
+        if doc.get("product_url")
+    }
+    operations = iter_upserts(read_products(path), existing, stats, datetime.now(timezone.utc))
+    write_operations(products_col, operations, batch_size, workers, stats)
+
+    stats["duration_seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def load_delta(products_col, competitor, path, batch_size, workers):
+    stats = {"competitor": competitor, "file": str(path), "upserted": 0, "modified": 0, "removed": 0}
+    started = time.perf_counter()
+    operations = iter_delta_operations(read_products(path), stats, datetime.now(timezone.utc))
+    write_operations(products_col, operations, batch_size, workers, stats)
+    stats["duration_seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upsert scraper output into the products collection")
+    parser.add_argument("competitors", nargs="*", help="Competitors to load (default: every snapshot in output/)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent bulk_write batches")
+    parser.add_argument("--delta", action="store_true", help="Apply the last run's change set instead of the full snapshot")
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI)
+    products_col = client[DB_NAME]["products"]
+    ensure_indexes(products_col)
+
+    for competitor in args.competitors or discover_competitors():
+        if args.delta:
+            path = find_delta(competitor)
+            if path is None:
+                print(f"No delta found for {competitor}")
+                continue
+            stats = load_delta(products_col, competitor, path, args.batch_size, args.workers)
+            print(f"{competitor}: {stats['upserted']} inserted, {stats['modified']} updated, "
+                  f"{stats['removed']} marked removed in {stats['duration_seconds']}s ({path.name})")
+            continue
+        path = find_snapshot(competitor)
+        if path is None:
+            print(f"No snapshot found for {competitor}")
+            continue
+        stats = load_snapshot(products_col, competitor, path, args.batch_size, args.workers)
+        print(f"{competitor}: {stats['upserted']} inserted, {stats['modified']} updated "
+              f"({stats['relisted']} relisted), {stats['unchanged']} unchanged, {stats['duplicates']} duplicates, "
+              f"{stats['skipped']} without URL in {stats['duration_seconds']}s ({path.name})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,159 +1,302 @@
+import asyncio
 import json
 import os
 import sys
-import re
+import time
 from pathlib import Path
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
-from bs4 import BeautifulSoup
+from urllib.parse import urlparse
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 
-# Add parent directory to path to import ProductShema
+# Add parent directory to path to import the shared scraper modules
 sys.path.append(str(Path(__file__).parent.parent))
-from ProductShema import Product
+from ApiCapture import USE_API_CAPTURE, ApiEndpointStore, learn_endpoint, product_signature
+from ExtractionSpec import BROWSER_EXTRACT_JS, load_spec
+from Checkpoint import CheckpointStore
+from CrawlScheduler import CrawlScheduler
+from FetchEngine import DEFAULT_HEADERS, FetchEngine, iter_link_units
+from HttpClient import replay_url
+from DeltaOutput import delta_tracker
+from OutputSink import NdjsonSink, output_path
+from Profiler import run_main
+from CrawlMetrics import METRICS, get_logger, write_run_summary
+
+# Selectors and field cleanup rules live in extractionSpecs/Megapc.json
+SPEC = load_spec("Megapc")
+
+logger = get_logger("Megapc")
+
+# Number of browser contexts crawling category URLs at the same time
+MEGAPC_WORKERS = int(os.environ.get("MEGAPC_WORKERS", "4"))
+
+# We only read the DOM, so assets and third-party scripts are never fetched
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+FIRST_PARTY_DOMAIN = "megapc.tn"
+
+def is_first_party(url):
+    host = urlparse(url).hostname or ""
+    return host == FIRST_PARTY_DOMAIN or host.endswith("." + FIRST_PARTY_DOMAIN)
+
+# Route handler aborting requests the scraper does not need
+async def block_resources(route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    elif request.resource_type == "script" and not is_first_party(request.url):
+        await route.abort()
+    else:
+        await route.continue_()
+
+# Selector of the enabled "next page" button (the svg is what gets clicked)
+NEXT_BUTTON_SELECTOR = 'button.md\\:px-4.px-2.py-2.mx-2.rounded-md.bg-gray-200:not([disabled]) svg[viewBox="0 0 448 512"]'
+
+# Resolves once the first product card no longer shows the previous page
+WAIT_FOR_NEW_PAGE_JS = """
+([card, signature]) => {
+  const first = document.querySelector(card);
+  return first !== null && first.textContent !== signature;
+}
+"""
+
+# The listing API is requested with JSON in mind
+API_HEADERS = {**DEFAULT_HEADERS, "Accept": "application/json"}
+
+# Signature of the product an API item describes, as the spec would
+# extract it, to compare with the rendered cards
+def item_product(item):
+    return product_signature(SPEC.product_from_raw(SPEC.item_raws(item), "", ""))
+
+# Count pages against the run's request budget; a unit the budget cannot
+# cover is reported as cut short. Returns how many pages may be fetched.
+def take_pages(engine, count, category_name, subcategory_name):
+    granted = engine.take_pages(count) if engine is not None else count
+    if granted < count:
+        logger.info(f"Request budget spent, stopping {category_name} - {subcategory_name}")
+        METRICS.observe_truncated("Megapc", category_name, subcategory_name)
+    return granted
+
+async def fetch_api_payload(engine, endpoint, page_num):
+    return json.loads(await engine.fetch(endpoint.page_url(page_num)))
+
+# An endpoint ignoring the page parameter returns the same items every time
+def pages_repeat(pages):
+    signatures = [json.dumps(items[0], sort_keys=True) for items in pages if items]
+    return len(signatures) != len(set(signatures))
+
+# Products of the listing pages from start_page onwards, fetched concurrently
+# from the learned JSON endpoint. previous_items are the items of the page
+# before start_page when it is already known, last_page the page count when
+# it is. Returns None when the endpoint does not answer as learned so the
+# caller can fall back to the browser.
+async def scrape_megapc_api(engine, endpoint, category_name, subcategory_name, start_page=1, previous_items=None, last_page=None):
+    pages = [previous_items] if previous_items is not None else []
+    try:
+        if last_page is None:
+            if not take_pages(engine, 1, category_name, subcategory_name):
+                return []
+            payload = await fetch_api_payload(engine, endpoint, start_page)
+            pages.append(endpoint.items(payload))
+            last_page = endpoint.last_page(payload)
+            start_page += 1
+        if last_page is not None:
+            last_page = start_page - 1 + take_pages(engine, last_page - start_page + 1, category_name, subcategory_name)
+            payloads = await asyncio.gather(*(
+                fetch_api_payload(engine, endpoint, page_num) for page_num in range(start_page, last_page + 1)
+            ))
+            pages.extend(endpoint.items(payload) for payload in payloads)
+        else:
+            # Page count unknown: fetch a window of pages at a time until one is empty
+            while pages[-1] and not pages_repeat(pages):
+                window = range(start_page, start_page + take_pages(engine, engine.per_host_limit, category_name, subcategory_name))
+                if not window:
+                    break
+                payloads = await asyncio.gather(*(fetch_api_payload(engine, endpoint, page_num) for page_num in window))
+                pages.extend(endpoint.items(payload) for payload in payloads)
+                start_page += len(window)
+    except Exception as e:
+        logger.warning(f"Error fetching {endpoint.url}: {str(e)}")
+        return None
+    if pages_repeat(pages):
+        logger.warning(f"{endpoint.url} ignores the '{endpoint.page_param}' parameter")
+        return None
+    if previous_items is not None:
+        pages = pages[1:]
+    items = [item for page_items in pages for item in page_items]
+    logger.debug(f"Fetched {len(pages)} pages ({len(items)} products) from {endpoint.url}")
+    started = time.perf_counter()
+    products = SPEC.products_from_items(items, category_name, subcategory_name)
+    METRICS.observe_parse("Megapc", category_name, time.perf_counter() - started)
+    for page_items in pages:
+        METRICS.observe_page("Megapc", category_name, len(page_items), subcategory_name)
+    return products
 
 # Function to scrape products from a single URL
-def scrape_megapc_url(url, category_name, subcategory_name, page):
+# Cards are read inside the page with one evaluate() call per page instead of
+# serializing the DOM with page.content() and parsing it again in Python.
+# With an endpoint store, the JSON responses loaded by the page are captured;
+# when one of them carries the products of page 1 with the same URLs, prices
+# and discounts as the cards, the remaining pages are fetched from it over
+# HTTP instead of clicking through them.
+async def scrape_megapc_url(url, category_name, subcategory_name, page, engine=None, endpoints=None):
     scraped_products = []
     page_count = 1
     product_count = 0
+    browser_args = SPEC.browser_args()
+    
+    captured = []
+    pending = []
+    
+    async def read_json(response):
+        try:
+            captured.append((response.url, await response.json()))
+        except Exception:
+            pass
+    
+    def on_response(response):
+        if (response.request.resource_type in ("xhr", "fetch") and is_first_party(response.url)
+                and "json" in response.headers.get("content-type", "")):
+            pending.append(asyncio.ensure_future(read_json(response)))
     
-    print(f"Scraping category: {category_name} - subcategory: {subcategory_name}")
-    print("-" * 50)
+    if endpoints is not None:
+        page.on("response", on_response)
+    
+    logger.info(f"Scraping category: {category_name} - subcategory: {subcategory_name}")
+    
+    if not take_pages(engine, 1, category_name, subcategory_name):
+        return scraped_products
     
     # Navigate to the initial URL
-    print(f"Navigating to initial URL: {url}")
+    logger.debug(f"Navigating to initial URL: {url}")
     try:
-        # Navigate to the URL
-        page.goto(url)
-        
-        # Wait for the page to load completely
-        page.wait_for_load_state("networkidle")
+        # The product grid is rendered client-side: wait for it rather than
+        # for the network to go idle
+        started = time.perf_counter()
+        response = await page.goto(replay_url(url), wait_until="domcontentloaded")
+        if response is not None:
+            METRICS.observe_fetch(url, time.perf_counter() - started, response.status, 0)
+        try:
+            await page.wait_for_selector(browser_args["card"])
+        except PlaywrightTimeoutError:
+            logger.debug(f"No products found on page {page_count} of {url}")
+            return scraped_products
         
         # Continue with the while loop to handle pagination
         while True:
-            print(f"Processing page {page_count}")
+            logger.debug(f"Processing page {page_count} of {url}")
             
-            # Get the fully rendered HTML
-            html = page.content()
+            # Raw field values of every card plus the next-button state
+            result = await page.evaluate(BROWSER_EXTRACT_JS, browser_args)
+            started = time.perf_counter()
+            products = SPEC.products_from_raw(result["rows"], category_name, subcategory_name)
+            METRICS.observe_parse("Megapc", category_name, time.perf_counter() - started)
             
-            # Use BeautifulSoup to parse the HTML
-            soup = BeautifulSoup(html, "html.parser")
+            if not products:
+                logger.debug(f"No products found on page {page_count} of {url}")
+                break
             
-            # Extract product blocks
-            products = soup.select("article.flex.flex-col.product-card")
+            scraped_products.extend(products)
+            product_count += len(products)
+            METRICS.observe_page("Megapc", category_name, len(products), subcategory_name)
             
-            if not products:
-                print(f"No products found on page {page_count}")
+            if not result["has_next"]:
+                logger.debug(f"No more pages after page {page_count} of {url}")
                 break
             
-            # Loop through each product and extract info
-            for product in products:
-                product_count += 1
-                
-                # Extract elements using the more reliable selectors
-                product_name_tag = product.select_one("p.text-skin-base.text-sm.leading-5.line-clamp-2.mb-2")
-                price_tag = product.select_one("span.inline-block.font-semibold.text-15px.lg\\:text-base.text-skin-primary")
-                previous_price_tag = product.select_one("del.text-sm.text-gray-400.text-opacity-70")
-                product_url_tag = product.select_one("a[href^='/shop/product']")
-                
-                # Extract and clean data
-                competitor = "Megapc"
-                product_name = product_name_tag.get_text(strip=True).replace("|", "") if product_name_tag else "N/A"
-                product_url = product_url_tag["href"] if product_url_tag else "N/A"
-                full_url = f"https://megapc.tn{product_url}" if product_url != "N/A" else "N/A"
-                
-                # Parse price
-                raw_price = price_tag.get_text(strip=True) if price_tag else "0"
-                try:
-                    product_price = float(re.sub(r"[^0-9.]", "", raw_price.replace(",", ".")))
-                except ValueError:
-                    product_price = 500.0  # fallback in case parsing fails
-                
-                # Calculate discount from previous and current prices
-                discount = 0.0
-                if previous_price_tag:
-                    raw_previous_price = previous_price_tag.get_text(strip=True)
-                    try:
-                        previous_price = float(re.sub(r"[^0-9.]", "", raw_previous_price.replace(",", ".")))
-                        discount = previous_price - product_price if previous_price > product_price else 0.0
-                    except ValueError:
-                        discount = 0.0
-                
-                # Use actual category and subcategory names
-                category = category_name
-                sub_category = subcategory_name
-                stock_status = "En Stock"  # products are always in stock
-                
-                # Create Product object and append to list
-                product_data = Product(
-                    competitor=competitor,
-                    product_name=product_name,
-                    product_url=full_url,
-                    product_price=product_price,
-                    discount=discount,
-                    category=category,
-                    sub_category=sub_category,
-                    stock_status=stock_status
-                )
-                scraped_products.append(product_data)
-                
-                # Print product details in a readable format
-                print(f"Product #{product_count}:")
-                print(f"Name: {product_name}")
-                print(f"Price: {product_price}")
-                print(f"Discount: {discount}")
-                print(f"Category: {category} - {sub_category}")
-                print(f"Stock Status: {stock_status}")
-                print(f"URL: {full_url}")
-                print("-" * 50)
+            if page_count == 1 and endpoints is not None:
+                await asyncio.gather(*pending)
+                learned = learn_endpoint(captured, [product_signature(product) for product in products], item_product)
+                if learned is not None:
+                    endpoint, payload = learned
+                    logger.info(f"Listing API found: {endpoint.url} (page parameter '{endpoint.page_param}')")
+                    rest = await scrape_megapc_api(
+                        engine, endpoint, category_name, subcategory_name, start_page=2,
+                        previous_items=endpoint.items(payload), last_page=endpoint.last_page(payload)
+                    )
+                    if rest is not None:
+                        endpoints.remember(url, endpoint)
+                        scraped_products.extend(rest)
+                        product_count += len(rest)
+                        break
             
-            # Now use Playwright to check for next page button
-            has_next_page = False
+            if not take_pages(engine, 1, category_name, subcategory_name):
+                break
+            
+            logger.debug(f"Next page button found and enabled - proceeding to page {page_count + 1}")
             try:
-                # Check if there is a next page button at all
-                next_button_exists = page.query_selector(
-                    'button.md\\:px-4.px-2.py-2.mx-2.rounded-md.bg-gray-200 svg[viewBox="0 0 448 512"] path[d^="M190.5 66.9"]'
+                await page.click(NEXT_BUTTON_SELECTOR)
+                await page.wait_for_function(
+                    WAIT_FOR_NEW_PAGE_JS, arg=[browser_args["card"], result["signature"]]
                 )
-                
-                if next_button_exists:
-                    # Check if the button is disabled
-                    disabled_next_button = page.query_selector(
-                        'button.md\\:px-4.px-2.py-2.mx-2.rounded-md.bg-gray-200[disabled] svg[viewBox="0 0 448 512"] path[d^="M190.5 66.9"]'
-                    )
-                    
-                    if not disabled_next_button:
-                        has_next_page = True
-                        print(f"Next page button found and enabled - proceeding to page {page_count + 1}")
-                    else:
-                        print("Next page button found but disabled - reached last page")
-                else:
-                    print("No next page button found - this is likely a single page of results")
-            except Exception as e:
-                print(f"Error checking for next page button: {str(e)}")
-                has_next_page = False
-            
-            if has_next_page:
-                # Try clicking the next page button directly with Playwright
-                try:
-                    # Find the non-disabled next button and click it
-                    print("Clicking the next page button...")
-                    page.click('button.md\\:px-4.px-2.py-2.mx-2.rounded-md.bg-gray-200:not([disabled]) svg[viewBox="0 0 448 512"]')
-                    page.wait_for_load_state("networkidle")
-                    page_count += 1
-                    print("Successfully navigated to next page by clicking button")
-                except Exception as click_err:
-                    print(f"Failed to click next page button: {click_err}")
-                    print("No more pages available or unable to click next button.")
-                    break
-            else:
-                print("No more pages available.")
+                page_count += 1
+            except Exception as click_err:
+                logger.warning(f"Failed to click next page button on page {page_count} of {url}: {click_err}")
                 break
                 
     except Exception as e:
-        print(f"Error scraping {url}: {str(e)}")
+        logger.error(f"Error scraping {url}: {str(e)}")
+        METRICS.observe_error("Megapc", category_name)
+    finally:
+        if endpoints is not None:
+            page.remove_listener("response", on_response)
     
-    print(f"Scraping completed for {subcategory_name}. Found {product_count} products across {page_count} pages.")
+    logger.info(f"Scraping completed for {subcategory_name}. Found {product_count} products across {page_count} pages.")
     return scraped_products
 
+# Worker: one browser context taking category URLs off the shared queue
+async def crawl_worker(browser, queue, sink, checkpoint, engine=None, endpoints=None):
+    context = await browser.new_context(viewport={"width": 1280, "height": 800})
+    await context.route("**/*", block_resources)
+    page = await context.new_page()
+    
+    # Set a reasonable timeout
+    page.set_default_timeout(30000)  # 30 seconds
+    
+    try:
+        while True:
+            try:
+                category_name, subcategory_name, url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            # Pages are reached by clicking, so a subcategory is checkpointed as a whole
+            if checkpoint.next_page(category_name, subcategory_name, url) is None:
+                logger.info(f"Skipping {category_name} - {subcategory_name} ({url}): already done in checkpoint")
+                continue
+            # A listing whose API was learned in an earlier run needs no browser
+            products = None
+            endpoint = endpoints.get(url) if endpoints is not None else None
+            if endpoint is not None:
+                logger.info(f"Scraping {category_name} - {subcategory_name} from the listing API")
+                products = await scrape_megapc_api(engine, endpoint, category_name, subcategory_name)
+                if products is None:
+                    endpoints.forget(url)
+            if products is None:
+                products = await scrape_megapc_url(url, category_name, subcategory_name, page, engine, endpoints)
+            sink.write_many(products)
+            checkpoint.record(category_name, subcategory_name, url, 1, False, len(products), sink)
+    finally:
+        await context.close()
+
+async def crawl_megapc(megapc_links, sink, checkpoint, workers=MEGAPC_WORKERS, page_budget=None):
+    queue = asyncio.Queue()
+    for unit in iter_link_units(megapc_links):
+        queue.put_nowait(unit)
+    
+    # The API path needs every field mapped to the JSON items in the spec
+    endpoints = ApiEndpointStore("Megapc", SPEC.fingerprint) if USE_API_CAPTURE and SPEC.has_json_fields else None
+    
+    # Use Playwright to handle browser automation
+    async with FetchEngine(API_HEADERS, page_budget=page_budget) as engine, async_playwright() as p:
+        # Launch the browser
+        browser = await p.chromium.launch(headless=True)  # Set headless=False to see the browser
+        try:
+            await asyncio.gather(*(
+                crawl_worker(browser, queue, sink, checkpoint, engine, endpoints) for _ in range(workers)
+            ))
+        finally:
+            # Close the browser
+            await browser.close()
+            if endpoints is not None:
+                endpoints.save()
+
 # Main execution
 def main():
     # Read the Megapc links JSON file
@@ -161,48 +304,19 @@ def main():
     with open(links_file_path, 'r', encoding='utf-8') as f:
         megapc_links = json.load(f)
     
-    all_products = []
-    
-    # Use Playwright to handle browser automation
-    with sync_playwright() as p:
-        # Launch the browser
-        browser = p.chromium.launch(headless=True)  # Set headless=False to see the browser
-        page = browser.new_page()
-        
-        # Set viewport size for better rendering
-        page.set_viewport_size({"width": 1280, "height": 800})
-        
-        # Set a reasonable timeout
-        page.set_default_timeout(30000)  # 30 seconds
-        
-        # Iterate through each category and subcategory
-        for category_name, subcategories in megapc_links.items():
-            for subcategory_name, url in subcategories.items():
-                # Handle cases where URL is a list (some subcategories have multiple URLs)
-                if isinstance(url, list):
-                    for single_url in url:
-                        products = scrape_megapc_url(single_url, category_name, subcategory_name, page)
-                        all_products.extend(products)
-                else:
-                    products = scrape_megapc_url(url, category_name, subcategory_name, page)
-                    all_products.extend(products)
-        
-        # Close the browser
-        browser.close()
-    
-    # Create output directory if it doesn't exist
-    output_dir = Path(__file__).parent.parent / "output"
-    output_dir.mkdir(exist_ok=True)
-    
-    # Save all products to JSON file
-    output_file = output_dir / "MegapcProducts.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        # Convert Product objects to dictionaries
-        product_dicts = [product.dict() for product in all_products]
-        json.dump(product_dicts, f, ensure_ascii=False, indent=2)
+    # Stream products of the subcategories due for a refresh to
+    # output/MegapcProducts.ndjson after each subcategory
+    checkpoint = CheckpointStore("Megapc")
+    scheduler = CrawlScheduler("Megapc")
+    with NdjsonSink(output_path("Megapc"), checkpoint=checkpoint, delta=delta_tracker("Megapc")) as sink:
+        links = scheduler.plan(megapc_links, checkpoint)
+        asyncio.run(crawl_megapc(links, sink, checkpoint, page_budget=scheduler.budget))
+        scheduler.finish(sink)
     
-    print(f"\nAll products saved to {output_file}")
-    print(f"Total products scraped: {len(all_products)}")
+    logger.info(f"All products saved to {sink.path}")
+    logger.info(f"Total products scraped: {sink.count}")
+    write_run_summary("Megapc")
+    return sink.count
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_main(main, "Megapc")
@@ -1,118 +1,40 @@
-import requests
-from bs4 import BeautifulSoup
 import json
 import os
 import sys
 from pathlib import Path
 
-# Add parent directory to path to import ProductShema
+# Add parent directory to path to import the shared scraper modules
 sys.path.append(str(Path(__file__).parent.parent))
-from ProductShema import Product
+from ExtractionSpec import load_spec
+from FetchEngine import run_crawl
+from Checkpoint import CheckpointStore
+from CrawlScheduler import CrawlScheduler
+from DeltaOutput import delta_tracker
+from OutputSink import NdjsonSink, output_path
+from Profiler import run_main
+from CrawlMetrics import get_logger, write_run_summary
 
-# Function to scrape products from a single URL
-def scrape_tunisianet_url(url, category_name, subcategory_name, headers):
-    scraped_products = []
-    page_num = 1
-    product_count = 0
-    
-    print(f"Scraping category: {category_name} - subcategory: {subcategory_name}")
-    print("-" * 50)
-    
-    while True:
-        # Send GET request
-        current_url = url
-        if "?page=" in url:
-            current_url = url.split("?page=")[0] + f"?page={page_num}"
-        elif page_num > 1:
-            current_url = url + f"?page={page_num}"
-            
-        print(f"Scraping page {page_num} - {current_url}...")
-        try:
-            response = requests.get(current_url, headers=headers)
-            soup = BeautifulSoup(response.text, "html.parser")
+# Selectors and field cleanup rules live in extractionSpecs/Tunisianet.json
+SPEC = load_spec("Tunisianet")
 
-            # Try to extract product blocks
-            products = soup.select("div.item-product")
-            
-            if not products:
-                print(f"No products found on page {page_num}")
-                break
+logger = get_logger("Tunisianet")
 
-            # Loop through each product and extract info
-            for product in products:
-                product_count += 1
-                # Extracting product Tags
-                product_name_tag = product.select_one("h2.product-title a")
-                product_url_tag = product.select_one("h2.product-title a")
-                price_tag = product.select_one("span.price")
-                discount_tag = product.select_one("span.discount-amount, li.product-flag.discount")
-                stock_status_tag = product.select_one("div#stock_availability span")
-                
-                # Extracting Product data
-                competitor = "Tunisianet"
-                product_name = product_name_tag.text.strip() if product_name_tag else "N/A"
-                product_url = product_url_tag["href"] if product_url_tag else "N/A"
-                raw_price = price_tag.text.strip() if price_tag else "500"
-                clean_price = (
-                    raw_price.replace('\u202f', '')  # narrow no-break space
-                    .replace('\xa0', '')             # regular no-break space
-                    .replace(' ', '')                # normal space
-                    .replace('DT', '')
-                    .replace(',', '.')
-                    .strip()
-                )
-                try:
-                    product_price = float(clean_price)
-                except ValueError:
-                    product_price = 500.0  # fallback in case parsing fails
-                raw_discount = discount_tag.text.strip() if discount_tag else "0"
-                clean_discount = raw_discount.replace('DT', '').replace('-', '').strip()
-                try:
-                    discount = float(clean_discount)
-                except ValueError:
-                    discount = 0.0  # fallback        
-                
-                # Use actual category and subcategory names
-                category = category_name  
-                sub_category = subcategory_name
-                stock_status = stock_status_tag.text.strip() if stock_status_tag else "N/A"
-                
-                # Create Product object and append to list
-                product_data = Product(
-                    competitor=competitor,
-                    product_name=product_name,
-                    product_url=product_url,
-                    product_price=product_price,
-                    discount=discount,
-                    category=category,
-                    sub_category=sub_category,
-                    stock_status=stock_status
-                )
-                scraped_products.append(product_data)
-                
-                # Print product details in a readable format
-                print(f"Product #{product_count}:")
-                print(f"Name: {product_name}")
-                print(f"Price: {product_price}")
-                print(f"Discount: {discount}")
-                print(f"Category: {category} - {sub_category}")
-                print(f"Stock Status: {stock_status}")
-                print(f"URL: {product_url}")
-                print("-" * 50)
-            
-            # Check for next page
-            if (next_page_tag := soup.select_one("a.next.js-search-link")):
-                page_num += 1
-            else:
-                print("No more pages available.")
-                break
-                
-        except Exception as e:
-            print(f"Error scraping {current_url}: {str(e)}")
-            break
-    
-    print(f"Scraping completed for {subcategory_name}. Found {product_count} products across {page_num} pages.")
-    return scraped_products
+# Build the URL of a given listing page
+def tunisianet_page_url(url, page_num):
+    if "?page=" in url:
+        return url.split("?page=")[0] + f"?page={page_num}"
+    if page_num > 1:
+        return url + f"?page={page_num}"
+    return url
+
+# Function to parse products from a single listing page
+def parse_tunisianet_page(html, category_name, subcategory_name):
+    return SPEC.parse_page(html, category_name, subcategory_name)
+
+# Function to scrape products from a single URL
+def scrape_tunisianet_url(url, category_name, subcategory_name, headers):
+    links = {category_name: {subcategory_name: url}}
+    return run_crawl(links, tunisianet_page_url, parse_tunisianet_page, headers)
 
 # Main execution
 def main():
@@ -127,35 +49,19 @@ def main():
     with open(links_file_path, 'r', encoding='utf-8') as f:
         tunisianet_links = json.load(f)
     
-    all_products = []
-    
-    # Iterate through each category and subcategory
-    for category_name, subcategories in tunisianet_links.items():
-        for subcategory_name, url in subcategories.items():
-            # Handle cases where URL is a list (some subcategories have multiple URLs)
-            if isinstance(url, list):
-                for single_url in url:
-                    if not single_url.startswith("http"):
-                        single_url = "https://" + single_url
-                    products = scrape_tunisianet_url(single_url, category_name, subcategory_name, headers)
-                    all_products.extend(products)
-            else:
-                products = scrape_tunisianet_url(url, category_name, subcategory_name, headers)
-                all_products.extend(products)
-    
-    # Create output directory if it doesn't exist
-    output_dir = Path(__file__).parent.parent / "output"
-    output_dir.mkdir(exist_ok=True)
-    
-    # Save all products to JSON file
-    output_file = output_dir / "TunisianetProducts.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        # Convert Product objects to dictionaries
-        product_dicts = [product.dict() for product in all_products]
-        json.dump(product_dicts, f, ensure_ascii=False, indent=2)
+    # Crawl the subcategories due for a refresh concurrently, streaming
+    # products to output/TunisianetProducts.ndjson as soon as each page is parsed
+    checkpoint = CheckpointStore("Tunisianet")
+    scheduler = CrawlScheduler("Tunisianet")
+    with NdjsonSink(output_path("Tunisianet"), checkpoint=checkpoint, delta=delta_tracker("Tunisianet")) as sink:
+        links = scheduler.plan(tunisianet_links, checkpoint)
+        run_crawl(links, tunisianet_page_url, parse_tunisianet_page, headers, sink=sink, page_budget=scheduler.budget)
+        scheduler.finish(sink)
     
-    print(f"\nAll products saved to {output_file}")
-    print(f"Total products scraped: {len(all_products)}")
+    logger.info(f"All products saved to {sink.path}")
+    logger.info(f"Total products scraped: {sink.count}")
+    write_run_summary("Tunisianet")
+    return sink.count
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_main(main, "Tunisianet")
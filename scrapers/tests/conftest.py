@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The scraper modules import each other as top-level modules, the way the
+# scrapers do through their sys.path.append
+sys.path.append(str(Path(__file__).parent.parent))
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+from ApiCapture import ApiEndpointStore, learn_endpoint, product_signature
+from ExtractionSpec import load_spec
+
+SPEC = load_spec("Megapc")
+LISTING_URL = "https://megapc.tn/shop/category/EVENTS/HELLO%20WINTER"
+API_URL = "https://api.megapc.tn/products?category=EVENTS&sub=HELLO%20WINTER"
+PRODUCT_URL = "https://megapc.tn/shop/product/EVENTS/HELLO%20WINTER/"
+
+
+# Same mapping as MegapcScraper.item_product, without importing playwright
+def item_product(item):
+    return product_signature(SPEC.product_from_raw(SPEC.item_raws(item), "", ""))
+
+
+def item(name, slug, **fields):
+    return {"name": name, "slug": slug, "price": 1299, "category": {"name": "EVENTS"},
+            "subcategory": {"name": "HELLO WINTER"}, **fields}
+
+
+# Signature of a product card as rendered on the listing page
+def card(name, path, price=1299.0, discount=0.0):
+    return product_signature(SimpleNamespace(product_name=name, product_url=PRODUCT_URL + path,
+                                             product_price=price, discount=discount))
+
+
+ITEMS = [item('PC Gamer 27" RTX', 'PC-Gamer-27"-|-RTX', old_price=1499), item("Souris (sans fil)", "Souris-(sans-fil)")]
+# Items with one key under another name
+def renamed(items, key, new_key):
+    return [{(new_key if name == key else name): value for name, value in entry.items()} for entry in items]
+
+
+RENDERED = [card('PC Gamer 27" RTX', "PC-Gamer-27%22-%7C-RTX", discount=200.0), card("Souris (sans fil)", "Souris-(sans-fil)")]
+
+
+def test_endpoint_learned_when_products_match():
+    learned = learn_endpoint([(API_URL + "&page=1", {"data": ITEMS, "last_page": 3})], RENDERED, item_product)
+    assert learned is not None
+    endpoint, payload = learned
+    assert endpoint.items_path == ["data"]
+    assert endpoint.page_param == "page"
+    assert endpoint.last_page(payload) == 3
+
+
+def test_endpoint_rejected_when_urls_differ():
+    # The same items, but the page links products under another path
+    rendered = [card('PC Gamer 27" RTX', "../PC-Gamer-27%22-%7C-RTX", discount=200.0), card("Souris (sans fil)", "../Souris-(sans-fil)")]
+    assert learn_endpoint([(API_URL, {"data": ITEMS})], rendered, item_product) is None
+
+
+def test_endpoint_rejected_without_category_path():
+    # Items lacking the category segments cannot be turned into product URLs
+    items = [{"name": name, "slug": slug, "price": 1299} for name, slug in (("a", "a"), ("b", "b"))]
+    assert learn_endpoint([(API_URL, {"data": items})], [card("a", "a"), card("b", "b")], item_product) is None
+
+
+def test_endpoint_rejected_when_price_key_is_wrong():
+    # URLs match, but the API names the price "prix_ttc": the spec would
+    # store the default price for every product
+    assert learn_endpoint([(API_URL, {"data": renamed(ITEMS, "price", "prix_ttc")})], RENDERED, item_product) is None
+
+
+def test_endpoint_rejected_when_discount_key_is_wrong():
+    # The discount of the first product would be lost
+    assert learn_endpoint([(API_URL, {"data": renamed(ITEMS, "old_price", "compare_at_price")})], RENDERED, item_product) is None
+
+
+def test_store_ignores_endpoints_of_another_spec(tmp_path):
+    endpoint, _ = learn_endpoint([(API_URL, {"data": ITEMS})], RENDERED, item_product)
+    store = ApiEndpointStore("Test", "spec-1", cache_dir=tmp_path)
+    store.remember(LISTING_URL, endpoint)
+    store.save()
+
+    assert ApiEndpointStore("Test", "spec-1", cache_dir=tmp_path).get(LISTING_URL).url == API_URL
+    assert ApiEndpointStore("Test", "spec-2", cache_dir=tmp_path).get(LISTING_URL) is None
@@ -0,0 +1,94 @@
+import pytest
+
+from Checkpoint import CheckpointStore
+from OutputSink import NdjsonSink, read_products
+
+
+def product(url, sub_category="PC Bureau"):
+    return {
+        "competitor": "Test", "product_name": f"PC {url}", "product_url": f"https://test.tn/{url}",
+        "product_price": 100.0, "discount": 0.0, "category": "Ordinateurs", "sub_category": sub_category,
+        "stock_status": "En stock",
+    }
+
+
+def write_page(sink, checkpoint, url, page, has_next, names):
+    sink.write_many([product(name) for name in names])
+    checkpoint.record("Ordinateurs", "PC Bureau", url, page, has_next, len(names), sink)
+
+
+class Crash(Exception):
+    pass
+
+
+# First run: two pages of unit a, one of unit b, then a page of b whose
+# products reach the output but not the checkpoint before the process dies
+def crashed_run(tmp_path, output, compress=False):
+    checkpoint = CheckpointStore("Test", tmp_path / "checkpoints", resume=True)
+    with pytest.raises(Crash):
+        with NdjsonSink(output, compress=compress, checkpoint=checkpoint) as sink:
+            write_page(sink, checkpoint, "a", 1, True, ["a1", "a2"])
+            write_page(sink, checkpoint, "a", 2, False, ["a3"])
+            write_page(sink, checkpoint, "b", 1, True, ["b1"])
+            sink.write_many([product("b2")])
+            raise Crash()
+
+
+def test_next_page_follows_recorded_pages(tmp_path):
+    checkpoint = CheckpointStore("Test", tmp_path, resume=True)
+    sink = NdjsonSink(tmp_path / "out.ndjson", checkpoint=checkpoint)
+    assert checkpoint.next_page("Ordinateurs", "PC Bureau", "a") == 1
+    write_page(sink, checkpoint, "a", 1, True, ["a1"])
+    assert checkpoint.next_page("Ordinateurs", "PC Bureau", "a") == 2
+    write_page(sink, checkpoint, "a", 2, False, ["a2"])
+    assert checkpoint.next_page("Ordinateurs", "PC Bureau", "a") is None
+    assert checkpoint.next_page("Ordinateurs", "PC Portable", "a") == 1
+    sink.close()
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_resume_drops_unrecorded_products_and_continues(tmp_path, compress):
+    output = tmp_path / ("out.ndjson.gz" if compress else "out.ndjson")
+    crashed_run(tmp_path, output, compress)
+    assert not output.exists()
+
+    checkpoint = CheckpointStore("Test", tmp_path / "checkpoints", resume=True)
+    assert checkpoint.next_page("Ordinateurs", "PC Bureau", "a") is None
+    assert checkpoint.next_page("Ordinateurs", "PC Bureau", "b") == 2
+    with NdjsonSink(output, compress=compress, checkpoint=checkpoint) as sink:
+        assert sink.count == 4
+        write_page(sink, checkpoint, "b", 2, False, ["b2", "b3"])
+
+    names = [record["product_name"] for record in read_products(output)]
+    assert names == ["PC a1", "PC a2", "PC a3", "PC b1", "PC b2", "PC b3"]
+    assert not checkpoint.path.exists()
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    output = tmp_path / "out.ndjson"
+    crashed_run(tmp_path, output)
+    path = tmp_path / "checkpoints" / "Test.jsonl"
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"category": "Ordinateurs", "subcat')
+
+    checkpoint = CheckpointStore("Test", tmp_path / "checkpoints", resume=True)
+    assert checkpoint.next_page("Ordinateurs", "PC Bureau", "b") == 2
+    assert checkpoint.resume_point(output.with_name(output.name + ".part"))[1] == 4
+
+
+def test_resume_disabled_starts_over(tmp_path):
+    output = tmp_path / "out.ndjson"
+    crashed_run(tmp_path, output)
+    checkpoint = CheckpointStore("Test", tmp_path / "checkpoints", resume=False)
+    assert not checkpoint.path.exists()
+    assert checkpoint.next_page("Ordinateurs", "PC Bureau", "a") == 1
+    with NdjsonSink(output, checkpoint=checkpoint) as sink:
+        assert sink.count == 0
+
+
+def test_checkpoint_of_another_output_is_discarded(tmp_path):
+    crashed_run(tmp_path, tmp_path / "out.ndjson")
+    checkpoint = CheckpointStore("Test", tmp_path / "checkpoints", resume=True)
+    assert checkpoint.resume_point(tmp_path / "other.ndjson.part") is None
+    assert not checkpoint.path.exists()
+    assert checkpoint.next_page("Ordinateurs", "PC Bureau", "a") == 1
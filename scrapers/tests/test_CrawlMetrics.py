@@ -0,0 +1,26 @@
+import io
+import time
+
+import CrawlMetrics
+
+
+# A console slow enough for records to pile up in the queue
+class SlowStream(io.StringIO):
+    def write(self, text):
+        time.sleep(0.001)
+        return super().write(text)
+
+
+def test_flush_logging_writes_out_queued_records(monkeypatch):
+    logger = CrawlMetrics.get_logger("test")
+    stream = SlowStream()
+    monkeypatch.setattr(CrawlMetrics._listener.handlers[0], "stream", stream)
+    for n in range(100):
+        logger.warning(f"record {n}")
+
+    CrawlMetrics.flush_logging()
+    assert stream.getvalue().count("record") == 100
+    # The listener runs again for the next scraper
+    logger.warning("after flush")
+    CrawlMetrics.flush_logging()
+    assert "after flush" in stream.getvalue()
@@ -0,0 +1,166 @@
+import json
+import math
+from types import SimpleNamespace
+
+import pytest
+
+import CrawlScheduler
+from CrawlScheduler import (
+    DAY, MAX_INTERVAL_HOURS, MIN_INTERVAL_HOURS, CrawlScheduler as Scheduler, fill_budget, interval_hours,
+    poisson_rate, rate_for_interval,
+)
+from Taxonomy import TAXONOMY
+
+NOW = 1_700_000_000.0
+LINKS = {
+    "Ordinateurs": {"PC Bureau": "https://spacenet.tn/pc-bureau", "PC Portable": "https://spacenet.tn/pc-portable"},
+    "Gaming": {"Consoles": "https://spacenet.tn/consoles"},
+}
+
+
+def row(name, priority, requests, due=True):
+    return {"competitor": "Test", "category": "C", "subcategory": name, "priority": priority, "requests": requests, "due": due}
+
+
+def test_poisson_rate_recovers_the_change_rate():
+    assert poisson_rate(100, 0, 1.0) == 0
+    assert poisson_rate(100, 10, 1.0) == pytest.approx(math.log(100.5 / 90.5))
+    # 1000 products changing at 0.2 per day, observed after 3 days
+    products, rate, days = 1000, 0.2, 3.0
+    changed = round(products * (1 - math.exp(-rate * days)))
+    assert poisson_rate(products, changed, days) == pytest.approx(rate, rel=0.01)
+    # Every product changed: the estimate stays finite
+    assert math.isfinite(poisson_rate(50, 50, 1.0))
+
+
+def test_interval_follows_the_rate_within_bounds():
+    assert interval_hours(None) == MIN_INTERVAL_HOURS
+    assert interval_hours(100.0) == MIN_INTERVAL_HOURS
+    assert interval_hours(0.0) == MAX_INTERVAL_HOURS
+    assert interval_hours(rate_for_interval(24)) == pytest.approx(24)
+    assert interval_hours(rate_for_interval(48)) > interval_hours(rate_for_interval(24))
+
+
+def test_fill_budget_takes_due_units_by_priority():
+    rows = [row("low", 1.0, 2), row("high", 5.0, 3), row("mid", 3.0, 4), row("fresh", 9.0, 1, due=False)]
+    selected, spent = fill_budget(rows, 7)
+    assert [r["subcategory"] for r in selected] == ["high", "mid"]
+    assert spent == 7
+
+
+def test_fill_budget_skips_units_that_do_not_fit_and_keeps_filling():
+    rows = [row("big", 5.0, 10), row("first", 6.0, 3), row("small", 1.0, 2)]
+    selected, spent = fill_budget(rows, 6)
+    assert [r["subcategory"] for r in selected] == ["first", "small"]
+    assert spent == 5
+
+
+def test_fill_budget_always_takes_the_first_unit():
+    selected, spent = fill_budget([row("huge", 1.0, 50), row("other", 0.5, 60)], 10)
+    assert [r["subcategory"] for r in selected] == ["huge"]
+    assert spent == 50
+    assert fill_budget([row("a", 1.0, 5)], 0) == ([], 0)
+
+
+def test_fill_budget_without_budget_takes_every_due_unit():
+    rows = [row("a", 1.0, 50), row("b", math.inf, 1), row("c", 2.0, 5, due=False)]
+    selected, spent = fill_budget(rows, None)
+    assert [r["subcategory"] for r in selected] == ["b", "a"]
+    assert spent == 51
+
+
+def scheduler(tmp_path, budget=None):
+    return Scheduler("Spacenet", budget=budget, schedule_dir=tmp_path, enabled=True)
+
+
+def crawled(scheduler, category, subcategory, rate, hours_ago, products=100, pages=2):
+    scheduler.state(category, subcategory).update(
+        last_crawled=NOW - hours_ago * 3600, rate=rate, products=products, pages=pages, runs=1,
+    )
+
+
+def test_due_units_are_ranked_by_expected_changes_per_request(tmp_path):
+    planner = scheduler(tmp_path)
+    fast, slow = rate_for_interval(12), rate_for_interval(96)
+    crawled(planner, "Ordinateurs", "PC Bureau", fast, hours_ago=24)
+    crawled(planner, "Ordinateurs", "PC Portable", slow, hours_ago=24)
+    rows = {r["subcategory"]: r for r in planner.candidates(LINKS, NOW)}
+
+    assert rows["PC Bureau"]["due"] and not rows["PC Portable"]["due"]
+    assert rows["PC Bureau"]["priority"] == pytest.approx(100 * (1 - math.exp(-fast)) / 2)
+    # Never crawled: due first
+    assert rows["Consoles"]["due"] and math.isinf(rows["Consoles"]["priority"])
+    assert rows["Consoles"]["requests"] == 2
+
+
+def test_plan_keeps_resumed_units_and_spends_the_budget(tmp_path):
+    planner = scheduler(tmp_path, budget=3)
+    crawled(planner, "Ordinateurs", "PC Bureau", rate_for_interval(12), hours_ago=24, pages=3)
+    crawled(planner, "Ordinateurs", "PC Portable", rate_for_interval(12), hours_ago=48, pages=2)
+    checkpoint = SimpleNamespace(next_page=lambda category, subcategory, url: 2 if subcategory == "PC Bureau" else 1)
+
+    links = planner.plan(LINKS, checkpoint, NOW)
+    # Consoles was never crawled and comes first, PC Portable no longer
+    # fits; PC Bureau was started by the interrupted run
+    assert links == {
+        "Ordinateurs": {"PC Bureau": LINKS["Ordinateurs"]["PC Bureau"]},
+        "Gaming": {"Consoles": LINKS["Gaming"]["Consoles"]},
+    }
+    assert planner.known - planner.planned == {("Ordinateurs", "PC Portable")}
+
+
+def test_plan_crawls_everything_when_disabled(tmp_path):
+    planner = Scheduler("Spacenet", budget=1, schedule_dir=tmp_path, enabled=False)
+    crawled(planner, "Ordinateurs", "PC Bureau", 0.0, hours_ago=1)
+    assert planner.plan(LINKS, now=NOW) == LINKS
+
+
+def test_learn_smooths_the_measured_rate(tmp_path):
+    planner = scheduler(tmp_path)
+    crawled(planner, "Ordinateurs", "PC Bureau", None, hours_ago=48)
+    planner.planned = {("Ordinateurs", "PC Bureau"), ("Ordinateurs", "PC Portable")}
+    delta = SimpleNamespace(previous_path=None, unit_changes={("Ordinateurs", "PC Bureau"): [100, 20]})
+    unit_stats = {("Ordinateurs", "PC Bureau"): {"pages": 3, "products": 110}, ("Ordinateurs", "PC Portable"): {"pages": 0, "products": 0}}
+
+    planner.learn(delta, unit_stats, NOW)
+    state = planner.state("Ordinateurs", "PC Bureau")
+    first = poisson_rate(100, 20, 2.0)
+    assert state["rate"] == pytest.approx(first)
+    assert (state["last_crawled"], state["products"], state["pages"], state["runs"]) == (NOW, 110, 3, 2)
+    # A unit that produced no page stays due
+    assert planner._state_or_none("Ordinateurs", "PC Portable") is None
+
+    later = NOW + DAY
+    planner.learn(SimpleNamespace(previous_path=None, unit_changes={("Ordinateurs", "PC Bureau"): [100, 0]}), unit_stats, later)
+    smoothing = CrawlScheduler.RATE_SMOOTHING
+    assert state["rate"] == pytest.approx((1 - smoothing) * first)
+
+
+def test_seed_and_save_round_trip(tmp_path):
+    scheduler(tmp_path).seed({("Ordinateurs", "PC Bureau"): 0.25})
+    with open(tmp_path / "Spacenet.json", 'r', encoding='utf-8') as f:
+        assert json.load(f)["units"]["Ordinateurs"]["PC Bureau"]["rate"] == 0.25
+    assert scheduler(tmp_path).state("Ordinateurs", "PC Bureau")["rate"] == 0.25
+
+
+def test_carry_over_copies_skipped_units_with_current_taxonomy_ids(tmp_path, monkeypatch):
+    snapshot = tmp_path / "SpacenetProducts.json"
+    records = [
+        {"competitor": "Spacenet", "product_name": name, "product_url": f"https://spacenet.tn/{name}",
+         "product_price": 10.0, "discount": 0.0, "category": "Ordinateurs", "sub_category": subcategory,
+         "stock_status": "En stock"}
+        for name, subcategory in [("a", "PC Bureau"), ("b", "PC Portable"), ("c", "PC Portable")]
+    ]
+    records[2]["sub_category_id"] = "stale-id"
+    snapshot.write_text(json.dumps(records), encoding="utf-8")
+    monkeypatch.setattr(CrawlScheduler, "find_snapshot", lambda competitor: snapshot)
+
+    planner = scheduler(tmp_path)
+    planner.known = {("Ordinateurs", "PC Bureau"), ("Ordinateurs", "PC Portable")}
+    planner.planned = {("Ordinateurs", "PC Bureau")}
+    written = []
+    assert planner.carry_over(SimpleNamespace(write_many=written.extend)) == 2
+
+    ids = TAXONOMY.resolve("Spacenet", "Ordinateurs", "PC Portable")
+    assert [record["product_name"] for record in written] == ["b", "c"]
+    assert all((record["category_id"], record["sub_category_id"]) == ids for record in written)
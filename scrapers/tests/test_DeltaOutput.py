@@ -0,0 +1,221 @@
+import importlib.util
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from DeltaOutput import DeltaTracker
+from OutputSink import read_products
+
+LOADER_PATH = Path(__file__).parent.parent / "migration" / "loadProducts.py"
+_spec = importlib.util.spec_from_file_location("loadProducts", LOADER_PATH)
+loadProducts = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(loadProducts)
+
+
+def product(url, price, category="Ordinateurs", sub_category="PC Bureau", stock="En stock"):
+    return {
+        "competitor": "Test", "product_name": f"PC {url}", "product_url": f"https://test.tn/{url}",
+        "product_price": price, "discount": 0.0, "category": category, "sub_category": sub_category,
+        "stock_status": stock, "category_id": None, "sub_category_id": None,
+    }
+
+
+def write_snapshot(path, records):
+    path.write_text(json.dumps(records), encoding="utf-8")
+    return path
+
+
+# In-memory stand-in for the products collection, applying the operations
+# the loader sends
+class FakeCursor(list):
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            super().sort(key=lambda doc: (doc.get(field) is not None, doc.get(field)), reverse=direction < 0)
+        return self
+
+
+class FakeProducts:
+    def __init__(self, docs=()):
+        self.docs = []
+        self.indexes = {}
+        for doc in docs:
+            self._insert(doc)
+
+    def _insert(self, doc):
+        doc = {"_id": len(self.docs) + 1, **doc}
+        self.docs.append(doc)
+        return doc
+
+    @staticmethod
+    def _matches(doc, query):
+        for field, condition in query.items():
+            if isinstance(condition, dict):
+                if "$exists" in condition and (field in doc) != condition["$exists"]:
+                    return False
+                if "$in" in condition and doc.get(field) not in condition["$in"]:
+                    return False
+            elif doc.get(field) != condition:
+                return False
+        return True
+
+    def find(self, query, projection):
+        fields = [field for field, shown in projection.items() if shown]
+        if projection.get("_id", 1):
+            fields.append("_id")
+        return FakeCursor(
+            {field: doc[field] for field in fields if field in doc}
+            for doc in self.docs if self._matches(doc, query)
+        )
+
+    def bulk_write(self, operations, ordered=False):
+        upserted = modified = 0
+        for operation in operations:
+            doc = next((doc for doc in self.docs if self._matches(doc, operation._filter)), None)
+            if doc is None:
+                if not operation._upsert:
+                    continue
+                doc = self._insert(dict(operation._filter))
+                upserted += 1
+            else:
+                modified += 1
+            doc.update(operation._doc.get("$set", {}))
+            for field in operation._doc.get("$unset", {}):
+                doc.pop(field, None)
+        return SimpleNamespace(upserted_count=upserted, modified_count=modified)
+
+    def delete_many(self, query):
+        self.docs = [doc for doc in self.docs if not self._matches(doc, query)]
+
+    def create_index(self, keys, unique=False, name=None):
+        fields = [field for field, _ in keys]
+        keys_seen = [tuple(doc.get(field) for field in fields) for doc in self.docs]
+        if unique and len(keys_seen) != len(set(keys_seen)):
+            raise DuplicateKeyError(f"E11000 duplicate key error index: {name}")
+        self.indexes[name or "_".join(fields)] = unique
+
+    def doc(self, url):
+        return next(doc for doc in self.docs if doc["product_url"] == f"https://test.tn/{url}")
+
+
+def run_tracker(tmp_path, previous, current):
+    tracker = DeltaTracker("Test", path=tmp_path / "TestDelta.ndjson",
+                           previous_path=write_snapshot(tmp_path / "TestProducts.json", previous))
+    tracker.observe_many(current)
+    tracker.finish()
+    return tracker, list(read_products(tracker.path))
+
+
+def test_delta_lists_added_updated_and_removed(tmp_path):
+    previous = [product("a", 100.0), product("b", 200.0), product("c", 300.0)]
+    current = [product("a", 90.0), product("b", 200.0), product("d", 400.0)]
+    tracker, changes = run_tracker(tmp_path, previous, current)
+
+    by_url = {change.get("product_url") or change["product"]["product_url"]: change for change in changes}
+    assert by_url["https://test.tn/a"]["change"] == "updated"
+    assert by_url["https://test.tn/a"]["fields"] == ["product_price"]
+    assert by_url["https://test.tn/a"]["previous"] == {"product_price": 100.0}
+    assert by_url["https://test.tn/c"]["change"] == "removed"
+    assert by_url["https://test.tn/d"]["change"] == "added"
+    assert "https://test.tn/b" not in by_url
+    assert tracker.stats["unchanged"] == 1
+    assert not tracker.part_path.exists()
+
+
+def test_delta_only_removes_from_crawled_subcategories(tmp_path):
+    previous = [product("a", 100.0), product("b", 200.0, sub_category="PC Portable")]
+    _, changes = run_tracker(tmp_path, previous, [product("a", 100.0)])
+    assert changes == []
+
+
+def test_delta_counts_price_changes_per_subcategory(tmp_path):
+    previous = [product("a", 100.0), product("b", 200.0), product("c", 300.0, stock="En arrivage")]
+    current = [product("a", 90.0), product("b", 200.0), product("c", 300.0), product("d", 10.0)]
+    tracker, _ = run_tracker(tmp_path, previous, current)
+    # d is new: only products present in both snapshots are compared
+    assert tracker.unit_changes == {("Ordinateurs", "PC Bureau"): [3, 1]}
+    assert tracker.stats["price"] == 1
+    assert tracker.stats["stock"] == 1
+
+
+def load_snapshot(collection, tmp_path, records):
+    path = write_snapshot(tmp_path / "TestProducts.json", records)
+    return loadProducts.load_snapshot(collection, "Test", path, batch_size=2, workers=1)
+
+
+def load_delta(collection, tmp_path, previous, current):
+    run_tracker(tmp_path, previous, current)
+    return loadProducts.load_delta(collection, "Test", tmp_path / "TestDelta.ndjson", batch_size=2, workers=1)
+
+
+def test_snapshot_load_skips_unchanged_products(tmp_path):
+    collection = FakeProducts()
+    records = [product("a", 100.0), product("b", 200.0)]
+    stats = load_snapshot(collection, tmp_path, records)
+    assert (stats["upserted"], stats["unchanged"]) == (2, 0)
+
+    stats = load_snapshot(collection, tmp_path, [product("a", 100.0), product("b", 150.0)])
+    assert (stats["upserted"], stats["modified"], stats["unchanged"]) == (0, 1, 1)
+    assert collection.doc("b")["product_price"] == 150.0
+
+
+def test_delta_marks_removed_and_snapshot_relists(tmp_path):
+    collection = FakeProducts()
+    records = [product("a", 100.0), product("b", 200.0)]
+    load_snapshot(collection, tmp_path, records)
+
+    stats = load_delta(collection, tmp_path, records, [product("a", 100.0)])
+    assert stats["removed"] == 1
+    assert "removed_at" in collection.doc("b")
+    assert "removed_at" not in collection.doc("a")
+
+    # b is listed again with the same fields: its hash did not change, but
+    # the snapshot load must still clear removed_at
+    stats = load_snapshot(collection, tmp_path, records)
+    assert (stats["relisted"], stats["modified"], stats["unchanged"]) == (1, 1, 1)
+    assert "removed_at" not in collection.doc("b")
+
+
+def test_delta_relists_removed_product(tmp_path):
+    collection = FakeProducts()
+    records = [product("a", 100.0), product("b", 200.0)]
+    load_snapshot(collection, tmp_path, records)
+    load_delta(collection, tmp_path, records, [product("a", 100.0)])
+    assert "removed_at" in collection.doc("b")
+
+    load_delta(collection, tmp_path, [product("a", 100.0)], records)
+    assert "removed_at" not in collection.doc("b")
+
+
+def legacy(url, price, updated):
+    record = product(url, price)
+    record["url"] = record.pop("product_url")
+    record["LastUpdate"] = updated
+    return record
+
+
+def test_indexes_migrate_legacy_documents(tmp_path):
+    collection = FakeProducts([legacy("a", 100.0, 1), legacy("a", 90.0, 2), legacy("b", 200.0, 1), legacy("b", 210.0, 3)])
+    loadProducts.ensure_indexes(collection)
+
+    assert collection.indexes["competitor_product_url"] is True
+    assert [(doc["product_url"], doc["product_price"]) for doc in collection.docs] == [
+        ("https://test.tn/a", 90.0), ("https://test.tn/b", 210.0),
+    ]
+    # The kept documents are updated in place by the next load
+    stats = load_snapshot(collection, tmp_path, [product("a", 90.0), product("b", 210.0)])
+    assert (stats["upserted"], stats["modified"]) == (0, 2)
+    assert len(collection.docs) == 2
+
+
+def test_index_failure_is_reported(monkeypatch):
+    collection = FakeProducts([product("a", 100.0)])
+
+    def create_index(keys, unique=False, name=None):
+        raise DuplicateKeyError("E11000 duplicate key error")
+
+    monkeypatch.setattr(collection, "create_index", create_index)
+    with pytest.raises(SystemExit, match="unique"):
+        loadProducts.ensure_indexes(collection)
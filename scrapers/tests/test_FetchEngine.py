@@ -0,0 +1,188 @@
+import asyncio
+import json
+import re
+from collections import Counter
+from types import SimpleNamespace
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import BrowserPool
+import CrawlScheduler as CrawlSchedulerModule
+import FetchEngine as FetchEngineModule
+from CrawlMetrics import CrawlMetrics
+from BrowserPool import EMPTY, FetchModeStore
+from CrawlScheduler import CrawlScheduler, allocate_budget
+from FetchEngine import FetchEngine
+from OutputSink import NdjsonSink, read_products
+from ProductShema import ProductRecord
+
+PAGES = 8
+PER_PAGE = 3
+
+
+# The fetch engine finds the spec of a parser in its module: this one
+# announces the page count, so listings are fanned out
+class AnnouncingSpec:
+    competitor = "BudgetTest"
+    card_selector = SimpleNamespace(selector="li")
+
+    def last_page(self, html, per_page):
+        return PAGES
+
+
+SPEC = AnnouncingSpec()
+
+
+def page_url(url, page_num):
+    return f"{url}?page={page_num}"
+
+
+def parse_page(html, category_name, subcategory_name):
+    products = [
+        ProductRecord(SPEC.competitor, name, f"https://budget.test/{name}", 10.0, 0.0, category_name, subcategory_name, "En stock")
+        for name in re.findall(r"<li>([^<]+)</li>", html)
+    ]
+    return products, "next" in html
+
+
+# Listing server counting the requests it answers, per competitor
+def listing_server(requests):
+    async def handler(request):
+        competitor, unit = request.path.strip("/").split("/")
+        page_num = int(request.query.get("page", "1"))
+        requests[competitor] += 1
+        cards = "".join(f"<li>{competitor}-{unit}-{page_num}-{n}</li>" for n in range(PER_PAGE))
+        next_link = "<a>next</a>" if page_num < PAGES else ""
+        return web.Response(text=f"<ul>{cards}</ul>{next_link}", content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handler)
+    return TestServer(app)
+
+
+def links_of(server, competitor, units=3):
+    return {"C": {f"s{n}": str(server.make_url(f"/{competitor}/s{n}")) for n in range(units)}}
+
+
+def crawl(links_by_competitor, budgets, sinks=None, requests=None):
+    async def run():
+        server = listing_server(requests)
+        await server.start_server()
+        try:
+            for competitor, build_links in links_by_competitor.items():
+                sink = sinks.get(competitor) if sinks else None
+                async with FetchEngine(page_budget=budgets.get(competitor), sink=sink) as engine:
+                    await engine.crawl_links(build_links(server), page_url, parse_page)
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_page_budget_caps_fan_out_and_pagination(monkeypatch):
+    metrics = CrawlMetrics()
+    monkeypatch.setattr(FetchEngineModule, "METRICS", metrics)
+    requests = Counter()
+    crawl({"A": lambda server: links_of(server, "A")}, {"A": 10}, requests=requests)
+
+    assert requests["A"] == 10
+    stats = metrics.unit_stats(SPEC.competitor)
+    assert sum(unit["pages"] for unit in stats.values()) == 10
+    # Three listings of eight pages cannot fit: some of them were cut short
+    assert any(unit.get("truncated") for unit in stats.values())
+
+
+def test_run_budget_holds_across_competitors(monkeypatch):
+    monkeypatch.setattr(FetchEngineModule, "METRICS", CrawlMetrics())
+    budget = 25
+    monkeypatch.setattr(CrawlSchedulerModule, "load_links", lambda competitor: {
+        "C": {f"s{n}": f"https://{competitor}.test/s{n}" for n in range(3)}
+    })
+    budgets = allocate_budget(["A", "B"], budget)
+    assert sum(budgets.values()) <= budget
+
+    requests = Counter()
+    crawl({name: (lambda server, name=name: links_of(server, name)) for name in budgets}, budgets, requests=requests)
+    assert sum(requests.values()) <= budget
+    assert all(requests[name] <= budgets[name] for name in budgets)
+
+
+def test_unit_cut_short_stays_due_and_keeps_its_products(tmp_path, monkeypatch):
+    metrics = CrawlMetrics()
+    monkeypatch.setattr(FetchEngineModule, "METRICS", metrics)
+    monkeypatch.setattr(CrawlSchedulerModule, "METRICS", metrics)
+    previous = [
+        {"competitor": SPEC.competitor, "product_name": name, "product_url": f"https://budget.test/{name}",
+         "product_price": 10.0, "discount": 0.0, "category": "C", "sub_category": "s0", "stock_status": "En stock"}
+        for name in (f"A-s0-{page_num}-{n}" for page_num in range(1, PAGES + 1) for n in range(PER_PAGE))
+    ]
+    snapshot = tmp_path / "BudgetTestProducts.json"
+    snapshot.write_text(json.dumps(previous), encoding="utf-8")
+    monkeypatch.setattr(CrawlSchedulerModule, "find_snapshot", lambda competitor: snapshot)
+
+    planner = CrawlScheduler(SPEC.competitor, budget=5, schedule_dir=tmp_path, enabled=True)
+    requests = Counter()
+    with NdjsonSink(tmp_path / "BudgetTestProducts.ndjson") as sink:
+        crawl({"A": lambda server: planner.plan(links_of(server, "A", units=1))}, {"A": planner.budget}, {"A": sink}, requests)
+        planner.finish(sink)
+
+    assert requests["A"] == 5
+    records = list(read_products(tmp_path / "BudgetTestProducts.ndjson"))
+    assert sorted(record["product_url"] for record in records) == sorted(record["product_url"] for record in previous)
+    # The cost of the unit is still unknown: it is due again next run
+    assert planner._state_or_none("C", "s0") is None
+
+
+# Browser whose pages have no product card either
+class EmptyBrowser:
+    def __init__(self):
+        self.renders = 0
+
+    async def render(self, url, wait_selector=None):
+        self.renders += 1
+        return "<ul></ul>"
+
+    async def close(self):
+        pass
+
+
+# Crawl an empty listing once per run, all against the same server; the
+# renders done after each run
+def crawl_empty_listing(path, runs):
+    browser = EmptyBrowser()
+    renders = []
+
+    async def handler(request):
+        return web.Response(text="<ul></ul>", content_type="text/html")
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", handler)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            for before_run in runs:
+                before_run()
+                async with FetchEngine(browser=browser, fetch_modes=FetchModeStore(path)) as engine:
+                    await engine.crawl_links({"C": {"empty": str(server.make_url("/empty"))}}, page_url, parse_page)
+                renders.append(browser.renders)
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+    return renders
+
+
+def test_listing_empty_in_the_browser_is_not_rendered_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(FetchEngineModule, "METRICS", CrawlMetrics())
+    path = tmp_path / "fetch_modes.json"
+    now = BrowserPool.time.time()
+
+    # Once the entry expires the listing is rendered again
+    def expire():
+        monkeypatch.setattr(BrowserPool.time, "time", lambda: now + BrowserPool.EMPTY_LISTING_SECONDS + 1)
+
+    assert crawl_empty_listing(path, [lambda: None, lambda: None, expire]) == [1, 1, 2]
+    (entry,) = json.loads(path.read_text(encoding="utf-8")).values()
+    assert entry["mode"] == EMPTY
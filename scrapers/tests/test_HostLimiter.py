@@ -0,0 +1,206 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import HostLimiter
+from HostLimiter import CLOSED, HALF_OPEN, OPEN, AdaptiveLimiter, Attempt
+from HttpClient import HttpStatusError, RetryPolicy, get_text
+
+
+def ok(seconds=0.1):
+    attempt = Attempt()
+    attempt.succeeded(seconds)
+    return attempt
+
+
+def throttled(retry_after=None):
+    attempt = Attempt()
+    attempt.throttled(retry_after)
+    return attempt
+
+
+def report(limiter, attempt, seconds=0.1):
+    async def run():
+        await limiter.acquire()
+        await limiter.release(attempt, seconds)
+    asyncio.run(run())
+
+
+def test_limit_grows_after_a_window_of_successes():
+    limiter = AdaptiveLimiter("host", 2, max_limit=4)
+    report(limiter, ok())
+    assert limiter.limit == 2
+    report(limiter, ok())
+    assert limiter.limit == 3
+    for _ in range(3):
+        report(limiter, ok())
+    assert limiter.limit == 4
+    for _ in range(10):
+        report(limiter, ok())
+    assert limiter.limit == 4
+
+
+def test_limit_holds_while_latency_degrades():
+    limiter = AdaptiveLimiter("host", 2, max_limit=8)
+    report(limiter, ok(0.1))
+    for _ in range(5):
+        report(limiter, ok(1.0))
+    assert limiter.limit == 2
+
+
+def test_request_latency_is_used_instead_of_slot_time():
+    limiter = AdaptiveLimiter("host", 2)
+    report(limiter, ok(0.2), seconds=5.0)
+    assert limiter.latency == 0.2
+
+
+def test_throttle_halves_limit_once_per_round_trip():
+    limiter = AdaptiveLimiter("host", 8, max_limit=8)
+    report(limiter, ok(10.0))
+    report(limiter, throttled())
+    assert limiter.limit == 4
+    # Sent at the old limit, within the same round trip: no second decrease
+    report(limiter, throttled())
+    assert limiter.limit == 4
+
+
+def test_retry_after_pauses_the_host():
+    limiter = AdaptiveLimiter("host", 4)
+    report(limiter, throttled(retry_after=60))
+    assert not limiter._can_start(HostLimiter.time.monotonic())
+
+
+def test_breaker_opens_at_minimum_limit_and_closes_after_probe():
+    limiter = AdaptiveLimiter("host", 1)
+    for _ in range(HostLimiter.BREAKER_FAILURES):
+        report(limiter, throttled())
+    assert limiter.state == OPEN
+    now = HostLimiter.time.monotonic()
+    assert limiter.blocked_until >= now + HostLimiter.BREAKER_COOLDOWN - 1
+    assert not limiter._can_start(now)
+
+    # Cooldown over: a single probe goes through
+    limiter.blocked_until = 0.0
+    assert limiter._can_start(now)
+    assert limiter.state == HALF_OPEN
+    limiter.in_flight = 1
+    assert not limiter._can_start(now)
+    limiter.in_flight = 0
+
+    report(limiter, ok())
+    assert limiter.state == CLOSED
+    assert limiter.limit == limiter.min_limit
+    assert limiter.failures == 0
+
+
+def test_failed_probe_doubles_the_cooldown():
+    limiter = AdaptiveLimiter("host", 1)
+    for _ in range(HostLimiter.BREAKER_FAILURES):
+        report(limiter, throttled())
+    limiter.blocked_until = 0.0
+    report(limiter, throttled())
+    assert limiter.state == OPEN
+    assert limiter.cooldown == 2 * HostLimiter.BREAKER_COOLDOWN
+
+
+def test_breaker_waits_instead_of_failing():
+    async def run():
+        limiter = AdaptiveLimiter("host", 1)
+        for _ in range(HostLimiter.BREAKER_FAILURES):
+            await limiter.acquire()
+            await limiter.release(throttled(), 0.1)
+        limiter.blocked_until = HostLimiter.time.monotonic() + 0.05
+        started = HostLimiter.time.monotonic()
+        await limiter.acquire()
+        return HostLimiter.time.monotonic() - started
+    assert asyncio.run(run()) >= 0.04
+
+
+# A local server answering with the statuses of a script, one per request
+async def serve(statuses):
+    requests = []
+
+    async def handler(request):
+        requests.append(request.path)
+        status = statuses[min(len(requests), len(statuses)) - 1]
+        return web.Response(status=status, text=f"status {status}")
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handler)
+    server = TestServer(app)
+    await server.start_server()
+    return server, requests
+
+
+def fetch(statuses, max_retries=2):
+    async def run():
+        server, requests = await serve(statuses)
+        try:
+            async with aiohttp.ClientSession() as session:
+                limiter = AdaptiveLimiter("host", 2)
+                result = await get_text(session, str(server.make_url("/page")), RetryPolicy(max_retries, backoff_base=0),
+                                        limiter=limiter, gate=asyncio.Semaphore(1))
+                return result[0], len(requests)
+        finally:
+            await server.close()
+    return asyncio.run(run())
+
+
+def test_retryable_status_is_retried():
+    assert fetch([503, 502, 200]) == (200, 3)
+
+
+@pytest.mark.parametrize("status", [501, 520])
+def test_other_server_errors_raise_without_retry(status):
+    with pytest.raises(HttpStatusError) as error:
+        fetch([status, 200])
+    assert error.value.status == status
+
+
+def test_client_errors_are_returned():
+    assert fetch([404]) == (404, 1)
+
+
+def test_gate_is_free_while_the_host_is_paused():
+    async def run():
+        server, requests = await serve([200])
+        try:
+            async with aiohttp.ClientSession() as session:
+                gate = asyncio.Semaphore(1)
+                limiter = AdaptiveLimiter("host", 1)
+                limiter.blocked_until = HostLimiter.time.monotonic() + 0.2
+                task = asyncio.create_task(get_text(session, str(server.make_url("/page")), RetryPolicy(0),
+                                                    limiter=limiter, gate=gate))
+                await asyncio.sleep(0.05)
+                held = gate.locked()
+                await task
+                return held, len(requests)
+        finally:
+            await server.close()
+    assert asyncio.run(run()) == (False, 1)
+
+
+def test_gate_is_free_during_backoff(monkeypatch):
+    async def run():
+        server, _ = await serve([503, 200])
+        gate = asyncio.Semaphore(1)
+        held = []
+        sleep = asyncio.sleep
+
+        async def recording_sleep(delay):
+            held.append(gate.locked())
+            await sleep(0)
+
+        monkeypatch.setattr(asyncio, "sleep", recording_sleep)
+        try:
+            async with aiohttp.ClientSession() as session:
+                status, _, _ = await get_text(session, str(server.make_url("/page")), RetryPolicy(1),
+                                              limiter=AdaptiveLimiter("host", 2), gate=gate)
+        finally:
+            monkeypatch.setattr(asyncio, "sleep", sleep)
+            await server.close()
+        return status, held
+    assert asyncio.run(run()) == (200, [False])
@@ -0,0 +1,54 @@
+import pytest
+
+import HtmlParser
+from ExtractionSpec import load_spec
+from HtmlParser import HAS_LXML, LexborHTMLParser, parse_html
+from ParserBenchmark import benchmarked_competitors, golden_data, load_fixtures
+
+# Every backend must read a page exactly like the html.parser path the
+# scrapers were written against
+BACKENDS = [
+    "html.parser",
+    pytest.param("lxml", marks=pytest.mark.skipif(not HAS_LXML, reason="lxml is not installed")),
+    pytest.param("selectolax", marks=pytest.mark.skipif(LexborHTMLParser is None, reason="selectolax is not installed")),
+]
+
+FIXTURES = [
+    pytest.param(competitor, fixture, id=f"{competitor}/{fixture['name']}")
+    for competitor in benchmarked_competitors()
+    for fixture in load_fixtures(competitor)
+]
+
+PAGE = """<html><head><title>Listing</title><style>.price { color: red }</style>
+<script>var prestashop = {"currency": "TND"};</script></head>
+<body><div class="card">
+  <h2 class="name"><a href="/p/1"> PC <b>Gamer</b> </a><script>track("name")</script></h2>
+  <span class="price">1 299,000 DT<style>.x{}</style></span>
+  <noscript>Activez JavaScript</noscript><!-- comment -->
+  <p class="stock">  En stock <script type="application/ld+json">{"a": 1}</script> </p>
+  <div class="specs">
+    <span>Ryzen 5</span>
+    <span>16 Go</span>\t<span>512 Go</span>
+  </div>
+  <pre class="ref"> <b>SKU</b>\n  <i>42</i> </pre>
+</div></body></html>"""
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("selector", ["div.card", "h2.name", "span.price", "p.stock", "h2.name script", "div.specs", "pre.ref", "pre.ref b"])
+def test_text_matches_beautifulsoup(backend, selector):
+    expected = parse_html(PAGE, "html.parser").select_one(selector)
+    node = parse_html(PAGE, backend).select_one(selector)
+    assert node.text == expected.text
+    assert node.get_text(strip=True) == expected.get_text(strip=True)
+    assert node.get_text(" ", strip=True) == expected.get_text(" ", strip=True)
+    assert node.get_text("|") == expected.get_text("|")
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("competitor, fixture", FIXTURES)
+def test_fixture_parses_to_golden(monkeypatch, backend, competitor, fixture):
+    monkeypatch.setattr(HtmlParser, "PARSER_BACKEND", backend)
+    golden = golden_data(load_spec(competitor), fixture)
+    assert golden["has_next"] == fixture["golden"]["has_next"]
+    assert golden["products"] == fixture["golden"]["products"]
@@ -0,0 +1,49 @@
+import json
+import os
+
+import ProductMatcher
+from ProductMatcher import MatchIndex, apply_deltas, mark_deltas_applied
+
+
+def product(competitor, url, name):
+    return {"competitor": competitor, "product_url": f"https://{competitor.lower()}.tn/{url}", "product_name": name,
+            "category": "Ordinateurs", "category_id": "ordinateurs"}
+
+
+def write_delta(path, changes):
+    path.write_text("".join(json.dumps(change) + "\n" for change in changes), encoding="utf-8")
+    return path
+
+
+def test_same_delta_is_applied_once(tmp_path, monkeypatch):
+    index = MatchIndex()
+    index.add(product("Mytek", "a", "PC Portable Lenovo IdeaPad 3 i5-1235U 8Go 512Go"))
+    index.match_all()
+    delta = write_delta(tmp_path / "SpacenetDelta.ndjson", [
+        {"change": "added", "product": product("Spacenet", "b", "Lenovo IdeaPad 3 i5-1235U 8 Go 512 Go SSD")},
+    ])
+    monkeypatch.setattr(ProductMatcher, "find_delta", lambda competitor: delta if competitor == "Spacenet" else None)
+
+    apply_deltas(index, ["Mytek", "Spacenet"])
+    assert len(index.groups) == 1
+    # The saved index remembers the delta: running again changes nothing
+    index.save(tmp_path / "ProductMatches.json")
+    index = MatchIndex.load(tmp_path / "ProductMatches.json")
+    index.remove("Spacenet|https://spacenet.tn/b")
+    apply_deltas(index, ["Spacenet"])
+    assert "Spacenet|https://spacenet.tn/b" not in index.products
+
+    # A later run's delta is applied
+    stamp = os.stat(delta).st_mtime_ns + 1_000_000_000
+    os.utime(delta, ns=(stamp, stamp))
+    apply_deltas(index, ["Spacenet"])
+    assert "Spacenet|https://spacenet.tn/b" in index.products
+
+
+def test_rebuilt_groups_include_the_last_delta(tmp_path, monkeypatch):
+    delta = write_delta(tmp_path / "SpacenetDelta.ndjson", [{"change": "added", "product": product("Spacenet", "b", "PC")}])
+    monkeypatch.setattr(ProductMatcher, "find_delta", lambda competitor: delta)
+    index = MatchIndex()
+    mark_deltas_applied(index, ["Spacenet"])
+    apply_deltas(index, ["Spacenet"])
+    assert index.products == {}